@@ -1,6 +1,6 @@
 from flask import Flask, request, jsonify
 from flask_cors import CORS
-import google.generativeai as genai
+import llm_gateway
 import os
 from pathlib import Path
 import traceback
@@ -8,19 +8,11 @@ import traceback
 app = Flask(__name__)
 CORS(app)
 
-GEMINI_API_KEY = os.getenv('GEMINI_API_KEY')
-
 # Supported video formats
 SUPPORTED_FORMATS = {'video/mp4', 'video/mpeg', 'video/webm', 'video/x-msvideo', 'video/quicktime'}
 MAX_FILE_SIZE = 20 * 1024 * 1024  # 20MB limit for direct upload
 
-if GEMINI_API_KEY:
-    genai.configure(api_key=GEMINI_API_KEY)
-    model = genai.GenerativeModel('gemini-2.5-flash')
-    print("✓ Gemini API configured")
-else:
-    model = None
-    print("✗ GEMINI_API_KEY not found")
+print(f"✓ LLM backend: {llm_gateway.backend_name()}")
 
 @app.route('/api/analyze-video', methods=['POST'])
 def analyze_video():
@@ -47,15 +39,12 @@ def analyze_video():
         
         print(f"✓ File received: {file.filename} ({file_size / 1024 / 1024:.2f}MB)")
         
-        if not model:
-            return jsonify({'error': 'Gemini API not configured'}), 500
-        
         # Read video bytes
         video_bytes = file.read()
         print("  → Sending to Gemini API...")
         
         # Use the correct MIME type
-        response = model.generate_content([
+        analysis = llm_gateway.generate([
             "Analyze this video and determine if it's AI-generated or real. Respond with:\n1. A clear verdict (is it AI-generated or real?)\n2. Confidence score as a percentage\n3. Key indicators you observed\n\nUse plain text only, no markdown formatting.",
             {
                 'mime_type': file.content_type,
@@ -63,7 +52,6 @@ def analyze_video():
             }
         ])
         
-        analysis = response.text
         print(f"  ✓ Gemini response received ({len(analysis)} chars)\n")
         
         return jsonify({
@@ -3,24 +3,35 @@ Flask JWT Authentication Backend with MongoDB
 File: app.py
 """
 
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, send_file, stream_with_context
 from flask_cors import CORS
-from flask_jwt_extended import JWTManager, create_access_token, jwt_required, get_jwt_identity
+from flask_jwt_extended import JWTManager, create_access_token, jwt_required, get_jwt_identity, verify_jwt_in_request
 from pymongo import MongoClient
 from werkzeug.security import generate_password_hash, check_password_hash
 from bson import ObjectId
 from datetime import timedelta
 import os
-from time import time
+import threading
+from time import time, perf_counter, monotonic
 from dotenv import load_dotenv
-from deep_translator import GoogleTranslator
-import google.generativeai as genai
 import requests
-from bs4 import BeautifulSoup
 import re
 from urllib.parse import urlparse
-from duckduckgo_search import DDGS
-
+import scrape_scheduler
+import conversation_sessions
+import stage_graph
+import llm_gateway
+import nli_cascade
+import model_serving
+import micro_batcher
+import ai_text_detector
+import uploads
+import renditions
+
+import translation
+import language_id
+import fact_engine
+from fact_engine import detect_urls, scrape_url_content, search_duckduckgo
 load_dotenv()
 
 # Initialize Flask App
@@ -45,141 +56,74 @@ db = client['social_media_db']
 users_collection = db['users']
 post_collection = db['posts']
 
-# Configure Gemini API
-genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+# Load the NLI pre-screening model in the background when NLI_CASCADE_ENABLED=1; fact-checks skip that tier until it is ready
+nli_cascade.preload()
 
-# Helper function to scrape URL content
-def scrape_url_content(url):
-    """Extract text content from a URL"""
-    try:
-        # Check if it's an X/Twitter URL
-        if 'twitter.com' in url or 'x.com' in url:
-            return scrape_twitter_content(url)
-        
-        # Regular HTTP scraping for other sites
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-        }
-        response = requests.get(url, headers=headers, timeout=10)
-        response.raise_for_status()
-        
-        soup = BeautifulSoup(response.content, 'html.parser')
-        
-        # Remove script and style elements
-        for script in soup(['script', 'style', 'nav', 'footer', 'header']):
-            script.decompose()
-        
-        # Get text
-        text = soup.get_text()
-        
-        # Clean up text
-        lines = (line.strip() for line in text.splitlines())
-        chunks = (phrase.strip() for line in lines for phrase in line.split("  "))
-        text = ' '.join(chunk for chunk in chunks if chunk)
-        
-        # Limit text length to avoid token limits
-        max_chars = 8000
-        if len(text) > max_chars:
-            text = text[:max_chars] + "... [content truncated]"
-        
-        return text
-    except Exception as e:
-        return f"Error scraping URL: {str(e)}"
-
-def scrape_twitter_content(url):
-    """Scrape X/Twitter content using Selenium"""
-    from selenium import webdriver
-    from selenium.webdriver.chrome.options import Options
-    from selenium.webdriver.chrome.service import Service
-    from selenium.webdriver.common.by import By
-    from selenium.webdriver.support.ui import WebDriverWait
-    from selenium.webdriver.support import expected_conditions as EC
-    from selenium.common.exceptions import TimeoutException, WebDriverException
-    from webdriver_manager.chrome import ChromeDriverManager
-    
-    try:
-        # Setup Chrome options with additional stability flags
-        chrome_options = Options()
-        chrome_options.add_argument('--headless=new')  # Updated headless mode
-        chrome_options.add_argument('--no-sandbox')
-        chrome_options.add_argument('--disable-dev-shm-usage')
-        chrome_options.add_argument('--disable-gpu')
-        chrome_options.add_argument('--disable-software-rasterizer')
-        chrome_options.add_argument('--disable-extensions')
-        chrome_options.add_argument('--disable-logging')
-        chrome_options.add_argument('--log-level=3')
-        chrome_options.add_argument('--window-size=1920,1080')
-        chrome_options.add_argument('--remote-debugging-port=9222')
-        chrome_options.add_argument('user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/142.0.0.0 Safari/537.36')
-        chrome_options.add_experimental_option('excludeSwitches', ['enable-logging'])
-        
-        # Initialize driver with webdriver-manager (auto-detects correct version)
-        service = Service(ChromeDriverManager().install())
-        driver = webdriver.Chrome(service=service, options=chrome_options)
-        driver.get(url)
-        
-        # Wait for tweet content to load
-        wait = WebDriverWait(driver, 10)
-        
-        try:
-            # Try to find tweet text (multiple selectors as X changes them frequently)
-            tweet_selectors = [
-                "article[data-testid='tweet']",
-                "div[data-testid='tweetText']",
-                "div[lang]",
-                "article div[lang]"
-            ]
-            
-            content = ""
-            for selector in tweet_selectors:
-                try:
-                    elements = driver.find_elements(By.CSS_SELECTOR, selector)
-                    if elements:
-                        for elem in elements[:3]:  # Get first 3 matching elements
-                            text = elem.text.strip()
-                            if text and len(text) > 10:  # Ignore very short matches
-                                content += text + "\n\n"
-                        if content:
-                            break
-                except:
-                    continue
-            
-            driver.quit()
-            
-            if content:
-                return content.strip()
-            else:
-                return "Could not extract tweet content. The page structure may have changed or the tweet may be protected."
-                
-        except TimeoutException:
-            driver.quit()
-            return "Timeout while loading tweet. The tweet may be protected or deleted."
-            
-    except WebDriverException as e:
-        return f"Chrome WebDriver error: Please restart the backend server. Error: {str(e)}"
-    except Exception as e:
-        return f"Error scraping Twitter/X: {str(e)}"
+# Overall deadline (seconds) for the scrape/search stages of a fact-check
+FACT_CHECK_DEADLINE = float(os.getenv('FACT_CHECK_DEADLINE', '20'))
+
+# How long clients may reuse a stored verdict without asking again (seconds)
+VERDICT_MAX_AGE = int(os.getenv('VERDICT_MAX_AGE', '300'))
+
+def clean_history_content(role, content):
+    """Strip display-only decorations (verdict emoji, confidence lines) from assistant turns"""
+    if role.upper() == 'ASSISTANT':
+        content = content.replace('✅ ', '').replace('❌ ', '').replace('⚠ ', '').replace('❓ ', '')
+        lines = content.split('\n')
+        content = '\n'.join([line for line in lines if not line.startswith('Confidence:') and not line.startswith('📋')])
+    return content
+
+def get_conversation_session(data):
+    """Resume the caller's own server-side session, seeding it from legacy client history if new"""
+    seed_history = [
+        {'role': msg.get('role', ''), 'content': clean_history_content(msg.get('role', ''), msg.get('content', ''))}
+        for msg in data.get('conversation_history', [])
+    ]
+    return conversation_sessions.store.get_or_create(fact_check_client(), data.get('conversation_id'), seed_history=seed_history)
+
+def summarize_history(summary, turns):
+    """Fold older conversation turns into the rolling summary"""
+    transcript = "\n".join(f"{turn['role'].upper()}: {turn['content']}" for turn in turns)
+    prompt = f"""Update the running summary of a fact-checking conversation.
+Keep the claims discussed, the verdicts given and any sources mentioned.
+Use plain text, at most 120 words.
 
-def detect_urls(text):
-    """Detect URLs in text"""
-    url_pattern = re.compile(r'http[s]?://(?:[a-zA-Z]|[0-9]|[$-_@.&+]|[!*\\(\\),]|(?:%[0-9a-fA-F][0-9a-fA-F]))+')
-    return url_pattern.findall(text)
+CURRENT SUMMARY:
+{summary or "None yet."}
 
-def search_duckduckgo(query, max_results=5):
-    """Search DuckDuckGo for real-time information"""
+NEW TURNS:
+{transcript}"""
+    return llm_gateway.generate(prompt).strip()
+
+def request_identity():
+    """JWT identity of the signed-in caller on routes that also serve anonymous requests, else None"""
     try:
-        with DDGS() as ddgs:
-            results = []
-            for r in ddgs.text(query, max_results=max_results):
-                results.append({
-                    'title': r.get('title', ''),
-                    'body': r.get('body', ''),
-                    'url': r.get('href', '')
-                })
-            return results
-    except Exception as e:
-        print(f"DuckDuckGo search error: {str(e)}")
-        return []
+        verify_jwt_in_request(optional=True)
+        return get_jwt_identity()
+    except Exception:
+        return None
+
+def open_own_upload(upload_id):
+    """(path, meta) of a finalized upload started by the signed-in caller; raises uploads.UploadError otherwise"""
+    uploads.check_owner(upload_id, request_identity())
+    return uploads.open_finalized(upload_id)
+
+def fact_check_client():
+    """Who a check is charged to in fact_engine.budget: the signed-in user, else the caller's address"""
+    identity = request_identity()
+    return f'user:{identity}' if identity else f'addr:{request.remote_addr}'
+
+def over_budget_response(body):
+    response = jsonify(body)
+    response.status_code = 429
+    response.headers['Retry-After'] = str(fact_engine.budget.retry_after())
+    return response
+
+def record_conversation_turn(session, user_message, assistant_message):
+    """Append the turn and compact older history in the background"""
+    session.add_turn('user', user_message)
+    session.add_turn('assistant', clean_history_content('assistant', assistant_message))
+    threading.Thread(target=session.compact, args=(summarize_history,), daemon=True).start()
 
 # Routes
 
@@ -308,6 +252,50 @@ def get_current_user():
         return jsonify({'message': str(e)}), 500
 
 
+def save_renditions(post_id, media_type, post_renditions):
+    """Worker callback: attach finished image or video renditions to the post"""
+    field = 'video_renditions' if media_type == 'video' else 'renditions'
+    post_collection.update_one({'post_id': post_id}, {'$set': {field: post_renditions}})
+
+
+def post_media(doc, size):
+    """
+    (media fields, served_bytes, original_bytes) for a post. The fields are
+    media, mediaFull and poster: rendition URLs once they exist, otherwise the
+    stored media as-is. Images get JPEG URLs in media/mediaFull plus WebP ones
+    in mediaWebp/mediaFullWebp, so the browser picks the format in <picture>
+    when it fetches the image. For videos media is the preview clip and
+    mediaFull the range-served original.
+    """
+    media = doc.get("media")
+    media_type = doc.get("mediaType")
+    image_renditions = doc.get("renditions")
+    video_renditions = doc.get("video_renditions")
+    if media and media_type == 'image' and image_renditions:
+        media_url, jpg_bytes = renditions.url_for(request.host_url, image_renditions, size, 'jpg')
+        full_url, _ = renditions.url_for(request.host_url, image_renditions, 'full', 'jpg')
+        webp_url, webp_bytes = renditions.url_for(request.host_url, image_renditions, size, 'webp')
+        full_webp_url, _ = renditions.url_for(request.host_url, image_renditions, 'full', 'webp')
+        fields = {'media': media_url or media, 'mediaFull': full_url or media, 'mediaWebp': webp_url,
+                  'mediaFullWebp': full_webp_url, 'poster': None}
+        return fields, webp_bytes or jpg_bytes, image_renditions['original_bytes']
+    if media and media_type == 'video' and video_renditions:
+        preview_url, poster_url, full_url, served = renditions.video_urls(request.host_url, video_renditions)
+        if doc.get('media_upload_id'):
+            # Upload-backed originals are served (with range requests) from the upload itself
+            full_url = media
+            preview_url = preview_url or media
+        return {'media': preview_url, 'mediaFull': full_url, 'poster': poster_url}, served, video_renditions['original_bytes']
+    original = len(media) if media and media.startswith('data:') else 0
+    return {'media': media, 'mediaFull': media, 'poster': None}, 0, original
+
+
+def get_media_index():
+    """The process-wide media index, loaded from past analyses and hashed post media on first use"""
+    media_index.index.load(post_collection)
+    return media_index.index
+
+
 @app.route('/api/auth/savePost', methods=['POST'])
 def postsave():
     """User Post Save Route"""
@@ -318,6 +306,22 @@ def postsave():
         if not data.get('email') or not data.get('name')  or not data.get('title') or not data.get('content'):
             return jsonify({'message': 'name,email, title, and content are required'}), 400
         
+        # Media can arrive inline (base64) or as a finalized resumable upload
+        media = data.get('media')
+        media_type = data.get('mediaType')
+        upload_path = None
+        if data.get('media_upload_id'):
+            try:
+                upload_path, upload_meta = open_own_upload(data['media_upload_id'])
+            except uploads.UploadError as e:
+                return jsonify({'message': str(e)}), e.status
+            if upload_meta.get('detected_type') not in uploads.ALLOWED_TYPES:
+                return jsonify({'message': 'Uploaded file is not a supported image or video'}), 415
+            uploads.pin(data['media_upload_id'])
+            media = f"{request.host_url}api/uploads/{data['media_upload_id']}/content"
+            # The sniffed type decides, whatever the client declared
+            media_type = upload_meta['detected_type'].split('/')[0]
+        
         # # Check if user already exists
         # if users_collection.find_one({'email': data['email']}):
         #     return jsonify({'message': 'Email already registered'}), 409
@@ -334,15 +338,40 @@ def postsave():
             'likes': [],       # new
             'dislikes': [],    # new
             'comments': [],    # new
-            'media': data.get('media'),  # base64 encoded media
-            'mediaType': data.get('mediaType')  # 'image' or 'video'
+            'media': media,  # base64 encoded media, or the URL of an upload
+            'mediaType': media_type  # 'image' or 'video'
         }
+        post['language'], post['language_confidence'] = language_id.tag(f"{data['title']}\n{data['content']}")
+        if data.get('media_upload_id'):
+            post['media_upload_id'] = data['media_upload_id']
         
         # Debug log
         print(f"Saving post with media: {bool(post['media'])}, type: {post['mediaType']}")
         
+        # Cross-reference the image with flagged analyses and earlier posts
+        media_hash = None
+        if post['mediaType'] == 'image' and post['media']:
+            media_hash = media_index.hash_image_file(upload_path) if upload_path else media_index.hash_data_url(post['media'])
+            if media_hash is not None:
+                index = get_media_index()
+                post['media_hash'] = f'{media_hash:016x}'
+                post['media_matches'] = index.matches(media_hash, exclude_post_id=post['post_id'])
+        
         result = post_collection.insert_one(post)
         user_id = str(result.inserted_id)
+        if media_hash is not None:
+            get_media_index().add_post(media_hash, post['post_id'], post['timestamp'])
+        if post['mediaType'] in ('image', 'video') and post['media']:
+            # Image sizes, video poster and preview clip are rendered off the request path
+            renditions.submit(
+                post['post_id'],
+                save_renditions,
+                media=None if upload_path else post['media'],
+                path=upload_path,
+                media_type=post['mediaType'],
+                content_type=upload_meta['detected_type'] if upload_path else None,
+                sha256=upload_meta['sha256'] if upload_path else None
+            )
         
         return jsonify({
             'message': 'Post added successfully',
@@ -352,7 +381,8 @@ def postsave():
                 'email': data['email'],
                 'title': data['title'],
                 'content': data['content']
-            }
+            },
+            'media_matches': post.get('media_matches')
         }), 201
         
     except Exception as e:
@@ -366,13 +396,19 @@ def get_posts():
     try:
         data = request.get_json() or {}
         user_email = data.get('userEmail')  # Optional: for following status
+        image_size = data.get('imageSize', 'feed') if data.get('imageSize') in renditions.SIZES else 'feed'
         
-        # Get ALL posts from MongoDB
-        cursor = post_collection.find({}, {'_id': 0})
+        # Get ALL posts from MongoDB, optionally only those in one language
+        query = {'language': data['language']} if data.get('language') else {}
+        cursor = post_collection.find(query, {'_id': 0})
 
         posts = []
+        media_bytes = original_bytes = 0
         for doc in cursor:
             has_media = bool(doc.get("media"))
+            media_fields, served, original = post_media(doc, image_size)
+            media_bytes += served
+            original_bytes += original
             # ensure only needed fields are passed
             posts.append({
                 "post_id": doc.get("post_id"),
@@ -384,8 +420,9 @@ def get_posts():
                 "likes": doc.get("likes", []),
                 "dislikes": doc.get("dislikes", []),
                 "comments": doc.get("comments", []),
-                "media": doc.get("media"),
-                "mediaType": doc.get("mediaType")
+                **media_fields,
+                "mediaType": doc.get("mediaType"),
+                "language": doc.get("language")
             })
             if has_media:
                 print(f"Post {doc.get('post_id')} has media type: {doc.get('mediaType')}")
@@ -398,10 +435,12 @@ def get_posts():
                 following_list = user.get("following", [])
 
         print(f"Returning {len(posts)} posts, {sum(1 for p in posts if p['media'])} with media")
-        return jsonify({
+        response = jsonify({
             "posts": posts,
             "following": following_list
-        }), 200
+        })
+        renditions.record_feed_page(response.content_length or 0, media_bytes, original_bytes)
+        return response, 200
 
     except Exception as e:
         return jsonify({"message": str(e)}), 500
@@ -492,6 +531,7 @@ def get_user_posts():
         
         posts = []
         for doc in cursor:
+            media_fields, _, _ = post_media(doc, 'feed')
             posts.append({
                 "post_id": doc.get("post_id"),
                 "username": doc.get("username"),
@@ -502,8 +542,9 @@ def get_user_posts():
                 "likes": doc.get("likes", []),
                 "dislikes": doc.get("dislikes", []),
                 "comments": doc.get("comments", []),
-                "media": doc.get("media"),
-                "mediaType": doc.get("mediaType")
+                **media_fields,
+                "mediaType": doc.get("mediaType"),
+                "language": doc.get("language")
             })
         
         return jsonify({"posts": posts}), 200
@@ -683,6 +724,168 @@ def logout():
     return jsonify({'message': 'Logout successful'}), 200
 
 
+@app.route('/api/metrics', methods=['GET'])
+def metrics():
+    """Runtime counters for the shared fact-checking components"""
+    return jsonify({
+        'llm': llm_gateway.stats(),
+        'nli_cascade': nli_cascade.stats(),
+        'models': model_serving.stats(),
+        'batching': micro_batcher.stats(),
+        'images': image_pipeline.stats(),
+        'media_index': media_index.index.snapshot(),
+        'videos': video_pipeline.stats(),
+        'renditions': renditions.stats(),
+        'translation': translation.stats(),
+        'language_id': language_id.stats(),
+        'scraper': scrape_scheduler.scheduler.stats(),
+        'stages': stage_graph.stats(),
+        'conversations': conversation_sessions.store.stats(),
+        'fact_engine': fact_engine.stats()
+    }), 200
+
+
+@app.route('/api/media/<key>/<filename>', methods=['GET'])
+def rendition_content(key, filename):
+    """
+    Serve a rendition (image size, video poster/preview, or the original video).
+    Content-addressed, so it can be cached for a long time; range requests are supported.
+    """
+    name, _, ext = filename.partition('.')
+    path = renditions.file_path(key, name, ext)
+    if not path or not os.path.exists(path):
+        return jsonify({'error': 'Not found'}), 404
+    return send_file(path, mimetype=renditions.mime_type(ext), conditional=True, max_age=365 * 86400)
+
+
+# Resumable chunked uploads
+@app.route('/api/uploads', methods=['POST'])
+@jwt_required()
+def upload_init():
+    """Start a resumable upload: {filename, content_type, total_size, sha256?, chunk_size?}"""
+    try:
+        data = request.get_json() or {}
+        session = uploads.init(
+            data.get('filename'),
+            data.get('content_type'),
+            data.get('total_size'),
+            sha256=data.get('sha256'),
+            chunk_size=data.get('chunk_size'),
+            owner=get_jwt_identity()
+        )
+        return jsonify(session), 201
+    except uploads.UploadError as e:
+        return jsonify({'error': str(e)}), e.status
+    except Exception as e:
+        return jsonify({'error': f'Upload init failed: {str(e)}'}), 500
+
+
+@app.route('/api/uploads/<upload_id>/chunks/<int:index>', methods=['PUT'])
+@jwt_required()
+def upload_chunk(upload_id, index):
+    """Store one chunk (raw request body); X-Chunk-SHA256 is verified when present"""
+    try:
+        uploads.check_owner(upload_id, get_jwt_identity())
+        result = uploads.put_chunk(upload_id, index, request.stream, request.headers.get('X-Chunk-SHA256'))
+        return jsonify(result), 200
+    except uploads.UploadError as e:
+        return jsonify({'error': str(e)}), e.status
+    except Exception as e:
+        return jsonify({'error': f'Chunk upload failed: {str(e)}'}), 500
+
+
+@app.route('/api/uploads/<upload_id>', methods=['GET'])
+@jwt_required()
+def upload_status(upload_id):
+    """Received and missing chunks, for resuming"""
+    try:
+        uploads.check_owner(upload_id, get_jwt_identity())
+        return jsonify(uploads.describe(upload_id)), 200
+    except uploads.UploadError as e:
+        return jsonify({'error': str(e)}), e.status
+
+
+@app.route('/api/uploads/<upload_id>/finalize', methods=['POST'])
+@jwt_required()
+def upload_finalize(upload_id):
+    try:
+        uploads.check_owner(upload_id, get_jwt_identity())
+        return jsonify(uploads.finalize(upload_id)), 200
+    except uploads.UploadError as e:
+        return jsonify({'error': str(e)}), e.status
+    except Exception as e:
+        return jsonify({'error': f'Upload finalize failed: {str(e)}'}), 500
+
+
+@app.route('/api/uploads/<upload_id>', methods=['DELETE'])
+@jwt_required()
+def upload_abort(upload_id):
+    try:
+        uploads.check_owner(upload_id, get_jwt_identity())
+        uploads.abort(upload_id)
+        return jsonify({'message': 'Upload removed'}), 200
+    except uploads.UploadError as e:
+        return jsonify({'error': str(e)}), e.status
+
+
+@app.route('/api/uploads/<upload_id>/content', methods=['GET'])
+def upload_content(upload_id):
+    """
+    Serve a finalized upload (supports range requests for video playback).
+    Public, since posts embed it in <img>/<video>; the type comes from the
+    file's own signature, and anything else is forced to download.
+    """
+    try:
+        path, meta = uploads.open_finalized(upload_id)
+    except uploads.UploadError as e:
+        return jsonify({'error': str(e)}), e.status
+    mimetype = uploads.serve_type(meta)
+    response = send_file(path, mimetype=mimetype, conditional=True, max_age=86400)
+    response.headers['X-Content-Type-Options'] = 'nosniff'
+    if mimetype not in uploads.ALLOWED_TYPES:
+        response.headers['Content-Disposition'] = 'attachment; filename="upload.bin"'
+    return response
+
+
+AI_DETECT_MAX_TEXTS = int(os.getenv('AI_DETECT_MAX_TEXTS', '256'))
+
+
+@app.route('/api/detect-ai-text', methods=['POST'])
+def detect_ai_text():
+    """
+    Score how likely text is AI-generated. Accepts {"text": "..."} or
+    {"texts": [...]}; long texts are chunked and per-chunk scores returned.
+    """
+    try:
+        data = request.get_json() or {}
+        single = 'text' in data
+        texts = [data.get('text')] if single else data.get('texts')
+
+        if not isinstance(texts, list) or not texts:
+            return jsonify({'error': 'Provide "text" or a non-empty "texts" list'}), 400
+        if len(texts) > AI_DETECT_MAX_TEXTS:
+            return jsonify({'error': f'At most {AI_DETECT_MAX_TEXTS} texts per request'}), 400
+        if not all(isinstance(t, str) for t in texts):
+            return jsonify({'error': 'Every text must be a string'}), 400
+
+        started = perf_counter()
+        results = ai_text_detector.detect(texts)
+        elapsed_ms = round((perf_counter() - started) * 1000, 1)
+
+        if single:
+            return jsonify({**results[0], 'model': ai_text_detector.DETECTOR_MODEL, 'elapsed_ms': elapsed_ms}), 200
+        return jsonify({
+            'results': results,
+            'count': len(results),
+            'model': ai_text_detector.DETECTOR_MODEL,
+            'elapsed_ms': elapsed_ms
+        }), 200
+
+    except Exception as e:
+        print(f"AI text detection error: {str(e)}")
+        return jsonify({'error': f'Detection failed: {str(e)}'}), 500
+
+
 # Error handlers
 @app.errorhandler(404)
 def not_found(error):
@@ -697,6 +900,8 @@ from tested2 import GEMINI_API_KEY, check_truthfulness
 
 @app.route('/fact-check', methods=['POST'])
 def fact_check():
+    if not fact_engine.budget.spend(fact_check_client()):
+        return over_budget_response({'message': "You're checking too fast. Please wait a minute."})
     data = request.json
     url = data.get('url')
     results = check_truthfulness(url)
@@ -783,13 +988,15 @@ def translate_text():
         if not text:
             return jsonify({'message': 'Text is required'}), 400
         
-        # Perform translation using deep-translator
-        translated_text = GoogleTranslator(source='auto', target=target_lang).translate(text)
+        translations, details = translation.translate_many([text], target_lang)
+        if details['failed']:
+            return jsonify({'message': 'Translation failed'}), 502
+        translated_text = translations[0]
         
         return jsonify({
             'original': text,
             'translated': translated_text,
-            'source_lang': 'auto',
+            'source_lang': translation.source_language(text)[0] or 'auto',
             'target_lang': target_lang
         }), 200
         
@@ -798,6 +1005,36 @@ def translate_text():
         return jsonify({'message': f'Translation failed: {str(e)}'}), 500
 
 
+@app.route('/api/auth/translate/batch', methods=['POST'])
+def translate_batch():
+    """
+    Translate many texts into one target language: {texts: [...], target_lang}.
+    Duplicates are translated once and results are cached; texts that fail
+    come back unchanged and are counted in details.failed.
+    """
+    try:
+        data = request.get_json() or {}
+        texts = data.get('texts')
+        target_lang = data.get('target_lang', 'en')
+
+        if not texts:
+            return jsonify({'message': 'texts is required'}), 400
+
+        translations, details = translation.translate_many(texts, target_lang)
+        return jsonify({
+            'translations': translations,
+            'source_lang': 'auto',
+            'target_lang': target_lang,
+            'details': details
+        }), 200
+
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
+    except Exception as e:
+        print(f"Translation error: {str(e)}")
+        return jsonify({'message': f'Translation failed: {str(e)}'}), 500
+
+
 @app.route('/api/auth/suggestedUsers', methods=['POST'])
 @jwt_required()
 def get_suggested_users():
@@ -835,8 +1072,6 @@ def trending_misinformation():
     area = data.get('area')
     
     try:
-        model = genai.GenerativeModel('gemini-2.5-flash')
-        
         prompt = f"""Give top 4 misinformation regarding {topic} in {area}. 
         
         Structure your response exactly like this for each misinformation:
@@ -847,8 +1082,7 @@ def trending_misinformation():
         The first line should clearly state whether the claim is True or False
         Return ONLY these 4 items, no extra text."""
         
-        response = model.generate_content(prompt)
-        response_text = response.text
+        response_text = llm_gateway.generate(prompt)
         
         # Parse the response
         misinformation_list = []
@@ -887,13 +1121,11 @@ def trending_misinformation():
 @app.route('/conversational-fact-check', methods=['POST'])
 def conversational_fact_check():
     import json
-    import re
-    
-    SERPER_API_KEY = os.getenv("SERPER_API_KEY")
     
     data = request.json
     user_message = data.get('message')
-    conversation_history = data.get('conversation_history', [])
+    raw_message = user_message
+    session = get_conversation_session(data)
     
     # Detect if this is a follow-up/source request
     follow_up_keywords = [
@@ -907,11 +1139,11 @@ def conversational_fact_check():
     
     # Extract the original claim from conversation if this is a follow-up
     original_claim = None
-    if is_follow_up and len(conversation_history) > 0:
-        for msg in reversed(conversation_history):
-            if msg['role'] == 'user':
-                original_claim = msg['content']
-                break
+    if is_follow_up:
+        original_claim = session.last_claim or session.last_user_message()
+    
+    # Follow-ups about a claim checked earlier in this conversation reuse its evidence
+    stored_evidence = session.evidence_for(original_claim) if is_follow_up and original_claim else None
     
     try:
         # Check if message contains URLs
@@ -919,43 +1151,83 @@ def conversational_fact_check():
         scraped_content = ""
         enhanced_message = user_message
         
-        if urls:
-            # URL found - scrape the content
-            for url in urls:
-                content = scrape_url_content(url)
-                
-                # Check if scraping failed
-                if "JavaScript is not available" in content or "Something went wrong" in content or "Error scraping" in content:
-                    # Scraping failed, fall back to search
-                    pass
-                else:
-                    scraped_content += f"\n\n--- Content from {url} ---\n{content}\n"
-            
-            if scraped_content:
-                enhanced_message = f"{user_message}\n\nI've extracted the following content from the URL(s):{scraped_content}"
-        
-        # Perform Real-time Search using Serper (for additional context or if no URL)
-        search_query = original_claim if is_follow_up and original_claim else user_message
-        
-        search_url = "https://google.serper.dev/search"
-        payload = {"q": search_query}
-        headers = {
-            "X-API-KEY": SERPER_API_KEY,
-            "Content-Type": "application/json"
-        }
+        # A new plain-text claim that any channel has already settled is answered from the verdict store
+        cached_verdict = fact_engine.verdicts.lookup(raw_message) if not is_follow_up and not urls else None
+        if cached_verdict:
+            parsed = {
+                "agent_response": cached_verdict['response'],
+                "verdict": cached_verdict['verdict'],
+                "confidence_score": cached_verdict['confidence'],
+                "evidence_summary": cached_verdict['evidence']
+            }
+            session.remember_evidence(raw_message, [], cached_verdict['evidence'])
+            session.set_last_claim(raw_message)
+            record_conversation_turn(session, raw_message, parsed["agent_response"])
+            return jsonify({
+                "response": parsed,
+                "search_evidence": cached_verdict['evidence'],
+                "evidence_reused": True,
+                "cascade_tier": 'cache',
+                "stage_timings": {},
+                "conversation_id": session.id,
+                "status": "success"
+            })
         
-        search_results = requests.post(search_url, json=payload, headers=headers).json()
+        # Everything past this point searches and calls the model, so it counts against the caller's budget
+        if not fact_engine.budget.spend(fact_check_client()):
+            return over_budget_response({
+                "response": {
+                    "agent_response": "You're checking claims faster than I can keep up. Please wait a minute and try again.",
+                    "verdict": "UNKNOWN",
+                    "confidence_score": 0,
+                    "evidence_summary": ""
+                },
+                "conversation_id": session.id,
+                "status": "throttled"
+            })
         
-        # Extract relevant text summary
-        result_snippets = []
+        # Scrapes and the web search are independent, so run them concurrently under one deadline
+        search_query = original_claim if is_follow_up and original_claim else user_message
+        claim_language = language_id.detect_confident(search_query)
+        evidence_reused = stored_evidence is not None
+        graph = stage_graph.StageGraph(deadline=FACT_CHECK_DEADLINE)
+        scrape_deadline = monotonic() + FACT_CHECK_DEADLINE
+        for i, url in enumerate(urls):
+            graph.add(f"scrape_{i}", lambda url=url: scrape_url_content(url, deadline=scrape_deadline))
+        if not evidence_reused:
+            # No search call for follow-ups that can be answered from stored evidence.
+            # Claims are searched in their own language; non-English ones also in English
+            graph.add("search", lambda: fact_engine.gather(search_query, claim_language))
+        stage_results, stage_timings = graph.run()
+        
+        for i, url in enumerate(urls):
+            content = stage_results.get(f"scrape_{i}")
+            stage_timings[f"scrape_{i}"]['url'] = url
+            
+            # Check if scraping failed
+            if not content or "JavaScript is not available" in content or "Something went wrong" in content or "Error scraping" in content:
+                # Scraping failed, fall back to search
+                pass
+            else:
+                scraped_content += f"\n\n--- Content from {url} ---\n{content}\n"
+        if not urls and stored_evidence and stored_evidence['scraped_content']:
+            scraped_content = stored_evidence['scraped_content']
         
-        if "organic" in search_results:
-            for item in search_results["organic"][:5]:
-                snippet = item.get("snippet", "")
-                title = item.get("title", "")
-                result_snippets.append(f"{title}: {snippet}")
+        if scraped_content:
+            enhanced_message = f"{user_message}\n\nI've extracted the following content from the URL(s):{scraped_content}"
         
-        live_summary = "\n".join(result_snippets) if result_snippets else "No reliable real-time data found."
+        organic_results = []
+        if evidence_reused:
+            # Answer from the evidence retrieved for the original claim
+            live_summary = stored_evidence['live_summary']
+        else:
+            # Search evidence (shared with the other channels through the engine's cache)
+            evidence = stage_results.get("search") or {'results': [], 'live_summary': fact_engine.evidence.NO_EVIDENCE}
+            organic_results = evidence['results']
+            live_summary = evidence['live_summary']
+            
+            if organic_results:
+                session.remember_evidence(search_query, organic_results, live_summary, scraped_content)
         
         # Use enhanced message if we have scraped content
         if scraped_content:
@@ -994,17 +1266,11 @@ Use "NONE" as verdict for non-fact-checking conversational responses.
 Be concise, natural, and helpful. Return ONLY the JSON, no markdown code blocks.
 """
         
-        # Build Conversation for Gemini
-        past_msgs = ""
-        if conversation_history:
-            for msg in conversation_history:
-                role = msg['role'].upper()
-                content = msg['content']
-                if role == 'ASSISTANT':
-                    content = content.replace('✅ ', '').replace('❌ ', '').replace('⚠ ', '').replace('❓ ', '')
-                    lines = content.split('\n')
-                    content = '\n'.join([line for line in lines if not line.startswith('Confidence:') and not line.startswith('📋')])
-                past_msgs += f"{role}: {content}\n"
+        # Build Conversation for Gemini: whatever is left of the prompt budget goes to history
+        fixed_tokens = sum(conversation_sessions.estimate_tokens(part) for part in (system_prompt, user_message, live_summary))
+        history_budget = max(200, min(conversation_sessions.HISTORY_TOKEN_BUDGET,
+                                      conversation_sessions.PROMPT_TOKEN_BUDGET - fixed_tokens))
+        past_msgs = session.render_history(history_budget)
         
         final_prompt = f"""
 {system_prompt}
@@ -1030,82 +1296,48 @@ INSTRUCTIONS:
 - Respond in the required JSON format only
 """
         
-        # Get Gemini Output
-        model = genai.GenerativeModel('gemini-2.5-flash')
-        response = model.generate_content(final_prompt)
-        
-        ai_raw = response.text.strip()
+        # Cascade: a new plain-text claim that the search snippets clearly settle skips Gemini
+        nli_result = None
+        if not is_follow_up and not scraped_content and organic_results:
+            nli_started = perf_counter()
+            nli_result = nli_cascade.prescreen(raw_message, [f"{item.get('title', '')}: {item.get('snippet', '')}" for item in organic_results])
+            if nli_result is not None:
+                stage_timings['nli'] = {'status': 'ok', 'ms': round((perf_counter() - nli_started) * 1000, 1)}
+        
+        if nli_result and nli_result['decision']:
+            cascade_tier = 'nli'
+            ai_raw = json.dumps(nli_cascade.as_fact_check_response(nli_result, live_summary))
+            nli_cascade.maybe_shadow(nli_result['decision'], lambda: llm_gateway.generate(final_prompt))
+        else:
+            # Get Gemini Output
+            cascade_tier = 'llm'
+            llm_started = perf_counter()
+            ai_raw = llm_gateway.generate(final_prompt).strip()
+            stage_timings['llm'] = {'status': 'ok', 'ms': round((perf_counter() - llm_started) * 1000, 1)}
+
         print(f"Raw AI response: {ai_raw[:500]}...")  # Debug log
         
-        # Clean JSON output with improved parsing
-        parsed = None
-        try:
-            # Try to extract JSON from markdown code blocks first
-            json_match = re.search(r'```(?:json)?\s*(\{[\s\S]*?\})\s*```', ai_raw)
-            if json_match:
-                json_str = json_match.group(1).strip()
-                print(f"Extracted from markdown: {json_str[:200]}...")
-            else:
-                # Try to find JSON object in the response
-                json_match = re.search(r'(\{[\s\S]*\})', ai_raw)
-                if json_match:
-                    json_str = json_match.group(1).strip()
-                    print(f"Extracted JSON object: {json_str[:200]}...")
-                else:
-                    json_str = ai_raw
-                    print("Using full response as JSON")
-            
-            parsed = json.loads(json_str)
-            print(f"Parsed successfully: {parsed}")
-            
-        except (json.JSONDecodeError, AttributeError) as e:
-            print(f"JSON parsing error: {e}")
-            print(f"Full raw response: {ai_raw}")
-            # Try to create a structured response from plain text
-            parsed = {
-                "agent_response": ai_raw,
-                "verdict": "NONE",
-                "confidence_score": 0,
-                "evidence_summary": live_summary
-            }
-        
-        # Ensure all required fields exist
-        if not isinstance(parsed, dict):
-            parsed = {
-                "agent_response": str(parsed),
-                "verdict": "NONE",
-                "confidence_score": 0,
-                "evidence_summary": live_summary
-            }
+        parsed = fact_engine.parse_response(ai_raw, live_summary)
+        if not is_follow_up and not urls and cascade_tier == 'llm':
+            # NLI verdicts are returned but kept out of the verdict store every channel trusts
+            fact_engine.verdicts.record(raw_message, parsed["verdict"], parsed["confidence_score"],
+                                        str(parsed["agent_response"]), live_summary, channel='web')
+        elif not is_follow_up and len(urls) == 1 and scraped_content:
+            # A page check is also kept under the page's URL, for GET /api/verdict
+            fact_engine.verdicts.record_url(urls[0], parsed["verdict"], parsed["confidence_score"],
+                                            str(parsed["agent_response"]), live_summary, channel='web')
         
-        # Ensure confidence_score is an integer
-        if "confidence_score" in parsed:
-            if isinstance(parsed["confidence_score"], str):
-                try:
-                    # Extract number from string (e.g., "85%" -> 85)
-                    score_str = re.search(r'\d+', str(parsed["confidence_score"]))
-                    if score_str:
-                        parsed["confidence_score"] = int(score_str.group())
-                    else:
-                        parsed["confidence_score"] = 0
-                except (ValueError, TypeError):
-                    parsed["confidence_score"] = 0
-            elif not isinstance(parsed["confidence_score"], int):
-                try:
-                    parsed["confidence_score"] = int(parsed["confidence_score"])
-                except:
-                    parsed["confidence_score"] = 0
-        else:
-            parsed["confidence_score"] = 0
-        
-        # Ensure other required fields exist
-        parsed.setdefault("agent_response", "No response generated")
-        parsed.setdefault("verdict", "NONE")
-        parsed.setdefault("evidence_summary", live_summary)
+        if not is_follow_up:
+            session.set_last_claim(raw_message)
+        record_conversation_turn(session, raw_message, str(parsed["agent_response"]))
         
         return jsonify({
             "response": parsed,
             "search_evidence": live_summary,
+            "evidence_reused": evidence_reused,
+            "cascade_tier": cascade_tier,
+            "stage_timings": stage_timings,
+            "conversation_id": session.id,
             "status": "success"
         })
     
@@ -1118,15 +1350,103 @@ INSTRUCTIONS:
                 "confidence_score": 0,
                 "evidence_summary": ""
             },
+            "conversation_id": session.id,
             "status": "error"
         }), 500
 
+@app.route('/api/verdict', methods=['GET'])
+@app.route('/api/verdict/<key_hash>', methods=['GET'])
+def verdict_lookup(key_hash=None):
+    """
+    Stored verdict for ?url=<page URL>, ?claim=<text> or a claim hash (SHA-256
+    of the lower-cased, whitespace-collapsed claim), answered without searching.
+    404 means nothing is stored and a full check is needed.
+    """
+    try:
+        if key_hash is None:
+            url = request.args.get('url', '').strip()
+            claim = request.args.get('claim', '').strip()
+            if url:
+                key_hash = fact_engine.verdicts.url_hash(url)
+            elif claim:
+                key_hash = fact_engine.verdicts.claim_hash(claim)
+            else:
+                return jsonify({'message': 'url, claim or a claim hash is required'}), 400
+        elif not re.fullmatch(r'[0-9a-f]{64}', key_hash):
+            return jsonify({'message': 'Invalid claim hash'}), 400
+        
+        cached = fact_engine.verdicts.lookup_hash(key_hash)
+        if not cached:
+            response = jsonify({'message': 'No stored verdict', 'key': key_hash, 'status': 'miss'})
+            response.status_code = 404
+            response.cache_control.no_store = True
+            return response
+        
+        response = jsonify({
+            'response': {
+                'agent_response': cached['response'],
+                'verdict': cached['verdict'],
+                'confidence_score': cached['confidence'],
+                'evidence_summary': cached['evidence']
+            },
+            'key': key_hash,
+            'channel': cached['channel'],
+            'age': cached['age'],
+            'status': 'hit'
+        })
+        # Cacheable until the entry expires from the store, revalidated by ETag afterwards
+        remaining = int(fact_engine.verdicts.FACT_VERDICT_TTL - cached['age'])
+        response.cache_control.public = True
+        response.cache_control.max_age = max(0, min(VERDICT_MAX_AGE, remaining))
+        response.set_etag(f"{key_hash[:16]}-{int(cached['created_at'])}")
+        response.last_modified = int(cached['created_at'])
+        return response.make_conditional(request)
+    
+    except Exception as e:
+        return jsonify({'message': str(e)}), 500
+
+@app.route('/api/scan', methods=['POST'])
+def scan_claims():
+    """
+    Check every candidate claim found on a page in one request. Streams one
+    JSON line per claim as soon as its result is known (stored verdicts first,
+    then checked claims as they finish), followed by a final summary line.
+    """
+    import json
+    
+    data = request.json or {}
+    # Claims the verdict store answers are free; each full check spends from the caller's budget
+    client = fact_check_client()
+    try:
+        results = fact_engine.scan.scan(data.get('claims'), channel='extension',
+                                        allow=lambda: fact_engine.budget.spend(client))
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
+    
+    def stream():
+        counts = {}
+        for result in results:
+            counts[result['status']] = counts.get(result['status'], 0) + 1
+            yield json.dumps(result) + '\n'
+        yield json.dumps({'status': 'done', 'counts': counts}) + '\n'
+    
+    response = Response(stream_with_context(stream()), mimetype='application/x-ndjson')
+    response.cache_control.no_store = True
+    response.headers['X-Accel-Buffering'] = 'no'  # let proxies pass lines through as they come
+    return response
+
 # Fallback for old URL-based fact-checking
 @app.route('/conversational-fact-check-legacy', methods=['POST'])
 def conversational_fact_check_legacy():
     data = request.json
     user_message = data.get('message')
-    conversation_history = data.get('conversation_history', [])
+    session = get_conversation_session(data)
+    if not fact_engine.budget.spend(fact_check_client()):
+        return over_budget_response({
+            "response": "You're checking claims faster than I can keep up. Please wait a minute and try again.",
+            "conversation_id": session.id,
+            "status": "throttled"
+        })
     
     try:
         # Detect URLs in the message
@@ -1158,7 +1478,7 @@ def conversational_fact_check_legacy():
             try:
                 # Extract key claim/topic for search
                 search_query = user_message[:200]  # Use first 200 chars as search query
-                search_results = search_duckduckgo(search_query, max_results=5)
+                search_results = search_duckduckgo(search_query, max_results=5, language=language_id.detect_confident(search_query))
                 
                 if search_results:
                     search_results_text = "\n\n--- Recent Web Search Results ---\n"
@@ -1172,8 +1492,6 @@ def conversational_fact_check_legacy():
                 print(f"Search error: {str(search_error)}")
                 # Continue without search results
         
-        model = genai.GenerativeModel('gemini-2.5-flash')
-        
         # Build conversation context
         system_prompt = """You are an expert AI fact-checking agent. Your job is to:
 1. Analyze claims from users about health, science, politics, or any topic
@@ -1193,18 +1511,21 @@ When fact-checking:
 If you have web search results, use them to verify current information and cite specific sources.
 If a URL is shared but you can't access the content (like X/Twitter posts that need JavaScript), politely ask the user to copy and paste the actual claim text."""
         
-        # Prepare messages for Gemini
-        messages = [{"role": msg["role"], "content": msg["content"]} for msg in conversation_history]
-        messages.append({"role": "user", "content": enhanced_message})
+        # Prepare messages for Gemini: server-side history under the remaining prompt budget
+        fixed_tokens = sum(conversation_sessions.estimate_tokens(part) for part in (system_prompt, enhanced_message))
+        history_budget = max(200, min(conversation_sessions.HISTORY_TOKEN_BUDGET,
+                                      conversation_sessions.PROMPT_TOKEN_BUDGET - fixed_tokens))
+        past_msgs = session.render_history(history_budget)
         
         # Generate response
-        response = model.generate_content(system_prompt + "\n\nConversation:\n" + 
-                                         "\n".join([f"{msg['role']}: {msg['content']}" for msg in messages]))
-        
-        ai_response = response.text
+        ai_response = llm_gateway.generate(system_prompt + "\n\nConversation:\n" + 
+                                           (past_msgs + "\n" if past_msgs else "") +
+                                           f"USER: {enhanced_message}")
+        record_conversation_turn(session, user_message, ai_response)
         
         return jsonify({
             "response": ai_response,
+            "conversation_id": session.id,
             "status": "success",
             'search_performed': bool(search_results_text)
         })
@@ -1218,66 +1539,93 @@ If a URL is shared but you can't access the content (like X/Twitter posts that n
                 "confidence_score": 0,
                 "evidence_summary": ""
             },
+            "conversation_id": session.id,
             "status": "error"
         }), 500
 
-from PIL import Image
+import image_pipeline
+import media_index
+import video_pipeline
 import traceback
 
+IMAGE_ANALYSIS_PROMPT = (
+    "Analyze this image in short. Give confidence score telling if the image is AI generated or not. "
+    + media_index.VERDICT_INSTRUCTIONS
+)
+
 @app.route('/api/analyze-image', methods=['POST'])
 def analyze_image():
     print("📨 POST /api/analyze-image")
     
     try:
-        if 'image' not in request.files:
+        upload_file = None
+        if request.form.get('upload_id'):
+            # A finalized resumable upload of the caller's, instead of an inline file
+            try:
+                path, meta = open_own_upload(request.form['upload_id'])
+            except uploads.UploadError as e:
+                return jsonify({'error': str(e)}), e.status
+            if not uploads.serve_type(meta).startswith('image/'):
+                return jsonify({'error': 'Uploaded file is not a supported image'}), 415
+            if meta['total_size'] > image_pipeline.IMAGE_MAX_BYTES:
+                return jsonify({'error': f'Image too large. Maximum size is {image_pipeline.IMAGE_MAX_BYTES // (1024 * 1024)}MB'}), 413
+            upload_file = image_stream = open(path, 'rb')
+            print(f"✓ Upload referenced: {request.form['upload_id']}")
+        elif 'image' not in request.files:
             print("✗ No image in request")
             return jsonify({'error': 'No image provided'}), 400
+        else:
+            file = request.files['image']
+            print(f"✓ File received: {file.filename}")
+            
+            if file.filename == '':
+                return jsonify({'error': 'No file selected'}), 400
+            image_stream = file.stream
         
-        file = request.files['image']
-        print(f"✓ File received: {file.filename}")
-        
-        if file.filename == '':
-            return jsonify({'error': 'No file selected'}), 400
-        
-        # Validate image
-        try:
-            print("  → Validating image...")
-            img = Image.open(file.stream)
-            img.verify()
-            file.stream.seek(0)
-            img = Image.open(file.stream)
-            print(f"  ✓ Image valid: {img.format} {img.size}")
-        except Exception as e:
-            print(f"  ✗ Image validation failed: {e}")
-            return jsonify({'error': f'Invalid image: {str(e)}'}), 400
-        
-        # Send to Gemini
+        # Validate, downscale and strip metadata; reuse the analysis of a visually identical image
         try:
-            print("  → Sending to Gemini API...")
-            model = genai.GenerativeModel('gemini-2.5-flash')
-            file.stream.seek(0)
-            response = model.generate_content([
-                "Analyze this image in short. Give confidence score telling if the image is AI generated or not.",
-                img
-            ])
-            analysis = response.text
-            print(f"  ✓ Gemini response received ({len(analysis)} chars)\n")
+            print("  → Preprocessing image and sending to Gemini API...")
+            analysis, details = image_pipeline.analyze(
+                image_stream,
+                IMAGE_ANALYSIS_PROMPT,
+                lambda img: llm_gateway.generate([IMAGE_ANALYSIS_PROMPT, img])
+            )
+            if not details['cached']:
+                get_media_index().add_analysis(int(details['image_hash'], 16), analysis)
+            source = "cached analysis" if details['cached'] else "Gemini response"
+            print(f"  ✓ {source} ({len(analysis)} chars), image {tuple(details['original_size'])} -> {tuple(details['size'])}\n")
+            text, verdict = media_index.parse_verdict(analysis)
             
             return jsonify({
                 'success': True,
-                'analysis': analysis
+                'analysis': text,
+                'verdict': verdict,
+                'flagged': media_index.is_flagged(analysis),
+                'cached': details['cached'],
+                'image': details
             }), 200
         
+        except llm_gateway.LLMError as e:
+            print(f"  ✗ Gemini error: {e}")
+            return jsonify({'error': f'Gemini error: {str(e)}'}), 502
+        except ValueError as e:
+            print(f"  ✗ Image validation failed: {e}")
+            return jsonify({'error': f'Invalid image: {str(e)}'}), 400
         except Exception as e:
             print(f"  ✗ Gemini error: {e}")
             traceback.print_exc()
             return jsonify({'error': f'Gemini error: {str(e)}'}), 500
+        finally:
+            if upload_file:
+                upload_file.close()
     
     except Exception as e:
         print(f"✗ Unexpected error: {e}")
         traceback.print_exc()
         return jsonify({'error': f'Server error: {str(e)}'}), 500
 
+VIDEO_ANALYSIS_PROMPT = "Analyze this video and determine if it's AI-generated or real. Respond with:\n1. A clear verdict (is it AI-generated or real?)\n2. Confidence score as a percentage\n3. Key indicators you observed\n\nUse plain text only, no markdown formatting."
+
 @app.route('/api/analyze-video', methods=['POST'])
 def analyze_video():
     # Supported video formats
@@ -1285,49 +1633,73 @@ def analyze_video():
     MAX_FILE_SIZE = 20 * 1024 * 1024  # 20MB limit
     
     try:
-        if 'video' not in request.files:
-            return jsonify({'error': 'No video provided'}), 400
-        
-        file = request.files['video']
-        
-        if file.filename == '':
-            return jsonify({'error': 'No file selected'}), 400
-        
-        # Check file size
-        file.seek(0, os.SEEK_END)
-        file_size = file.tell()
-        file.seek(0)
-        
-        if file_size > MAX_FILE_SIZE:
-            return jsonify({'error': f'File too large. Maximum size is 20MB, got {file_size / 1024 / 1024:.2f}MB'}), 400
-        
-        # Check MIME type
-        if file.content_type not in SUPPORTED_FORMATS:
-            return jsonify({'error': f'Unsupported video format. Supported: {", ".join(SUPPORTED_FORMATS)}'}), 400
-        
-        print(f"✓ File received: {file.filename} ({file_size / 1024 / 1024:.2f}MB)")
-        
-        # Read video bytes
-        video_bytes = file.read()
-        print("  → Sending to Gemini API...")
+        mode = request.form.get('mode')
+        if mode and mode not in ('sampled', 'full'):
+            return jsonify({'error': "mode must be 'sampled' or 'full'"}), 400
         
-        model = genai.GenerativeModel('gemini-2.5-flash')
-        response = model.generate_content([
-            "Analyze this video and determine if it's AI-generated or real. Respond with:\n1. A clear verdict (is it AI-generated or real?)\n2. Confidence score as a percentage\n3. Key indicators you observed\n\nUse plain text only, no markdown formatting.",
-            {
-                'mime_type': file.content_type,
-                'data': video_bytes
-            }
-        ])
+        if request.form.get('upload_id'):
+            # A finalized resumable upload: no 20MB multipart limit, but full mode still sends the bytes inline
+            try:
+                path, meta = open_own_upload(request.form['upload_id'])
+            except uploads.UploadError as e:
+                return jsonify({'error': str(e)}), e.status
+            if uploads.serve_type(meta) not in SUPPORTED_FORMATS:
+                return jsonify({'error': f'Unsupported video format. Supported: {", ".join(SUPPORTED_FORMATS)}'}), 400
+            if (mode or video_pipeline.VIDEO_ANALYSIS_MODE) == 'full' and meta['total_size'] > MAX_FILE_SIZE:
+                return jsonify({'error': 'Full-video analysis is limited to 20MB; use sampled mode'}), 400
+            
+            print(f"✓ Upload referenced: {meta['filename']} ({meta['total_size'] / 1024 / 1024:.2f}MB)")
+            video = video_pipeline.SpooledVideo(path, meta['sha256'], meta['total_size'], uploads.serve_type(meta))
+            try:
+                analysis, details = video_pipeline.analyze(video, VIDEO_ANALYSIS_PROMPT, llm_gateway.generate, mode)
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+        else:
+            if 'video' not in request.files:
+                return jsonify({'error': 'No video provided'}), 400
+            
+            file = request.files['video']
+            
+            if file.filename == '':
+                return jsonify({'error': 'No file selected'}), 400
+            
+            # Check file size
+            file.seek(0, os.SEEK_END)
+            file_size = file.tell()
+            file.seek(0)
+            
+            if file_size > MAX_FILE_SIZE:
+                return jsonify({'error': f'File too large. Maximum size is 20MB, got {file_size / 1024 / 1024:.2f}MB'}), 400
+            
+            # Check MIME type
+            if file.content_type not in SUPPORTED_FORMATS:
+                return jsonify({'error': f'Unsupported video format. Supported: {", ".join(SUPPORTED_FORMATS)}'}), 400
+            
+            print(f"✓ File received: {file.filename} ({file_size / 1024 / 1024:.2f}MB)")
+            
+            # Spool to a temporary file, then analyze sampled keyframes (or the full video)
+            try:
+                with video_pipeline.spool(file, MAX_FILE_SIZE) as video:
+                    print("  → Sending to Gemini API...")
+                    analysis, details = video_pipeline.analyze(video, VIDEO_ANALYSIS_PROMPT, llm_gateway.generate, mode)
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
         
-        analysis = response.text
-        print(f"  ✓ Gemini response received ({len(analysis)} chars)\n")
+        source = "cached analysis" if details['cached'] else "Gemini response"
+        print(f"  ✓ {source} ({len(analysis)} chars), mode={details['mode']}, "
+              f"{details['bytes_sent'] / 1024:.0f}KB sent, {details['latency_ms']}ms\n")
         
         return jsonify({
             'success': True,
-            'analysis': analysis
+            'analysis': analysis,
+            'cached': details['cached'],
+            'video': details
         }), 200
     
+    except llm_gateway.LLMError as e:
+        # Model failures are not ValueErrors, so they pass the input checks above
+        print(f"✗ Gemini error: {e}")
+        return jsonify({'error': f'Gemini error: {str(e)}'}), 502
     except Exception as e:
         print(f"✗ Error: {e}")
         traceback.print_exc()
@@ -0,0 +1,319 @@
+"""
+Bounded conversation-turn stores for chat bots
+File: chat_turn_store.py
+
+Each key (e.g. a WhatsApp number) maps to its last max_turns turns. Every
+backend offers the same interface:
+- get(key): the stored turns, oldest first ([] for unknown or idle keys)
+- append(key, turns): add turns and trim to the last max_turns, atomically
+- clear(key)
+- stats(): hits/misses/appends/expired/evicted plus size information
+
+Backends:
+- memory: LRU + idle TTL in this process (max_keys bounds memory)
+- sqlite: shared by every worker on the host, in the shared cache database
+- mongo: shared across hosts; one document per key, trimmed with $push/$slice
+  and expired by a TTL index
+
+create_store() picks the backend from CHAT_STORE_BACKEND.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from url_utils import CACHE_DB_PATH
+
+CHAT_STORE_BACKEND = os.getenv('CHAT_STORE_BACKEND', 'sqlite').lower()
+CHAT_STORE_MAX_TURNS = int(os.getenv('CHAT_STORE_MAX_TURNS', '10'))
+CHAT_STORE_TTL = int(os.getenv('CHAT_STORE_TTL', str(24 * 3600)))
+CHAT_STORE_MAX_KEYS = int(os.getenv('CHAT_STORE_MAX_KEYS', '10000'))
+CHAT_STORE_CLEANUP_INTERVAL = int(os.getenv('CHAT_STORE_CLEANUP_INTERVAL', '600'))
+
+
+class _Counters:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.values = {'hits': 0, 'misses': 0, 'appends': 0, 'clears': 0, 'expired': 0, 'evicted': 0}
+
+    def add(self, key, n=1):
+        with self.lock:
+            self.values[key] += n
+
+    def snapshot(self):
+        with self.lock:
+            return dict(self.values)
+
+
+class MemoryTurnStore:
+    """In-process store: least-recently-used keys are evicted beyond max_keys, idle keys after ttl"""
+
+    backend = 'memory'
+
+    def __init__(self, max_turns=CHAT_STORE_MAX_TURNS, ttl=CHAT_STORE_TTL, max_keys=CHAT_STORE_MAX_KEYS):
+        self.max_turns = max_turns
+        self.ttl = ttl
+        self.max_keys = max_keys
+        self.entries = OrderedDict()  # key -> (updated_at, turns)
+        self.lock = threading.Lock()
+        self.counters = _Counters()
+
+    def _live(self, key, now):
+        entry = self.entries.get(key)
+        if entry and now - entry[0] > self.ttl:
+            del self.entries[key]
+            self.counters.add('expired')
+            return None
+        return entry
+
+    def get(self, key):
+        with self.lock:
+            entry = self._live(key, time.time())
+            if entry is None:
+                self.counters.add('misses')
+                return []
+            self.entries.move_to_end(key)
+            self.counters.add('hits')
+            return list(entry[1])
+
+    def append(self, key, turns):
+        now = time.time()
+        with self.lock:
+            entry = self._live(key, now)
+            kept = (entry[1] if entry else []) + list(turns)
+            self.entries[key] = (now, kept[-self.max_turns:])
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_keys:
+                self.entries.popitem(last=False)
+                self.counters.add('evicted')
+        self.counters.add('appends')
+
+    def clear(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+        self.counters.add('clears')
+
+    def stats(self):
+        with self.lock:
+            keys = len(self.entries)
+            turns = sum(len(entry[1]) for entry in self.entries.values())
+            content_bytes = sum(len(t.get('content') or '') for entry in self.entries.values() for t in entry[1])
+        return {**self.counters.snapshot(), 'backend': self.backend, 'keys': keys, 'turns': turns,
+                'content_bytes': content_bytes, 'max_keys': self.max_keys, 'max_turns': self.max_turns}
+
+
+class SQLiteTurnStore:
+    """
+    Store in a sqlite table shared by all worker processes. append() inserts and
+    trims in one IMMEDIATE transaction; idle keys are removed on read and by a
+    periodic sweep.
+    """
+
+    backend = 'sqlite'
+
+    def __init__(self, path=CACHE_DB_PATH, table='chat_turns', max_turns=CHAT_STORE_MAX_TURNS, ttl=CHAT_STORE_TTL):
+        self.path = path
+        self.table = table
+        self.max_turns = max_turns
+        self.ttl = ttl
+        self.counters = _Counters()
+        self._ready = False
+        self._ready_lock = threading.Lock()
+        self._last_sweep = 0.0
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+        if not self._ready:
+            with self._ready_lock:
+                conn.execute(
+                    f'CREATE TABLE IF NOT EXISTS {self.table} ('
+                    'chat_key TEXT NOT NULL, seq INTEGER NOT NULL, turn TEXT NOT NULL, created_at REAL NOT NULL, '
+                    'PRIMARY KEY (chat_key, seq))'
+                )
+                conn.execute(
+                    f'CREATE TABLE IF NOT EXISTS {self.table}_keys ('
+                    'chat_key TEXT PRIMARY KEY, updated_at REAL NOT NULL)'
+                )
+                conn.execute(f'CREATE INDEX IF NOT EXISTS {self.table}_keys_updated ON {self.table}_keys (updated_at)')
+                self._ready = True
+        return conn
+
+    def _delete(self, conn, keys):
+        conn.executemany(f'DELETE FROM {self.table} WHERE chat_key = ?', [(k,) for k in keys])
+        conn.executemany(f'DELETE FROM {self.table}_keys WHERE chat_key = ?', [(k,) for k in keys])
+
+    def _sweep(self, conn, now):
+        """Remove every idle key, at most once per CHAT_STORE_CLEANUP_INTERVAL"""
+        if now - self._last_sweep < CHAT_STORE_CLEANUP_INTERVAL:
+            return
+        self._last_sweep = now
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            stale = [row[0] for row in conn.execute(
+                f'SELECT chat_key FROM {self.table}_keys WHERE updated_at < ?', (now - self.ttl,)
+            )]
+            self._delete(conn, stale)
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        self.counters.add('expired', len(stale))
+
+    def get(self, key):
+        now = time.time()
+        try:
+            conn = self._connect()
+            try:
+                row = conn.execute(f'SELECT updated_at FROM {self.table}_keys WHERE chat_key = ?', (key,)).fetchone()
+                if row and now - row[0] > self.ttl:
+                    conn.execute('BEGIN IMMEDIATE')
+                    self._delete(conn, [key])
+                    conn.execute('COMMIT')
+                    self.counters.add('expired')
+                    row = None
+                if row is None:
+                    self.counters.add('misses')
+                    return []
+                turns = [json.loads(t) for (t,) in conn.execute(
+                    f'SELECT turn FROM {self.table} WHERE chat_key = ? ORDER BY seq', (key,)
+                )]
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            print(f"Chat store read error: {str(e)}")
+            self.counters.add('misses')
+            return []
+        self.counters.add('hits')
+        return turns
+
+    def append(self, key, turns):
+        now = time.time()
+        try:
+            conn = self._connect()
+            try:
+                conn.execute('BEGIN IMMEDIATE')
+                try:
+                    row = conn.execute(f'SELECT MAX(seq) FROM {self.table} WHERE chat_key = ?', (key,)).fetchone()
+                    start = (row[0] + 1) if row and row[0] is not None else 0
+                    conn.executemany(
+                        f'INSERT INTO {self.table} (chat_key, seq, turn, created_at) VALUES (?, ?, ?, ?)',
+                        [(key, start + i, json.dumps(turn), now) for i, turn in enumerate(turns)]
+                    )
+                    conn.execute(
+                        f'DELETE FROM {self.table} WHERE chat_key = ? AND seq < ?',
+                        (key, start + len(turns) - self.max_turns)
+                    )
+                    conn.execute(
+                        f'INSERT OR REPLACE INTO {self.table}_keys (chat_key, updated_at) VALUES (?, ?)', (key, now)
+                    )
+                    conn.execute('COMMIT')
+                except Exception:
+                    conn.execute('ROLLBACK')
+                    raise
+                self._sweep(conn, now)
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            print(f"Chat store write error: {str(e)}")
+            return
+        self.counters.add('appends')
+
+    def clear(self, key):
+        try:
+            conn = self._connect()
+            try:
+                conn.execute('BEGIN IMMEDIATE')
+                self._delete(conn, [key])
+                conn.execute('COMMIT')
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            print(f"Chat store write error: {str(e)}")
+        self.counters.add('clears')
+
+    def stats(self):
+        result = {**self.counters.snapshot(), 'backend': self.backend, 'max_turns': self.max_turns}
+        try:
+            conn = self._connect()
+            try:
+                result['keys'] = conn.execute(f'SELECT COUNT(*) FROM {self.table}_keys').fetchone()[0]
+                result['turns'], result['content_bytes'] = conn.execute(
+                    f'SELECT COUNT(*), COALESCE(SUM(LENGTH(turn)), 0) FROM {self.table}'
+                ).fetchone()
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            print(f"Chat store read error: {str(e)}")
+        return result
+
+
+class MongoTurnStore:
+    """
+    One document per key: {_id: key, turns: [...], updated_at}. append() is a
+    single upsert with $push/$each/$slice, so concurrent workers never lose or
+    over-keep turns; a TTL index on updated_at removes idle keys.
+    """
+
+    backend = 'mongo'
+
+    def __init__(self, collection, max_turns=CHAT_STORE_MAX_TURNS, ttl=CHAT_STORE_TTL):
+        self.collection = collection
+        self.max_turns = max_turns
+        self.ttl = ttl
+        self.counters = _Counters()
+        try:
+            self.collection.create_index('updated_at', expireAfterSeconds=ttl)
+        except Exception as e:
+            print(f"Chat store could not create TTL index: {str(e)}")
+
+    def get(self, key):
+        from datetime import datetime, timedelta, timezone
+
+        # The TTL monitor only runs about once a minute, so check idleness here too
+        cutoff = datetime.now(timezone.utc) - timedelta(seconds=self.ttl)
+        doc = self.collection.find_one({'_id': key, 'updated_at': {'$gte': cutoff}}, {'turns': 1})
+        if not doc:
+            self.counters.add('misses')
+            return []
+        self.counters.add('hits')
+        return doc.get('turns', [])
+
+    def append(self, key, turns):
+        from datetime import datetime, timezone
+
+        self.collection.update_one(
+            {'_id': key},
+            {'$push': {'turns': {'$each': list(turns), '$slice': -self.max_turns}},
+             '$set': {'updated_at': datetime.now(timezone.utc)}},
+            upsert=True
+        )
+        self.counters.add('appends')
+
+    def clear(self, key):
+        self.collection.delete_one({'_id': key})
+        self.counters.add('clears')
+
+    def stats(self):
+        result = {**self.counters.snapshot(), 'backend': self.backend, 'max_turns': self.max_turns}
+        try:
+            result['keys'] = self.collection.estimated_document_count()
+        except Exception as e:
+            print(f"Chat store stats error: {str(e)}")
+        return result
+
+
+def create_store(name, backend=CHAT_STORE_BACKEND):
+    """Store for one bot; `name` separates the tables/collections of different bots"""
+    if backend == 'memory':
+        return MemoryTurnStore()
+    if backend == 'mongo':
+        from pymongo import MongoClient
+
+        client = MongoClient(os.getenv('MONGO_URI', 'mongodb://localhost:27017/'))
+        return MongoTurnStore(client['social_media_db'][f'{name}_turns'])
+    if backend != 'sqlite':
+        print(f"Unknown CHAT_STORE_BACKEND '{backend}', using sqlite")
+    return SQLiteTurnStore(table=f'{name}_turns')
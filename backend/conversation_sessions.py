@@ -0,0 +1,382 @@
+"""
+Server-side conversation sessions with token-budgeted history
+File: conversation_sessions.py
+
+Clients send a conversation_id and only the new message. The server keeps the
+turns, evidence gathered so far and a rolling summary of older turns, and
+assembles the history part of the prompt under a token budget.
+
+Sessions live in a sqlite table in the shared cache database, keyed by
+(owner, conversation_id), so every worker process sees the same conversation
+and a conversation_id only resumes the caller's own session. Each change is
+applied to the freshly read row inside one IMMEDIATE transaction. Idle
+sessions are removed by an indexed sweep at most once per
+CONVERSATION_CLEANUP_INTERVAL.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+from url_utils import CACHE_DB_PATH
+
+SESSION_TTL = int(os.getenv('CONVERSATION_SESSION_TTL', str(6 * 3600)))
+MAX_SESSIONS = int(os.getenv('CONVERSATION_MAX_SESSIONS', '5000'))
+CLEANUP_INTERVAL = int(os.getenv('CONVERSATION_CLEANUP_INTERVAL', '600'))
+HISTORY_TOKEN_BUDGET = int(os.getenv('CONVERSATION_HISTORY_TOKENS', '1500'))
+SUMMARY_TOKEN_BUDGET = int(os.getenv('CONVERSATION_SUMMARY_TOKENS', '400'))
+PROMPT_TOKEN_BUDGET = int(os.getenv('CONVERSATION_PROMPT_TOKENS', '6000'))
+KEEP_RECENT_TURNS = int(os.getenv('CONVERSATION_KEEP_RECENT_TURNS', '4'))
+EVIDENCE_TTL = int(os.getenv('CONVERSATION_EVIDENCE_TTL', '1800'))
+MAX_EVIDENCE_PER_SESSION = int(os.getenv('CONVERSATION_MAX_EVIDENCE', '10'))
+# A compaction still marked as running after this long died with its worker
+FOLD_TIMEOUT = int(os.getenv('CONVERSATION_FOLD_TIMEOUT', '120'))
+
+STATE_FIELDS = ('turns', 'summary', 'summarized_turns', 'folding', 'folding_since', 'evidence', 'last_claim')
+
+
+def estimate_tokens(text):
+    """Rough token count (~4 characters per token) used for budgeting"""
+    return len(text or '') // 4 + 1
+
+
+def claim_key(claim):
+    """Case- and whitespace-insensitive key for evidence memoized per claim"""
+    return ' '.join((claim or '').lower().split())
+
+
+def truncate_to_tokens(text, tokens):
+    max_chars = tokens * 4
+    if len(text) <= max_chars:
+        return text
+    return text[:max_chars] + "... [truncated]"
+
+
+class ConversationSession:
+    """
+    Turns, cached evidence and rolling summary for one conversation. Reads use
+    the state loaded when the session was resumed; every change goes through
+    _mutate, which re-reads the stored row, applies it and writes it back.
+    """
+
+    def __init__(self, conversation_id, owner=None, store=None):
+        self.id = conversation_id
+        self.owner = owner
+        self.store = store
+        self.turns = []
+        self.summary = ""
+        self.summarized_turns = 0
+        self.folding = []  # turns taken out of self.turns while they are being summarized
+        self.folding_since = 0.0
+        self.evidence = {}
+        self.last_claim = None
+        self.updated_at = time.time()
+        self.lock = threading.RLock()
+
+    def state(self):
+        return {field: getattr(self, field) for field in STATE_FIELDS}
+
+    def load(self, state):
+        for field in STATE_FIELDS:
+            if field in state:
+                setattr(self, field, state[field])
+
+    def _mutate(self, change):
+        with self.lock:
+            if self.store is None:
+                return change()
+            return self.store.update(self, change)
+
+    def add_turn(self, role, content):
+        def change():
+            self.turns.append({'role': role, 'content': content, 'tokens': estimate_tokens(content)})
+        self._mutate(change)
+
+    def set_last_claim(self, claim):
+        def change():
+            self.last_claim = claim
+        self._mutate(change)
+
+    def last_user_message(self):
+        with self.lock:
+            for turn in reversed(self.turns):
+                if turn['role'] == 'user':
+                    return turn['content']
+        return None
+
+    def remember_evidence(self, claim, search_results, live_summary, scraped_content=""):
+        """Memoize the search results and scraped content retrieved for a claim"""
+        def change():
+            self.evidence.pop(claim_key(claim), None)
+            self.evidence[claim_key(claim)] = {
+                'claim': claim,
+                'search_results': search_results,
+                'live_summary': live_summary,
+                'scraped_content': scraped_content,
+                'retrieved_at': time.time(),
+            }
+            while len(self.evidence) > MAX_EVIDENCE_PER_SESSION:
+                del self.evidence[next(iter(self.evidence))]
+        self._mutate(change)
+
+    def evidence_for(self, claim):
+        """Evidence memoized for a claim, or None if missing or stale"""
+        with self.lock:
+            entry = self.evidence.get(claim_key(claim))
+            if entry and time.time() - entry['retrieved_at'] < EVIDENCE_TTL:
+                return entry
+        return None
+
+    def history_tokens(self):
+        with self.lock:
+            return sum(turn['tokens'] for turn in self.turns)
+
+    def compact(self, summarize, budget=HISTORY_TOKEN_BUDGET):
+        """
+        Fold the oldest turns into the rolling summary until the verbatim turns
+        fit the budget. summarize(previous_summary, turns) returns the new summary;
+        if it fails, the old turns are kept as a truncated extract instead.
+        summarize runs outside the store transaction (it is a model call), so the
+        session keeps serving turns meanwhile; the turns being folded are still
+        rendered verbatim until the new summary is in. One compaction runs at a
+        time; one left unfinished for FOLD_TIMEOUT is undone and retried.
+        """
+        def take():
+            if self.folding and time.time() - self.folding_since < FOLD_TIMEOUT:
+                return None
+            if self.folding:
+                self.turns = self.folding + self.turns
+                self.folding = []
+            if self.history_tokens() <= budget or len(self.turns) <= KEEP_RECENT_TURNS:
+                return None
+
+            folded = []
+            while len(self.turns) > KEEP_RECENT_TURNS and self.history_tokens() > budget:
+                folded.append(self.turns.pop(0))
+            if not folded:
+                return None
+            self.folding = folded
+            self.folding_since = time.time()
+            return folded, self.summary
+
+        taken = self._mutate(take)
+        if not taken:
+            return False
+        folded, previous = taken
+
+        try:
+            summary = summarize(previous, folded)
+        except Exception as e:
+            print(f"History summarization failed, using extract: {str(e)}")
+            summary = None
+        if not summary:
+            extract = "\n".join(f"{t['role'].upper()}: {t['content'][:200]}" for t in folded)
+            summary = f"{previous}\n{extract}".strip()
+
+        def finish():
+            if self.folding != folded:
+                return False  # timed out and taken over by another compaction
+            self.summary = truncate_to_tokens(summary.strip(), SUMMARY_TOKEN_BUDGET)
+            self.summarized_turns += len(folded)
+            self.folding = []
+            return True
+
+        return self._mutate(finish)
+
+    def render_history(self, budget=HISTORY_TOKEN_BUDGET):
+        """Summary plus as many of the most recent turns as fit in `budget` tokens"""
+        with self.lock:
+            lines = []
+            used = 0
+            if self.summary:
+                used += estimate_tokens(self.summary)
+            for turn in reversed(self.folding + self.turns):
+                if used + turn['tokens'] > budget and lines:
+                    break
+                content = turn['content']
+                if used + turn['tokens'] > budget:
+                    content = truncate_to_tokens(content, max(budget - used, 50))
+                lines.append(f"{turn['role'].upper()}: {content}")
+                used += estimate_tokens(content)
+            lines.reverse()
+
+            parts = []
+            if self.summary:
+                parts.append(f"SUMMARY OF EARLIER CONVERSATION:\n{self.summary}")
+            if lines:
+                parts.append("\n".join(lines))
+            return "\n\n".join(parts)
+
+
+class SessionStore:
+    """
+    Sessions in a sqlite table shared by all worker processes, keyed by
+    (owner, conversation_id). Idle sessions are removed on resume and by a
+    periodic sweep over the updated_at index, which also evicts the least
+    recently used sessions beyond max_sessions.
+    """
+
+    def __init__(self, path=CACHE_DB_PATH, table='conversation_sessions', ttl=SESSION_TTL, max_sessions=MAX_SESSIONS):
+        self.path = path
+        self.table = table
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self._ready = False
+        self._ready_lock = threading.Lock()
+        self._last_sweep = 0.0
+        self._lock = threading.Lock()
+        self._stats = {'created': 0, 'resumed': 0, 'expired': 0, 'evicted': 0, 'errors': 0}
+
+    def _count(self, key, n=1):
+        with self._lock:
+            self._stats[key] += n
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+        if not self._ready:
+            with self._ready_lock:
+                conn.execute(
+                    f'CREATE TABLE IF NOT EXISTS {self.table} ('
+                    'owner TEXT NOT NULL, conversation_id TEXT NOT NULL, state TEXT NOT NULL, '
+                    'updated_at REAL NOT NULL, PRIMARY KEY (owner, conversation_id))'
+                )
+                conn.execute(f'CREATE INDEX IF NOT EXISTS {self.table}_updated ON {self.table} (updated_at)')
+                self._ready = True
+        return conn
+
+    def _sweep(self, conn, now):
+        """Remove idle sessions and evict beyond max_sessions, at most once per CLEANUP_INTERVAL"""
+        if now - self._last_sweep < CLEANUP_INTERVAL:
+            return
+        self._last_sweep = now
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            expired = conn.execute(f'DELETE FROM {self.table} WHERE updated_at < ?', (now - self.ttl,)).rowcount
+            over = conn.execute(f'SELECT COUNT(*) FROM {self.table}').fetchone()[0] - self.max_sessions
+            evicted = 0
+            if over > 0:
+                evicted = conn.execute(
+                    f'DELETE FROM {self.table} WHERE rowid IN '
+                    f'(SELECT rowid FROM {self.table} ORDER BY updated_at LIMIT ?)', (over,)
+                ).rowcount
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        self._count('expired', expired)
+        self._count('evicted', evicted)
+
+    def _write(self, conn, session, now):
+        session.updated_at = now
+        conn.execute(
+            f'INSERT OR REPLACE INTO {self.table} (owner, conversation_id, state, updated_at) VALUES (?, ?, ?, ?)',
+            (session.owner, session.id, json.dumps(session.state()), now)
+        )
+
+    def get_or_create(self, owner, conversation_id=None, seed_history=None):
+        """
+        Resume the owner's session by id, or start a new one. An id that belongs
+        to another owner starts a separate session for this one. seed_history
+        (the old client-side conversation_history list) only seeds a new session.
+        """
+        owner = str(owner or '')
+        now = time.time()
+        session = ConversationSession(conversation_id or uuid.uuid4().hex, owner, self)
+        try:
+            conn = self._connect()
+            try:
+                self._sweep(conn, now)
+                row = None
+                if conversation_id:
+                    row = conn.execute(
+                        f'SELECT state, updated_at FROM {self.table} WHERE owner = ? AND conversation_id = ?',
+                        (owner, conversation_id)
+                    ).fetchone()
+                if row and now - row[1] > self.ttl:
+                    conn.execute(f'DELETE FROM {self.table} WHERE owner = ? AND conversation_id = ?',
+                                 (owner, conversation_id))
+                    self._count('expired')
+                    row = None
+                if row:
+                    session.load(json.loads(row[0]))
+                    session.updated_at = now
+                    conn.execute(f'UPDATE {self.table} SET updated_at = ? WHERE owner = ? AND conversation_id = ?',
+                                 (now, owner, conversation_id))
+                    self._count('resumed')
+                    return session
+
+                for msg in seed_history or []:
+                    if msg.get('role') and msg.get('content'):
+                        session.turns.append({'role': msg['role'], 'content': msg['content'],
+                                              'tokens': estimate_tokens(msg['content'])})
+                self._write(conn, session, now)
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            print(f"Conversation session read error: {str(e)}")
+            self._count('errors')
+        self._count('created')
+        return session
+
+    def update(self, session, change):
+        """Apply change() to the stored state of session in one transaction and return its result"""
+        applied = False
+        try:
+            conn = self._connect()
+            try:
+                conn.execute('BEGIN IMMEDIATE')
+                try:
+                    row = conn.execute(
+                        f'SELECT state FROM {self.table} WHERE owner = ? AND conversation_id = ?',
+                        (session.owner, session.id)
+                    ).fetchone()
+                    if row:
+                        session.load(json.loads(row[0]))
+                    result = change()
+                    applied = True
+                    self._write(conn, session, time.time())
+                    conn.execute('COMMIT')
+                except Exception:
+                    conn.execute('ROLLBACK')
+                    raise
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            # The change still applies to this request's copy of the session
+            print(f"Conversation session write error: {str(e)}")
+            self._count('errors')
+            if not applied:
+                result = change()
+        return result
+
+    def drop(self, owner, conversation_id):
+        try:
+            conn = self._connect()
+            try:
+                return conn.execute(f'DELETE FROM {self.table} WHERE owner = ? AND conversation_id = ?',
+                                    (str(owner or ''), conversation_id)).rowcount > 0
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            print(f"Conversation session write error: {str(e)}")
+            return False
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        try:
+            conn = self._connect()
+            try:
+                stats['active'] = conn.execute(f'SELECT COUNT(*) FROM {self.table}').fetchone()[0]
+            finally:
+                conn.close()
+        except sqlite3.Error:
+            stats['active'] = None
+        return stats
+
+
+# Shared store for the web and extension chat routes
+store = SessionStore()
@@ -0,0 +1,38 @@
+"""
+Fact-check engine shared by every channel
+File: fact_engine/__init__.py
+
+The web app (app.py), the browser extension's URL check (tested2.py) and the
+WhatsApp bot (whatsapp_bot.py) are thin adapters over this package, so within a
+process they share the scrape scheduler and cache, the pooled search session
+and the LLM gateway, and across processes the evidence and verdict tables in
+the shared cache database:
+- sources: URL detection, scraping, Serper/DuckDuckGo search
+- evidence: cached, multilingual search evidence for a claim
+- verdicts: verdicts recorded by one channel and reused by the others
+- claim_index: near-duplicate lookup of settled claims
+- scan: batch checks of the claims found on a page
+- budget: per-client limit on checks that reach the search APIs and the LLM
+- responses: parsing model output into verdicts
+"""
+
+from llm_gateway import generate
+
+from . import budget, evidence, scan, sources, verdicts
+from .evidence import gather
+from .responses import extract_verdict_and_confidence, parse_response
+from .sources import (
+    detect_urls,
+    is_scrape_error,
+    merge_search_results,
+    scrape_twitter_content,
+    scrape_url_content,
+    search,
+    search_duckduckgo,
+    search_in_english,
+    search_serper,
+)
+
+
+def stats():
+    return {'evidence': evidence.stats(), 'verdicts': verdicts.stats(), 'scans': scan.stats(), 'budget': budget.stats()}
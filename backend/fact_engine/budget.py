@@ -0,0 +1,60 @@
+"""
+Per-client budget for model-backed checks
+File: fact_engine/budget.py
+
+Every check that can reach the search APIs and the LLM spends one token from
+its client's bucket: a conversational fact-check, or one claim of a page scan
+that the verdict store cannot answer. Each client gets FACT_CLIENT_RATE checks
+per minute, bursting to FACT_CLIENT_BURST, so one caller cannot use up the
+shared model quota. Answers from the verdict store are free. Callers identify
+the client (JWT identity, else address); buckets of the least recently seen
+clients are dropped past FACT_MAX_CLIENTS.
+"""
+
+import os
+import threading
+from collections import OrderedDict
+
+from scrape_scheduler import TokenBucket
+
+FACT_CLIENT_RATE = float(os.getenv('FACT_CLIENT_RATE', '20'))  # checks per minute per client
+FACT_CLIENT_BURST = int(os.getenv('FACT_CLIENT_BURST', '50'))  # enough for one full page scan
+FACT_MAX_CLIENTS = int(os.getenv('FACT_MAX_CLIENTS', '10000'))
+
+_buckets = OrderedDict()
+_lock = threading.Lock()
+_stats = {'spent': 0, 'denied': 0}
+
+
+def _bucket(client):
+    with _lock:
+        bucket = _buckets.get(client)
+        if bucket is None:
+            bucket = TokenBucket(FACT_CLIENT_RATE / 60.0, FACT_CLIENT_BURST)
+            _buckets[client] = bucket
+            while len(_buckets) > FACT_MAX_CLIENTS:
+                _buckets.popitem(last=False)
+        _buckets.move_to_end(client)
+        return bucket
+
+
+def spend(client):
+    """Take one check from client's budget; returns False if it is used up"""
+    allowed = _bucket(client).try_acquire()
+    with _lock:
+        _stats['spent' if allowed else 'denied'] += 1
+    return allowed
+
+
+def retry_after():
+    """Seconds until a client that is out of budget can check again"""
+    return max(1, int(round(60.0 / FACT_CLIENT_RATE))) if FACT_CLIENT_RATE > 0 else 60
+
+
+def stats():
+    with _lock:
+        result = dict(_stats)
+        result['clients'] = len(_buckets)
+    result['per_minute'] = FACT_CLIENT_RATE
+    result['burst'] = FACT_CLIENT_BURST
+    return result
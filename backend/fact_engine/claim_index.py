@@ -0,0 +1,190 @@
+"""
+Near-duplicate index of settled claims
+File: fact_engine/claim_index.py
+
+Every recorded verdict is also indexed by a 64-bit SimHash of its claim's
+(crudely stemmed) content words, with the same multi-index hashing media_index uses for image
+hashes, so a reworded copy of a settled claim ("5G towers spread covid" /
+"5G towers are spreading COVID") finds its verdict in well under a
+millisecond. SimHash alone cannot tell a claim from its negation or from the
+same sentence with other numbers, so candidates must also share most of
+their words and exactly the same negations and numbers.
+
+The index lives in memory and is loaded from the shared cache database, then
+refreshed with rows other processes added every CLAIM_INDEX_REFRESH seconds.
+"""
+
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+
+from media_index import MultiIndexHash
+from conversation_sessions import claim_key
+from url_utils import CACHE_DB_PATH
+
+CLAIM_MATCH_DISTANCE = int(os.getenv('CLAIM_MATCH_DISTANCE', '6'))
+CLAIM_MIN_OVERLAP = float(os.getenv('CLAIM_MIN_OVERLAP', '0.8'))
+CLAIM_INDEX_REFRESH = int(os.getenv('CLAIM_INDEX_REFRESH', '60'))
+CLAIM_INDEX_TTL = int(os.getenv('FACT_VERDICT_TTL', str(24 * 3600)))
+
+WORD_PATTERN = re.compile(r"[^\W_]+(?:'[^\W_]+)?")
+NEGATIONS = {'no', 'not', 'never', 'none', 'nobody', 'nothing', 'neither', 'nor', 'without'}
+STOPWORDS = {'a', 'an', 'the', 'is', 'are', 'was', 'were', 'be', 'been', 'of', 'to', 'in', 'on', 'at', 'by', 'for', 'with',
+             'from', 'as', 'and', 'it', 'that', 'this'}
+SUFFIXES = ('ing', 'ed', 'es', 's')
+
+_db_lock = threading.Lock()
+_db_ready = False
+
+
+def _connect():
+    global _db_ready
+    conn = sqlite3.connect(CACHE_DB_PATH, timeout=10)
+    if not _db_ready:
+        with _db_lock:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS claim_simhashes ('
+                'key_hash TEXT PRIMARY KEY, simhash TEXT NOT NULL, claim TEXT NOT NULL, created_at REAL NOT NULL)'
+            )
+            conn.execute('CREATE INDEX IF NOT EXISTS claim_simhashes_created ON claim_simhashes (created_at)')
+            conn.commit()
+            _db_ready = True
+    return conn
+
+
+def words(claim):
+    return WORD_PATTERN.findall(claim_key(claim))
+
+
+def _stem(word):
+    for suffix in SUFFIXES:
+        if word.endswith(suffix) and len(word) - len(suffix) >= 3:
+            return word[:-len(suffix)]
+    return word
+
+
+def content_words(tokens):
+    return {_stem(t) for t in tokens if t not in STOPWORDS}
+
+
+def _polarity(tokens):
+    """Negations and numbers: claims that differ in these are different claims"""
+    return (frozenset(t for t in tokens if t in NEGATIONS or t.endswith("n't")),
+            frozenset(t for t in tokens if any(c.isdigit() for c in t)))
+
+
+def simhash(claim):
+    """64-bit SimHash over the claim's content words (word order is ignored)"""
+    weights = [0] * 64
+    for feature in content_words(words(claim)):
+        value = int.from_bytes(hashlib.blake2b(feature.encode('utf-8'), digest_size=8).digest(), 'big')
+        for bit in range(64):
+            weights[bit] += 1 if value >> bit & 1 else -1
+    return sum(1 << bit for bit, weight in enumerate(weights) if weight > 0)
+
+
+def same_claim(a, b):
+    """Whether two claims whose SimHashes are close really say the same thing"""
+    tokens_a, tokens_b = words(a), words(b)
+    if _polarity(tokens_a) != _polarity(tokens_b):
+        return False
+    set_a, set_b = content_words(tokens_a), content_words(tokens_b)
+    if not set_a or not set_b:
+        return False
+    return len(set_a & set_b) / len(set_a | set_b) >= CLAIM_MIN_OVERLAP
+
+
+class ClaimIndex:
+    """Thread-safe SimHash index of settled claims, loaded lazily and refreshed from sqlite"""
+
+    def __init__(self):
+        self.hashes = MultiIndexHash()
+        self.keys = set()
+        self.lock = threading.Lock()
+        self.loaded_until = 0.0
+        self.refreshed_at = 0.0
+        self.stats = {'indexed': 0, 'lookups': 0, 'matches': 0, 'rejected': 0, 'lookup_ms_total': 0.0}
+
+    def _refresh(self):
+        """Index rows added (by any process) since the last refresh"""
+        now = time.time()
+        if now - self.refreshed_at < CLAIM_INDEX_REFRESH:
+            return
+        self.refreshed_at = now
+        since = max(self.loaded_until, now - CLAIM_INDEX_TTL)
+        try:
+            conn = _connect()
+            try:
+                rows = conn.execute(
+                    'SELECT key_hash, simhash, claim, created_at FROM claim_simhashes WHERE created_at > ? '
+                    'ORDER BY created_at', (since,)
+                ).fetchall()
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            print(f"Claim index could not load: {str(e)}")
+            return
+        for key_hash, value, claim, created_at in rows:
+            self._add(int(value, 16), key_hash, claim)
+            self.loaded_until = max(self.loaded_until, created_at)
+
+    def _add(self, value, key_hash, claim):
+        if key_hash in self.keys:
+            return
+        self.keys.add(key_hash)
+        self.hashes.add(value, {'key_hash': key_hash, 'claim': claim})
+        self.stats['indexed'] += 1
+
+    def add(self, claim, key_hash):
+        """Index a settled claim under the key of its verdict"""
+        value = simhash(claim)
+        now = time.time()
+        try:
+            conn = _connect()
+            try:
+                conn.execute(
+                    'INSERT OR REPLACE INTO claim_simhashes (key_hash, simhash, claim, created_at) VALUES (?, ?, ?, ?)',
+                    (key_hash, f'{value:016x}', claim_key(claim), now)
+                )
+                conn.commit()
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            print(f"Claim index write error: {str(e)}")
+        with self.lock:
+            self._add(value, key_hash, claim_key(claim))
+
+    def lookup(self, claim, radius=CLAIM_MATCH_DISTANCE):
+        """[(distance, key_hash)] of settled claims that say the same as claim, nearest first"""
+        started = time.perf_counter()
+        value = simhash(claim)
+        with self.lock:
+            self._refresh()
+            found = self.hashes.search(value, radius)
+        matches = []
+        rejected = 0
+        for distance, item in found:
+            if same_claim(claim, item['claim']):
+                matches.append((distance, item['key_hash']))
+            else:
+                rejected += 1
+        with self.lock:
+            self.stats['lookups'] += 1
+            self.stats['matches'] += bool(matches)
+            self.stats['rejected'] += rejected
+            self.stats['lookup_ms_total'] += (time.perf_counter() - started) * 1000
+        return matches
+
+    def snapshot(self):
+        with self.lock:
+            stats = dict(self.stats)
+            stats['distinct_hashes'] = self.hashes.size
+        lookups = stats['lookups'] or 1
+        stats['mean_lookup_ms'] = round(stats.pop('lookup_ms_total') / lookups, 4)
+        return stats
+
+
+index = ClaimIndex()
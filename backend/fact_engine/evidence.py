@@ -0,0 +1,143 @@
+"""
+Search evidence for a claim, shared by every channel
+File: fact_engine/evidence.py
+
+gather(claim, language) searches for a claim in its own language and, for
+non-English claims, in English as well (both searches run concurrently) and
+formats the merged results into the snippet summary the prompts use. Results
+are kept in the shared cache database for FACT_EVIDENCE_TTL seconds, so the
+web app, the extension and the WhatsApp bot (a separate process) answer a
+repeated claim without searching again.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import language_id
+from conversation_sessions import claim_key
+from url_utils import CACHE_DB_PATH
+
+from . import sources
+
+FACT_EVIDENCE_TTL = int(os.getenv('FACT_EVIDENCE_TTL', '3600'))
+FACT_EVIDENCE_RESULTS = int(os.getenv('FACT_EVIDENCE_RESULTS', '5'))
+NO_EVIDENCE = "No reliable real-time data found."
+
+_db_lock = threading.Lock()
+_db_ready = False
+_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix='evidence')
+_stats_lock = threading.Lock()
+_stats = {'requests': 0, 'cache_hits': 0, 'searches': 0, 'english_searches': 0, 'empty': 0, 'errors': 0}
+
+
+def _count(key, n=1):
+    with _stats_lock:
+        _stats[key] += n
+
+
+def _connect():
+    global _db_ready
+    conn = sqlite3.connect(CACHE_DB_PATH, timeout=10)
+    if not _db_ready:
+        with _db_lock:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS fact_evidence ('
+                'claim_key TEXT NOT NULL, language TEXT NOT NULL, results TEXT NOT NULL, '
+                'created_at REAL NOT NULL, PRIMARY KEY (claim_key, language))'
+            )
+            conn.commit()
+            _db_ready = True
+    return conn
+
+
+def _cache_get(key, language):
+    try:
+        conn = _connect()
+        try:
+            row = conn.execute(
+                'SELECT results FROM fact_evidence WHERE claim_key = ? AND language = ? AND created_at > ?',
+                (key, language, time.time() - FACT_EVIDENCE_TTL)
+            ).fetchone()
+        finally:
+            conn.close()
+    except sqlite3.Error as e:
+        print(f"Evidence cache read error: {str(e)}")
+        return None
+    return json.loads(row[0]) if row else None
+
+
+def _cache_set(key, language, results):
+    try:
+        conn = _connect()
+        try:
+            conn.execute(
+                'INSERT OR REPLACE INTO fact_evidence (claim_key, language, results, created_at) VALUES (?, ?, ?, ?)',
+                (key, language, json.dumps(results), time.time())
+            )
+            conn.commit()
+        finally:
+            conn.close()
+    except sqlite3.Error as e:
+        print(f"Evidence cache write error: {str(e)}")
+
+
+def summarize(results):
+    """One 'title: snippet (link)' line per result, as the prompts expect"""
+    lines = []
+    for item in results:
+        link = item.get("link", "")
+        lines.append(f"{item.get('title', '')}: {item.get('snippet', '')}" + (f" ({link})" if link else ""))
+    return "\n".join(lines) if lines else NO_EVIDENCE
+
+
+def _search(claim, language, num_results):
+    native = _executor.submit(sources.search, claim, num_results, language)
+    english = None
+    if language and not language_id.same_language(language, 'en'):
+        english = _executor.submit(sources.search_in_english, claim, language, num_results)
+        _count('english_searches')
+    _count('searches')
+    result_lists = []
+    for future in (native, english):
+        if future is None:
+            continue
+        try:
+            result_lists.append(future.result())
+        except Exception as e:
+            print(f"Evidence search error: {str(e)}")
+            _count('errors')
+    return sources.merge_search_results(*result_lists)
+
+
+def gather(claim, language=None, num_results=FACT_EVIDENCE_RESULTS):
+    """
+    Search evidence for claim: {'results': [{'title', 'snippet', 'link'}],
+    'live_summary': str, 'cached': bool}. language defaults to the detected
+    language of the claim.
+    """
+    _count('requests')
+    if language is None:
+        language = language_id.detect_confident(claim)
+    key = claim_key(claim)
+    results = _cache_get(key, language or '')
+    cached = results is not None
+    if cached:
+        _count('cache_hits')
+    else:
+        results = _search(claim, language, num_results)
+        if results:
+            _cache_set(key, language or '', results)
+        else:
+            _count('empty')
+    return {'results': results, 'live_summary': summarize(results), 'cached': cached}
+
+
+def stats():
+    with _stats_lock:
+        result = dict(_stats)
+    result['search_cache'] = sources.search_cache.stats()
+    return result
@@ -0,0 +1,82 @@
+"""
+Parsing of model output into verdicts
+File: fact_engine/responses.py
+"""
+
+import json
+import re
+
+VERDICT_PATTERN = r'VERDICT:\s*(PARTIALLY TRUE|TRUE|FALSE|MISLEADING|UNVERIFIABLE)'
+
+
+def parse_response(ai_raw, live_summary):
+    """
+    The JSON fact-check response in ai_raw (bare or in a markdown code block) as
+    a dict with agent_response, verdict, integer confidence_score and
+    evidence_summary; plain text becomes a NONE verdict.
+    """
+    parsed = None
+    try:
+        # Try to extract JSON from markdown code blocks first
+        json_match = re.search(r'```(?:json)?\s*(\{[\s\S]*?\})\s*```', ai_raw)
+        if json_match:
+            json_str = json_match.group(1).strip()
+        else:
+            # Try to find JSON object in the response
+            json_match = re.search(r'(\{[\s\S]*\})', ai_raw)
+            json_str = json_match.group(1).strip() if json_match else ai_raw
+        parsed = json.loads(json_str)
+    except (json.JSONDecodeError, AttributeError) as e:
+        print(f"JSON parsing error: {e}")
+        print(f"Full raw response: {ai_raw}")
+        # Try to create a structured response from plain text
+        parsed = {
+            "agent_response": ai_raw,
+            "verdict": "NONE",
+            "confidence_score": 0,
+            "evidence_summary": live_summary
+        }
+
+    # Ensure all required fields exist
+    if not isinstance(parsed, dict):
+        parsed = {
+            "agent_response": str(parsed),
+            "verdict": "NONE",
+            "confidence_score": 0,
+            "evidence_summary": live_summary
+        }
+
+    # Ensure confidence_score is an integer (e.g. "85%" -> 85)
+    score = parsed.get("confidence_score", 0)
+    if isinstance(score, str):
+        score_str = re.search(r'\d+', score)
+        score = int(score_str.group()) if score_str else 0
+    else:
+        try:
+            score = int(score)
+        except (ValueError, TypeError):
+            score = 0
+    parsed["confidence_score"] = score
+
+    # Ensure other required fields exist
+    parsed.setdefault("agent_response", "No response generated")
+    parsed.setdefault("verdict", "NONE")
+    parsed.setdefault("evidence_summary", live_summary)
+    return parsed
+
+
+def extract_verdict_and_confidence(analysis_text):
+    """Verdict and confidence from 'VERDICT: ...' / 'CONFIDENCE: N%' lines"""
+    verdict = "UNKNOWN"
+    verdict_match = re.search(VERDICT_PATTERN, analysis_text, re.IGNORECASE)
+    if verdict_match:
+        verdict = verdict_match.group(1).upper()
+
+    # Extract confidence if mentioned, otherwise estimate from the verdict
+    confidence_match = re.search(r'CONFIDENCE:\s*(\d+)\s*%', analysis_text, re.IGNORECASE)
+    if confidence_match:
+        confidence = int(confidence_match.group(1))
+    else:
+        confidence = 85 if verdict in ["TRUE", "FALSE"] else 0
+
+    return verdict, confidence
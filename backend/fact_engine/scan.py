@@ -0,0 +1,159 @@
+"""
+Whole-page claim scans
+File: fact_engine/scan.py
+
+scan(claims) checks every candidate claim extracted from a page:
+- claims that normalise to the same text are checked once
+- claims settled before on any channel, or reworded copies of them (see
+  claim_index), are answered from the verdict store straight away
+- only the misses run the full check (search evidence, NLI tier, LLM), at
+  most SCAN_CONCURRENCY at a time, and each one must first be allowed by the
+  caller's budget (see budget); the rest are reported as throttled
+
+Results are yielded as soon as each one is known, so the caller can stream
+them: store hits first, then checked claims in order of completion.
+"""
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import nli_cascade
+from llm_gateway import generate
+
+from . import verdicts
+from .evidence import gather
+from .responses import parse_response
+
+SCAN_MAX_CLAIMS = int(os.getenv('SCAN_MAX_CLAIMS', '50'))
+SCAN_MAX_CHARS = int(os.getenv('SCAN_MAX_CHARS', '500'))
+SCAN_CONCURRENCY = int(os.getenv('SCAN_CONCURRENCY', '4'))
+
+_executor = ThreadPoolExecutor(max_workers=SCAN_CONCURRENCY, thread_name_prefix='scan')
+_stats_lock = threading.Lock()
+_stats = {'scans': 0, 'claims': 0, 'skipped': 0, 'cached': 0, 'near_duplicates': 0, 'checked': 0, 'throttled': 0,
+          'errors': 0}
+
+CHECK_PROMPT = """You are a fact-checker. Decide whether the claim below, taken from a web page, is supported by the search evidence.
+
+Verdicts: TRUE (evidence strongly supports), FALSE (evidence contradicts), MISLEADING, PARTIALLY TRUE,
+or UNVERIFIABLE (insufficient or conflicting evidence).
+
+CLAIM:
+{claim}
+
+SEARCH EVIDENCE:
+{evidence}
+
+Return ONLY valid JSON, no markdown code blocks:
+{{
+ "agent_response": "<one or two sentences explaining the verdict>",
+ "verdict": "TRUE | FALSE | MISLEADING | PARTIALLY TRUE | UNVERIFIABLE",
+ "confidence_score": <0-100>,
+ "evidence_summary": "<the evidence that decided it>"
+}}"""
+
+
+def _count(key, n=1):
+    with _stats_lock:
+        _stats[key] += n
+
+
+def check_claim(claim, channel='extension'):
+    """Full check of one claim; records LLM verdicts for every channel. Returns {'response', 'tier'}"""
+    evidence = gather(claim)
+    live_summary = evidence['live_summary']
+    nli_result = None
+    if evidence['results']:
+        nli_result = nli_cascade.prescreen(
+            claim, [f"{item.get('title', '')}: {item.get('snippet', '')}" for item in evidence['results']]
+        )
+    prompt = CHECK_PROMPT.format(claim=claim, evidence=live_summary)
+    if nli_result and nli_result['decision']:
+        tier = 'nli'
+        parsed = nli_cascade.as_fact_check_response(nli_result, live_summary)
+        nli_cascade.maybe_shadow(nli_result['decision'], lambda: generate(prompt))
+    else:
+        tier = 'llm'
+        parsed = parse_response(generate(prompt).strip(), live_summary)
+    if evidence['results'] and tier == 'llm':
+        # NLI verdicts stay out of the store every channel trusts
+        verdicts.record(claim, parsed['verdict'], parsed['confidence_score'], str(parsed['agent_response']),
+                        live_summary, channel)
+    return {'response': parsed, 'tier': tier}
+
+
+def _stored_response(cached):
+    return {
+        'agent_response': cached['response'],
+        'verdict': cached['verdict'],
+        'confidence_score': cached['confidence'],
+        'evidence_summary': cached['evidence']
+    }
+
+
+def scan(claims, channel='extension', allow=None):
+    """
+    Generator of one result per claim: {'index', 'claim', 'status', ...} where
+    status is 'cached' (with 'match': 'exact' or 'near'), 'checked', 'skipped'
+    (too short to be a claim), 'throttled' (allow() refused the check) or
+    'error'. allow(), if given, is called once per claim that needs a full
+    check. Raises ValueError for invalid batches before anything is checked.
+    """
+    if not isinstance(claims, list) or not all(isinstance(c, str) for c in claims):
+        raise ValueError('claims must be a list of strings')
+    if len(claims) > SCAN_MAX_CLAIMS:
+        raise ValueError(f'At most {SCAN_MAX_CLAIMS} claims per scan')
+    if any(len(c) > SCAN_MAX_CHARS for c in claims):
+        raise ValueError(f'Claims must be at most {SCAN_MAX_CHARS} characters')
+    _count('scans')
+    _count('claims', len(claims))
+    return _scan(claims, channel, allow)
+
+
+def _scan(claims, channel, allow):
+    # Identical claims (after normalisation) share one lookup and one check
+    groups = {}
+    results = []
+    for index, claim in enumerate(claims):
+        key_hash = verdicts.claim_hash(claim)
+        if key_hash is None:
+            results.append({'index': index, 'claim': claim, 'status': 'skipped'})
+        else:
+            groups.setdefault(key_hash, []).append(index)
+    _count('skipped', len(results))
+
+    # Start every miss before answering the hits, so the checks overlap with the stream
+    misses = {}
+    for indexes in groups.values():
+        cached = verdicts.lookup_similar(claims[indexes[0]])
+        if cached is None and allow is not None and not allow():
+            _count('throttled', len(indexes))
+            results.extend({'index': index, 'claim': claims[index], 'status': 'throttled'} for index in indexes)
+            continue
+        if cached is None:
+            misses[_executor.submit(check_claim, claims[indexes[0]], channel)] = indexes
+            continue
+        _count('near_duplicates' if cached['match'] == 'near' else 'cached', len(indexes))
+        results.extend({'index': index, 'claim': claims[index], 'status': 'cached', 'match': cached['match'],
+                        'response': _stored_response(cached), 'tier': 'cache'} for index in indexes)
+    _count('checked', len(misses))
+    yield from results
+
+    for future in as_completed(misses):
+        indexes = misses[future]
+        try:
+            result = future.result()
+        except Exception as e:
+            print(f"Scan check error: {str(e)}")
+            _count('errors')
+            for index in indexes:
+                yield {'index': index, 'claim': claims[index], 'status': 'error', 'error': str(e)}
+            continue
+        for index in indexes:
+            yield {'index': index, 'claim': claims[index], 'status': 'checked', **result}
+
+
+def stats():
+    with _stats_lock:
+        return dict(_stats)
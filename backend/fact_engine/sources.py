@@ -0,0 +1,264 @@
+"""
+Evidence sources: URL detection, scraping and web search
+File: fact_engine/sources.py
+
+Scrapes go through scrape_scheduler (per-domain pacing, shared in-flight
+fetches, scraped-text cache). Searches share one pooled HTTP session and a
+short-lived result cache, so the web routes, the extension and the WhatsApp
+bot reuse each other's results within a process.
+"""
+
+import os
+import time
+
+import requests
+from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
+
+import language_id
+import scrape_scheduler
+import url_utils
+
+SERPER_API_KEY = os.getenv('SERPER_API_KEY')
+SCRAPE_MAX_CHARS = int(os.getenv('FACT_SCRAPE_MAX_CHARS', '8000'))
+SELENIUM_PAGE_TIMEOUT = float(os.getenv('FACT_SELENIUM_PAGE_TIMEOUT', '15'))
+SEARCH_CACHE_TTL = int(os.getenv('FACT_SEARCH_CACHE_TTL', '600'))
+SEARCH_CACHE_SIZE = int(os.getenv('FACT_SEARCH_CACHE_SIZE', '1000'))
+SCRAPE_ERROR_PREFIXES = ("Error scraping", "Chrome WebDriver error", "Could not extract", "Timeout while loading")
+BROWSER_USER_AGENT = ('Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 '
+                      '(KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36')
+
+search_cache = scrape_scheduler.ResultCache(SEARCH_CACHE_TTL, SEARCH_CACHE_SIZE)
+
+_session = requests.Session()
+_session.mount('https://', HTTPAdapter(pool_connections=4, pool_maxsize=16))
+
+
+def detect_urls(text):
+    """Detect URLs in text and return their canonical forms (short links resolved)"""
+    return url_utils.extract_urls(text)
+
+
+def is_scrape_error(text):
+    return not text or text.startswith(SCRAPE_ERROR_PREFIXES)
+
+
+def scrape_url_content(url, max_chars=SCRAPE_MAX_CHARS, deadline=None):
+    """
+    Extract text content from a URL (cached on the canonical URL), cut to
+    max_chars. With a deadline (a time.monotonic() instant) every wait and the
+    page load end by then, and an error text is returned instead.
+    """
+    text = scrape_scheduler.cached_scrape(
+        url_utils.normalize_url(url),
+        lambda target: _scrape_url_uncached(target, deadline),
+        is_error=is_scrape_error
+    )
+    if max_chars and text and len(text) > max_chars and not is_scrape_error(text):
+        text = text[:max_chars] + "... [content truncated]"
+    return text
+
+
+def _scrape_url_uncached(url, deadline=None):
+    """Extract text content from a URL"""
+    try:
+        # Check if it's an X/Twitter URL
+        if 'twitter.com' in url or 'x.com' in url:
+            return scrape_scheduler.run(url, lambda: scrape_twitter_content(url, deadline), deadline=deadline)
+
+        # Regular HTTP scraping for other sites (paced per domain, shared while in flight)
+        response = scrape_scheduler.fetch(url, headers={'User-Agent': BROWSER_USER_AGENT}, timeout=10, deadline=deadline)
+        response.raise_for_status()
+
+        soup = BeautifulSoup(response.content, 'html.parser')
+
+        # Remove script and style elements
+        for script in soup(['script', 'style', 'nav', 'footer', 'header']):
+            script.decompose()
+
+        # Clean up text
+        lines = (line.strip() for line in soup.get_text().splitlines())
+        chunks = (phrase.strip() for line in lines for phrase in line.split("  "))
+        text = ' '.join(chunk for chunk in chunks if chunk)
+
+        # The cache keeps the longest text any channel uses
+        if len(text) > SCRAPE_MAX_CHARS:
+            text = text[:SCRAPE_MAX_CHARS]
+        return text
+    except Exception as e:
+        return f"Error scraping URL: {str(e)}"
+
+
+def scrape_twitter_content(url, deadline=None):
+    """
+    Scrape X/Twitter content using Selenium. The page load is bounded by
+    SELENIUM_PAGE_TIMEOUT, cut to the time left before deadline.
+    """
+    from selenium import webdriver
+    from selenium.webdriver.chrome.options import Options
+    from selenium.webdriver.chrome.service import Service
+    from selenium.webdriver.common.by import By
+    from selenium.common.exceptions import TimeoutException, WebDriverException
+    from webdriver_manager.chrome import ChromeDriverManager
+
+    try:
+        # Setup Chrome options with additional stability flags
+        chrome_options = Options()
+        chrome_options.add_argument('--headless=new')
+        chrome_options.add_argument('--no-sandbox')
+        chrome_options.add_argument('--disable-dev-shm-usage')
+        chrome_options.add_argument('--disable-gpu')
+        chrome_options.add_argument('--disable-software-rasterizer')
+        chrome_options.add_argument('--disable-extensions')
+        chrome_options.add_argument('--disable-logging')
+        chrome_options.add_argument('--log-level=3')
+        chrome_options.add_argument('--window-size=1920,1080')
+        chrome_options.add_argument('--remote-debugging-port=9222')
+        chrome_options.add_argument('user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/142.0.0.0 Safari/537.36')
+        chrome_options.add_experimental_option('excludeSwitches', ['enable-logging'])
+
+        page_timeout = SELENIUM_PAGE_TIMEOUT
+        if deadline is not None:
+            page_timeout = min(page_timeout, deadline - time.monotonic())
+        if page_timeout <= 0:
+            return "Timeout while loading tweet: no time left before the deadline."
+
+        # Initialize driver with webdriver-manager (auto-detects correct version)
+        service = Service(ChromeDriverManager().install())
+        driver = webdriver.Chrome(service=service, options=chrome_options)
+
+        try:
+            driver.set_page_load_timeout(page_timeout)
+            driver.set_script_timeout(page_timeout)
+            driver.get(url)
+
+            # Try to find tweet text (multiple selectors as X changes them frequently)
+            tweet_selectors = [
+                "article[data-testid='tweet']",
+                "div[data-testid='tweetText']",
+                "div[lang]",
+                "article div[lang]"
+            ]
+
+            content = ""
+            for selector in tweet_selectors:
+                try:
+                    elements = driver.find_elements(By.CSS_SELECTOR, selector)
+                    if elements:
+                        for elem in elements[:3]:  # Get first 3 matching elements
+                            text = elem.text.strip()
+                            if text and len(text) > 10:  # Ignore very short matches
+                                content += text + "\n\n"
+                        if content:
+                            break
+                except Exception:
+                    continue
+
+            if content:
+                return content.strip()
+            return "Could not extract tweet content. The page structure may have changed or the tweet may be protected."
+
+        except TimeoutException:
+            return "Timeout while loading tweet. The tweet may be protected or deleted."
+        finally:
+            driver.quit()
+
+    except WebDriverException as e:
+        return f"Chrome WebDriver error: Please restart the backend server. Error: {str(e)}"
+    except Exception as e:
+        return f"Error scraping Twitter/X: {str(e)}"
+
+
+# -----------------------------------------------------------------------------
+# Search
+# -----------------------------------------------------------------------------
+
+def _cached_search(key, search_fn):
+    results = search_cache.get(key)
+    if results is None:
+        results = search_fn()
+        if results:
+            search_cache.set(key, results)
+    return results
+
+
+def search_serper(query, api_key=None, num_results=5, language=None):
+    """Search Google through Serper and return the top organic results (localised to language, if given)"""
+    api_key = api_key or SERPER_API_KEY
+
+    def run():
+        payload = {"q": query}
+        locale = language_id.search_locale(language)
+        if locale:
+            payload["hl"], payload["gl"] = locale[0], locale[1]
+        response = _session.post(
+            "https://google.serper.dev/search",
+            json=payload,
+            headers={"X-API-KEY": api_key, "Content-Type": "application/json"},
+            timeout=10
+        )
+        return response.json().get("organic", [])[:num_results]
+
+    return _cached_search(('serper', query, language, num_results), run)
+
+
+def search_duckduckgo(query, max_results=5, language=None):
+    """Search DuckDuckGo for real-time information (in the region of language, if given)"""
+    from duckduckgo_search import DDGS
+
+    def run():
+        locale = language_id.search_locale(language)
+        try:
+            with DDGS() as ddgs:
+                return [
+                    {'title': r.get('title', ''), 'body': r.get('body', ''), 'url': r.get('href', '')}
+                    for r in ddgs.text(query, region=locale[2] if locale else 'wt-wt', max_results=max_results)
+                ]
+        except Exception as e:
+            print(f"DuckDuckGo search error: {str(e)}")
+            return []
+
+    return _cached_search(('ddg', query, language, max_results), run)
+
+
+def search(query, num_results=5, language=None):
+    """
+    Organic results as [{'title', 'snippet', 'link'}]: Serper when an API key
+    is configured, DuckDuckGo otherwise.
+    """
+    if SERPER_API_KEY:
+        return search_serper(query, num_results=num_results, language=language)
+    return [
+        {'title': r['title'], 'snippet': r['body'], 'link': r['url']}
+        for r in search_duckduckgo(query, max_results=num_results, language=language)
+    ]
+
+
+def english_search_query(query, language):
+    """English translation of a non-English claim, to search English sources as well; None otherwise"""
+    import translation
+
+    if not language or language_id.same_language(language, 'en'):
+        return None
+    translations, details = translation.translate_many([query[:translation.TRANSLATE_MAX_CHARS]], 'en')
+    return None if details['failed'] else translations[0]
+
+
+def search_in_english(query, language, num_results=5):
+    """Results for the English translation of a claim ([] if it could not be translated)"""
+    english_query = english_search_query(query, language)
+    return search(english_query, num_results=num_results, language='en') if english_query else []
+
+
+def merge_search_results(*result_lists):
+    """Concatenate organic results, dropping repeated links"""
+    seen = set()
+    merged = []
+    for results in result_lists:
+        for item in results or []:
+            link = item.get("link")
+            if link and link in seen:
+                continue
+            seen.add(link)
+            merged.append(item)
+    return merged
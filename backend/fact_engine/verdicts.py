@@ -0,0 +1,191 @@
+"""
+Verdicts shared across channels
+File: fact_engine/verdicts.py
+
+Every channel records the verdicts it reaches and looks claims up before
+checking them, so a claim settled on the web is answered from here when it is
+forwarded on WhatsApp (and the other way round). Verdicts live in the shared
+cache database for FACT_VERDICT_TTL seconds, keyed by a hash of the
+normalised claim text (claim_hash) or of the canonical URL of a checked page
+(url_hash), so clients can look them up without sending the claim itself.
+Claims are also indexed for near-duplicate lookups (see claim_index).
+Only definite verdicts with at least FACT_VERDICT_MIN_CONFIDENCE are kept;
+UNVERIFIABLE claims are checked again, since new evidence may settle them.
+Lookups are a single read, so they stay in the low milliseconds.
+"""
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+import url_utils
+from conversation_sessions import claim_key
+from url_utils import CACHE_DB_PATH
+
+from .claim_index import index as claim_index
+
+FACT_VERDICT_TTL = int(os.getenv('FACT_VERDICT_TTL', str(24 * 3600)))
+FACT_VERDICT_MIN_CONFIDENCE = int(os.getenv('FACT_VERDICT_MIN_CONFIDENCE', '60'))
+FACT_VERDICT_MIN_CHARS = int(os.getenv('FACT_VERDICT_MIN_CHARS', '20'))  # shorter messages are not claims
+CACHEABLE_VERDICTS = {'TRUE', 'FALSE', 'MISLEADING', 'PARTIALLY TRUE'}
+
+_db_lock = threading.Lock()
+_db_ready = False
+_stats_lock = threading.Lock()
+_stats = {'lookups': 0, 'hits': 0, 'misses': 0, 'recorded': 0, 'skipped': 0}
+
+
+def _count(key, n=1):
+    with _stats_lock:
+        _stats[key] += n
+
+
+def _connect():
+    global _db_ready
+    conn = sqlite3.connect(CACHE_DB_PATH, timeout=10)
+    if not _db_ready:
+        with _db_lock:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS verdicts ('
+                'key_hash TEXT PRIMARY KEY, verdict TEXT NOT NULL, confidence INTEGER NOT NULL, '
+                'response TEXT NOT NULL, evidence TEXT NOT NULL, channel TEXT NOT NULL, created_at REAL NOT NULL)'
+            )
+            conn.commit()
+            _db_ready = True
+    return conn
+
+
+def claim_hash(claim):
+    """Key of a claim: SHA-256 of its lower-cased, whitespace-collapsed text (None for short messages)"""
+    key = claim_key(claim)
+    if len(key) < FACT_VERDICT_MIN_CHARS:
+        return None
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+
+def url_hash(url):
+    """Key of a checked page: SHA-256 of its canonical URL (scheme- and www-insensitive)"""
+    try:
+        key = url_utils.cache_key(url_utils.normalize_url(url))
+    except ValueError:
+        return None
+    return hashlib.sha256(f'url:{key}'.encode('utf-8')).hexdigest()
+
+
+def lookup_hash(key_hash):
+    """
+    The recorded verdict for a claim_hash/url_hash: {'verdict', 'confidence',
+    'response', 'evidence', 'channel', 'created_at', 'age'}, or None
+    """
+    if not key_hash:
+        return None
+    _count('lookups')
+    now = time.time()
+    try:
+        conn = _connect()
+        try:
+            row = conn.execute(
+                'SELECT verdict, confidence, response, evidence, channel, created_at FROM verdicts '
+                'WHERE key_hash = ? AND created_at > ?',
+                (key_hash, now - FACT_VERDICT_TTL)
+            ).fetchone()
+        finally:
+            conn.close()
+    except sqlite3.Error as e:
+        print(f"Verdict store read error: {str(e)}")
+        row = None
+    if not row:
+        _count('misses')
+        return None
+    _count('hits')
+    verdict, confidence, response, evidence, channel, created_at = row
+    return {'verdict': verdict, 'confidence': confidence, 'response': response, 'evidence': evidence,
+            'channel': channel, 'created_at': created_at, 'age': round(now - created_at)}
+
+
+def lookup(claim):
+    """The recorded verdict for claim (see lookup_hash), or None"""
+    return lookup_hash(claim_hash(claim))
+
+
+def lookup_similar(claim):
+    """
+    The recorded verdict for claim or, failing that, for the nearest reworded
+    copy of it; adds 'match' ('exact' or 'near') and 'key'. None if neither.
+    """
+    key_hash = claim_hash(claim)
+    if key_hash is None:
+        return None
+    cached = lookup_hash(key_hash)
+    if cached:
+        return {**cached, 'match': 'exact', 'key': key_hash}
+    for distance, near_hash in claim_index.lookup(claim):
+        cached = lookup_hash(near_hash)
+        if cached:
+            return {**cached, 'match': 'near', 'key': near_hash, 'distance': distance}
+    return None
+
+
+def lookup_url(url):
+    """The recorded verdict for the page at url (see lookup_hash), or None"""
+    return lookup_hash(url_hash(url))
+
+
+def _record(key_hash, verdict, confidence, response, evidence, channel):
+    verdict = (verdict or '').strip().upper()
+    try:
+        confidence = int(confidence)
+    except (TypeError, ValueError):
+        confidence = 0
+    if key_hash is None or verdict not in CACHEABLE_VERDICTS or confidence < FACT_VERDICT_MIN_CONFIDENCE:
+        _count('skipped')
+        return False
+    try:
+        conn = _connect()
+        try:
+            conn.execute(
+                'INSERT OR REPLACE INTO verdicts '
+                '(key_hash, verdict, confidence, response, evidence, channel, created_at) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (key_hash, verdict, confidence, response or '', evidence or '', channel, time.time())
+            )
+            conn.commit()
+        finally:
+            conn.close()
+    except sqlite3.Error as e:
+        print(f"Verdict store write error: {str(e)}")
+        return False
+    _count('recorded')
+    return True
+
+
+def record(claim, verdict, confidence, response, evidence, channel):
+    """Keep a channel's verdict for claim; returns whether it was stored"""
+    key_hash = claim_hash(claim)
+    stored = _record(key_hash, verdict, confidence, response, evidence, channel)
+    if stored:
+        claim_index.add(claim, key_hash)
+    return stored
+
+
+def record_url(url, verdict, confidence, response, evidence, channel):
+    """Keep a channel's verdict for the page at url; returns whether it was stored"""
+    return _record(url_hash(url), verdict, confidence, response, evidence, channel)
+
+
+def stats():
+    with _stats_lock:
+        result = dict(_stats)
+    result['near_duplicates'] = claim_index.snapshot()
+    try:
+        conn = _connect()
+        try:
+            result['stored'] = conn.execute(
+                'SELECT COUNT(*) FROM verdicts WHERE created_at > ?', (time.time() - FACT_VERDICT_TTL,)
+            ).fetchone()[0]
+        finally:
+            conn.close()
+    except sqlite3.Error as e:
+        print(f"Verdict store read error: {str(e)}")
+    return result
@@ -0,0 +1,221 @@
+"""
+Image preprocessing and perceptual-hash analysis cache
+File: image_pipeline.py
+
+Uploads are validated, rotated upright from their EXIF orientation, converted
+to RGB, downscaled to IMAGE_MAX_SIDE and re-encoded as JPEG without metadata
+before they are sent to the LLM. Each normalized image gets a 64-bit
+difference hash (dHash); a new upload whose hash is within
+IMAGE_HASH_DISTANCE bits of a cached one reuses that earlier analysis.
+"""
+
+import hashlib
+import io
+import os
+import sqlite3
+import threading
+import time
+
+from PIL import Image, ImageOps
+
+from url_utils import CACHE_DB_PATH
+
+IMAGE_MAX_SIDE = int(os.getenv('IMAGE_MAX_SIDE', '1536'))
+IMAGE_MAX_BYTES = int(os.getenv('IMAGE_MAX_BYTES', str(20 * 1024 * 1024)))
+IMAGE_JPEG_QUALITY = int(os.getenv('IMAGE_JPEG_QUALITY', '85'))
+IMAGE_HASH_DISTANCE = int(os.getenv('IMAGE_HASH_DISTANCE', '6'))
+IMAGE_CACHE_TTL = int(os.getenv('IMAGE_CACHE_TTL', str(30 * 24 * 3600)))
+IMAGE_CACHE_SIZE = int(os.getenv('IMAGE_CACHE_SIZE', '20000'))
+
+_db_lock = threading.Lock()
+_db_ready = False
+_memory = None
+_memory_lock = threading.Lock()
+_stats_lock = threading.Lock()
+_stats = {'images': 0, 'cache_hits': 0, 'cache_misses': 0, 'bytes_in': 0, 'bytes_out': 0}
+
+
+def _count(key, n=1):
+    with _stats_lock:
+        _stats[key] += n
+
+
+def preprocess(stream):
+    """
+    Validate and normalize an uploaded image. Returns (image, info); raises
+    ValueError for files that are not valid images or exceed IMAGE_MAX_BYTES.
+    """
+    raw = stream.read(IMAGE_MAX_BYTES + 1)
+    if len(raw) > IMAGE_MAX_BYTES:
+        raise ValueError(f'image is larger than {IMAGE_MAX_BYTES // (1024 * 1024)}MB')
+    try:
+        Image.open(io.BytesIO(raw)).verify()
+        img = Image.open(io.BytesIO(raw))
+        img.load()
+    except Exception as e:
+        raise ValueError(str(e))
+
+    original_format, original_size = img.format, img.size
+    img = ImageOps.exif_transpose(img)
+    if img.mode in ('RGBA', 'LA') or (img.mode == 'P' and 'transparency' in img.info):
+        rgba = img.convert('RGBA')
+        img = Image.new('RGB', rgba.size, (255, 255, 255))
+        img.paste(rgba, mask=rgba.split()[-1])
+    elif img.mode != 'RGB':
+        img = img.convert('RGB')
+    img.thumbnail((IMAGE_MAX_SIDE, IMAGE_MAX_SIDE), Image.LANCZOS)
+
+    # Re-encoding drops EXIF, GPS and every other metadata block
+    out = io.BytesIO()
+    img.save(out, format='JPEG', quality=IMAGE_JPEG_QUALITY, optimize=True)
+    encoded = out.getvalue()
+    clean = Image.open(io.BytesIO(encoded))
+    clean.load()
+
+    _count('images')
+    _count('bytes_in', len(raw))
+    _count('bytes_out', len(encoded))
+    return clean, {
+        'original_format': original_format,
+        'original_size': list(original_size),
+        'size': list(clean.size),
+        'bytes_before': len(raw),
+        'bytes_after': len(encoded),
+    }
+
+
+def dhash(img, hash_size=8):
+    """64-bit difference hash: brightness gradients of a 9x8 grayscale thumbnail"""
+    small = img.convert('L').resize((hash_size + 1, hash_size), Image.LANCZOS)
+    pixels = list(small.getdata())
+    value = 0
+    for row in range(hash_size):
+        for col in range(hash_size):
+            left = pixels[row * (hash_size + 1) + col]
+            right = pixels[row * (hash_size + 1) + col + 1]
+            value = (value << 1) | (1 if left > right else 0)
+    return value
+
+
+def hamming(a, b):
+    return bin(a ^ b).count('1')
+
+
+def _prompt_key(prompt):
+    return hashlib.sha256(prompt.encode('utf-8')).hexdigest()[:16]
+
+
+# -----------------------------------------------------------------------------
+# Persistent analysis cache (sqlite, with an in-memory copy for nearest-hash lookup)
+# -----------------------------------------------------------------------------
+
+def _connect():
+    global _db_ready
+    conn = sqlite3.connect(CACHE_DB_PATH, timeout=10)
+    if not _db_ready:
+        with _db_lock:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS image_analyses ('
+                'image_hash TEXT NOT NULL, prompt_key TEXT NOT NULL, analysis TEXT NOT NULL, '
+                'created_at REAL NOT NULL, PRIMARY KEY (image_hash, prompt_key))'
+            )
+            conn.commit()
+            _db_ready = True
+    return conn
+
+
+def _entries():
+    """Lazily load the recent cache rows: list of [hash_int, prompt_key, analysis, created_at]"""
+    global _memory
+    with _memory_lock:
+        if _memory is None:
+            _memory = []
+            try:
+                conn = _connect()
+                try:
+                    rows = conn.execute(
+                        'SELECT image_hash, prompt_key, analysis, created_at FROM image_analyses '
+                        'WHERE created_at > ? ORDER BY created_at DESC LIMIT ?',
+                        (time.time() - IMAGE_CACHE_TTL, IMAGE_CACHE_SIZE)
+                    ).fetchall()
+                finally:
+                    conn.close()
+                _memory = [[int(h, 16), p, a, c] for h, p, a, c in reversed(rows)]
+            except sqlite3.Error as e:
+                print(f"Image cache read error: {str(e)}")
+        return _memory
+
+
+def lookup(image_hash, prompt):
+    """Closest cached analysis for the same prompt within IMAGE_HASH_DISTANCE bits: (analysis, distance) or None"""
+    key = _prompt_key(prompt)
+    cutoff = time.time() - IMAGE_CACHE_TTL
+    best = None
+    with _memory_lock:
+        entries = list(_memory) if _memory is not None else None
+    if entries is None:
+        entries = list(_entries())
+    for cached_hash, prompt_key, analysis, created_at in entries:
+        if prompt_key != key or created_at < cutoff:
+            continue
+        distance = hamming(image_hash, cached_hash)
+        if distance <= IMAGE_HASH_DISTANCE and (best is None or distance < best[1]):
+            best = (analysis, distance)
+            if distance == 0:
+                break
+    _count('cache_hits' if best else 'cache_misses')
+    return best
+
+
+def store(image_hash, prompt, analysis):
+    now = time.time()
+    key = _prompt_key(prompt)
+    entries = _entries()
+    with _memory_lock:
+        entries.append([image_hash, key, analysis, now])
+        if len(entries) > IMAGE_CACHE_SIZE:
+            del entries[:len(entries) - IMAGE_CACHE_SIZE]
+    try:
+        conn = _connect()
+        try:
+            conn.execute(
+                'INSERT OR REPLACE INTO image_analyses (image_hash, prompt_key, analysis, created_at) '
+                'VALUES (?, ?, ?, ?)',
+                (f'{image_hash:016x}', key, analysis, now)
+            )
+            conn.commit()
+        finally:
+            conn.close()
+    except sqlite3.Error as e:
+        print(f"Image cache write error: {str(e)}")
+
+
+def analyze(stream, prompt, analyze_fn):
+    """
+    Preprocess an upload and return (analysis, details). analyze_fn(image) is
+    only called when no visually identical image was analyzed with this prompt.
+    Raises ValueError for invalid images.
+    """
+    img, info = preprocess(stream)
+    image_hash = dhash(img)
+    details = {**info, 'image_hash': f'{image_hash:016x}', 'cached': False}
+
+    hit = lookup(image_hash, prompt)
+    if hit:
+        details['cached'] = True
+        details['hash_distance'] = hit[1]
+        return hit[0], details
+
+    analysis = analyze_fn(img)
+    store(image_hash, prompt, analysis)
+    return analysis, details
+
+
+def stats():
+    with _stats_lock:
+        result = dict(_stats)
+    with _memory_lock:
+        result['cached_entries'] = len(_memory) if _memory is not None else None
+    result['max_side'] = IMAGE_MAX_SIDE
+    result['hash_distance'] = IMAGE_HASH_DISTANCE
+    return result
@@ -0,0 +1,478 @@
+"""
+Offline language identification
+File: language_id.py
+
+detect(text) returns (language_code, confidence) in tens of microseconds,
+with no network call:
+1. Letters are counted per script and the most common script wins; its share
+   of the letters scales the confidence, so mixed-script text (an English
+   sentence with one Devanagari word) is never certain
+2. Scripts that belong to one language here (Hangul, kana, Han, Greek, ...)
+   decide the language directly
+3. Latin text, and scripts shared by several languages (Devanagari: hi/mr/ne,
+   Arabic: ar/ur/fa, Cyrillic: ru/uk/bg), are scored by a naive Bayes model
+   over character trigrams and whole words (fastText-style subword features),
+   one per script, trained at import time from the short seed texts below
+
+If the fasttext package and its lid.176 model (LANGID_FASTTEXT_MODEL) are
+available, that model is used instead of the seed models.
+
+Codes follow the client's language selector (ISO 639-1, 'zh-cn' for Chinese).
+Used to pick the translator's source language, the search region for claims
+and the language tag of posts at postsave.
+Posts are tagged 'und' when the detector is below LANGID_MIN_CONFIDENCE (short
+or mixed-script text), rather than with a wrong guess. Romanised Hindi
+(Hinglish) is in the Latin model and detected as 'hi'.
+
+Backfill the language of existing posts (and retag low-confidence ones):
+    python language_id.py backfill
+"""
+
+import math
+import os
+import re
+import sys
+import threading
+import time
+from itertools import repeat
+
+LANGID_MAX_CHARS = int(os.getenv('LANGID_MAX_CHARS', '300'))
+LANGID_MIN_CONFIDENCE = float(os.getenv('LANGID_MIN_CONFIDENCE', '0.8'))
+LANGID_FASTTEXT_MODEL = os.getenv('LANGID_FASTTEXT_MODEL', '')
+SMOOTHING = 0.5
+
+# Scripts and the languages written in them here; Latin is everything the seed
+# model covers. Kana text also uses Han characters, so Han counts as kana
+# whenever kana is present.
+SCRIPTS = [
+    ('devanagari', re.compile(r'[ऀ-ॿ]'), ('hi', 'mr', 'ne')),
+    ('arabic', re.compile(r'[؀-ۿݐ-ݿ]'), ('ar', 'ur', 'fa')),
+    ('cyrillic', re.compile(r'[Ѐ-ӿ]'), ('ru', 'uk', 'bg')),
+    ('hangul', re.compile(r'[가-힯ᄀ-ᇿ]'), ('ko',)),
+    ('kana', re.compile(r'[぀-ヿ]'), ('ja',)),
+    ('han', re.compile(r'[一-鿿]'), ('zh-cn',)),
+    ('greek', re.compile(r'[Ͱ-Ͽ]'), ('el',)),
+    ('hebrew', re.compile(r'[֐-׿]'), ('he',)),
+    ('thai', re.compile(r'[฀-๿]'), ('th',)),
+]
+LATIN = re.compile(r'[A-Za-zÀ-ɏ]')
+# Words keep their Devanagari vowel signs and Arabic diacritics, which \w does not match
+LETTERS = re.compile(r"(?:[^\W\d_]|[ऀ-ॣ॰-ॿً-ٰٟ])+")
+
+SEED_TEXTS = {
+    'en': """
+        The government said on Tuesday that the new vaccine is safe and that there is no evidence
+        it causes any serious side effects. Experts have warned that the video which is being shared
+        on social media was edited and does not show what really happened. According to the report,
+        the president did not say that the election would be cancelled. This claim is false and the
+        photo was taken several years ago in another country. They were asked whether the water
+        in the city could be drunk, and the officials answered that it was tested every week.
+        We should always check the source of a story before we share it with our friends, because
+        what we read online is often misleading. It's been shown that most people don't read more than
+        the headline, which is why the fact checkers would like you to think about who wrote it.
+    """,
+    'es': """
+        El gobierno dijo el martes que la nueva vacuna es segura y que no hay pruebas de que cause
+        efectos secundarios graves. Los expertos advirtieron que el video que se comparte en las redes
+        sociales fue editado y no muestra lo que realmente ocurrió. Según el informe, el presidente no
+        dijo que las elecciones serían canceladas. Esta afirmación es falsa y la foto fue tomada hace
+        varios años en otro país. Se les preguntó si el agua de la ciudad se podía beber, y los
+        funcionarios respondieron que se analiza cada semana. Siempre debemos comprobar la fuente de
+        una noticia antes de compartirla con nuestros amigos, porque lo que leemos en internet muchas
+        veces es engañoso. También está claro que la mayoría de las personas solo lee el titular, por
+        eso los verificadores piden pensar en quién lo escribió y por qué.
+    """,
+    'fr': """
+        Le gouvernement a déclaré mardi que le nouveau vaccin est sûr et qu'il n'existe aucune preuve
+        qu'il provoque des effets secondaires graves. Les experts ont averti que la vidéo partagée sur
+        les réseaux sociaux a été modifiée et ne montre pas ce qui s'est vraiment passé. Selon le
+        rapport, le président n'a pas dit que les élections seraient annulées. Cette affirmation est
+        fausse et la photo a été prise il y a plusieurs années dans un autre pays. On leur a demandé si
+        l'eau de la ville était potable, et les responsables ont répondu qu'elle est contrôlée chaque
+        semaine. Nous devons toujours vérifier la source d'une information avant de la partager avec
+        nos amis, parce que ce que nous lisons sur internet est souvent trompeur. C'est pourquoi les
+        vérificateurs vous demandent de réfléchir à qui l'a écrit et pour quelle raison.
+    """,
+    'de': """
+        Die Regierung sagte am Dienstag, dass der neue Impfstoff sicher ist und es keine Beweise dafür
+        gibt, dass er schwere Nebenwirkungen verursacht. Experten haben gewarnt, dass das Video, das in
+        den sozialen Medien geteilt wird, bearbeitet wurde und nicht zeigt, was wirklich passiert ist.
+        Laut dem Bericht hat der Präsident nicht gesagt, dass die Wahl abgesagt wird. Diese Behauptung
+        ist falsch und das Foto wurde vor einigen Jahren in einem anderen Land aufgenommen. Sie wurden
+        gefragt, ob man das Wasser in der Stadt trinken kann, und die Behörden antworteten, dass es
+        jede Woche geprüft wird. Wir sollten immer die Quelle einer Nachricht überprüfen, bevor wir sie
+        mit unseren Freunden teilen, weil das, was wir im Internet lesen, oft irreführend ist. Deshalb
+        bitten die Faktenprüfer darum, sich zu fragen, wer es geschrieben hat und warum.
+    """,
+    'pt': """
+        O governo disse na terça-feira que a nova vacina é segura e que não há provas de que ela cause
+        efeitos colaterais graves. Os especialistas alertaram que o vídeo que está sendo compartilhado
+        nas redes sociais foi editado e não mostra o que realmente aconteceu. Segundo o relatório, o
+        presidente não disse que as eleições seriam canceladas. Essa afirmação é falsa e a foto foi
+        tirada há vários anos em outro país. Eles foram perguntados se a água da cidade podia ser
+        bebida, e as autoridades responderam que ela é testada toda semana. Devemos sempre verificar a
+        fonte de uma notícia antes de compartilhá-la com os nossos amigos, porque o que lemos na
+        internet muitas vezes é enganoso. Por isso os checadores pedem que você pense em quem escreveu
+        o texto e por quê, e que não acredite em tudo o que vê.
+    """,
+    'it': """
+        Il governo ha dichiarato martedì che il nuovo vaccino è sicuro e che non ci sono prove che
+        provochi gravi effetti collaterali. Gli esperti hanno avvertito che il video condiviso sui
+        social network è stato modificato e non mostra quello che è successo davvero. Secondo il
+        rapporto, il presidente non ha detto che le elezioni sarebbero state annullate. Questa
+        affermazione è falsa e la foto è stata scattata diversi anni fa in un altro paese. È stato
+        chiesto loro se l'acqua della città fosse potabile, e i funzionari hanno risposto che viene
+        controllata ogni settimana. Dovremmo sempre verificare la fonte di una notizia prima di
+        condividerla con i nostri amici, perché quello che leggiamo su internet spesso è ingannevole.
+        Per questo i verificatori chiedono di pensare a chi l'ha scritto e perché.
+    """,
+    'nl': """
+        De regering zei dinsdag dat het nieuwe vaccin veilig is en dat er geen bewijs is dat het
+        ernstige bijwerkingen veroorzaakt. Deskundigen waarschuwden dat de video die op sociale media
+        wordt gedeeld, is bewerkt en niet laat zien wat er echt is gebeurd. Volgens het rapport heeft
+        de president niet gezegd dat de verkiezingen zouden worden afgelast. Deze bewering is onjuist
+        en de foto is een aantal jaren geleden in een ander land gemaakt. Hun werd gevraagd of het
+        water in de stad drinkbaar is, en de ambtenaren antwoordden dat het elke week wordt getest.
+        We moeten altijd de bron van een bericht controleren voordat we het met onze vrienden delen,
+        omdat wat we op internet lezen vaak misleidend is. Daarom vragen de factcheckers om na te
+        denken over wie het heeft geschreven en waarom.
+    """,
+    # Romanised Hindi (Hinglish), as typed on phones; tagged 'hi' like Devanagari Hindi
+    'hi': """
+        Sarkar ne mangalvar ko kaha ki nayi vaccine surakshit hai aur iska koi saboot nahi hai ki
+        isse koi gambhir side effect hota hai. Experts ne chetavni di hai ki social media par share
+        kiya ja raha video edit kiya gaya tha aur yeh nahi dikhata ki asal mein kya hua tha. Report
+        ke mutabik president ne yeh nahi kaha ki chunav radd kar diye jayenge. Yeh dawa jhootha hai
+        aur yeh photo kai saal pehle kisi dusre desh mein li gayi thi. Unse poocha gaya ki kya shehar
+        ka paani peene layak hai, aur adhikariyon ne jawab diya ki iski har hafte jaanch hoti hai.
+        Humein koi bhi khabar apne doston ke saath share karne se pehle hamesha uska source check
+        karna chahiye, kyunki hum internet par jo padhte hain woh aksar galat hota hai. Yaar, yeh
+        sab sach nahi hai, pehle check karo phir forward karo, warna sab log pareshan ho jaate hain.
+    """,
+}
+
+# Languages that share a script with others, told apart by their own seed model
+SCRIPT_SEED_TEXTS = {
+    'devanagari': {
+        'hi': """
+            सरकार ने मंगलवार को कहा कि नया टीका सुरक्षित है और इस बात का कोई सबूत नहीं है कि इससे कोई
+            गंभीर दुष्प्रभाव होता है। विशेषज्ञों ने चेतावनी दी है कि सोशल मीडिया पर साझा किया जा रहा वीडियो
+            संपादित किया गया था और यह नहीं दिखाता कि वास्तव में क्या हुआ था। रिपोर्ट के अनुसार, राष्ट्रपति ने
+            यह नहीं कहा कि चुनाव रद्द कर दिए जाएंगे। यह दावा झूठा है और यह तस्वीर कई साल पहले किसी दूसरे
+            देश में ली गई थी। उनसे पूछा गया कि क्या शहर का पानी पीने योग्य है, और अधिकारियों ने जवाब दिया
+            कि इसकी हर हफ्ते जांच की जाती है। हमें किसी भी खबर को अपने दोस्तों के साथ साझा करने से पहले
+            हमेशा उसका स्रोत जांचना चाहिए, क्योंकि हम इंटरनेट पर जो पढ़ते हैं वह अक्सर भ्रामक होता है।
+        """,
+        'mr': """
+            सरकारने मंगळवारी सांगितले की नवीन लस सुरक्षित आहे आणि त्यामुळे कोणतेही गंभीर दुष्परिणाम होतात
+            याचा कोणताही पुरावा नाही. तज्ज्ञांनी इशारा दिला आहे की समाजमाध्यमांवर शेअर होत असलेला व्हिडिओ
+            संपादित केलेला होता आणि प्रत्यक्षात काय घडले ते त्यात दिसत नाही. अहवालानुसार, राष्ट्रपतींनी
+            निवडणुका रद्द केल्या जातील असे म्हटले नव्हते. हा दावा खोटा आहे आणि हा फोटो अनेक वर्षांपूर्वी
+            दुसऱ्या देशात काढलेला होता. त्यांना विचारण्यात आले की शहरातील पाणी पिण्यायोग्य आहे का, आणि
+            अधिकाऱ्यांनी उत्तर दिले की त्याची दर आठवड्याला तपासणी केली जाते. आपण कोणतीही बातमी आपल्या
+            मित्रांसोबत शेअर करण्यापूर्वी तिचा स्रोत नेहमी तपासला पाहिजे, कारण आपण इंटरनेटवर जे वाचतो ते
+            अनेकदा दिशाभूल करणारे असते.
+        """,
+        'ne': """
+            सरकारले मंगलबार भन्यो कि नयाँ खोप सुरक्षित छ र यसले कुनै गम्भीर साइड इफेक्ट गर्छ भन्ने कुनै
+            प्रमाण छैन। विज्ञहरूले सामाजिक सञ्जालमा सेयर भइरहेको भिडियो सम्पादन गरिएको थियो र वास्तवमा के
+            भएको थियो त्यो देखाउँदैन भनेर चेतावनी दिएका छन्। प्रतिवेदन अनुसार, राष्ट्रपतिले चुनाव रद्द
+            गरिनेछ भनेर भनेका थिएनन्। यो दाबी झूटो हो र यो फोटो धेरै वर्ष पहिले अर्को देशमा खिचिएको थियो।
+            उनीहरूलाई सहरको पानी पिउन योग्य छ कि छैन भनेर सोधिएको थियो, र अधिकारीहरूले हरेक हप्ता यसको
+            परीक्षण गरिन्छ भनेर जवाफ दिए। हामीले कुनै पनि समाचार आफ्ना साथीहरूसँग सेयर गर्नुअघि सधैं यसको
+            स्रोत जाँच गर्नुपर्छ, किनभने हामीले इन्टरनेटमा पढ्ने कुरा प्रायः भ्रामक हुन्छ।
+        """,
+    },
+    'arabic': {
+        'ar': """
+            قالت الحكومة يوم الثلاثاء إن اللقاح الجديد آمن وإنه لا يوجد أي دليل على أنه يسبب آثارا جانبية
+            خطيرة. وحذر الخبراء من أن الفيديو الذي يتم تداوله على وسائل التواصل الاجتماعي تم تعديله ولا يظهر
+            ما حدث بالفعل. ووفقا للتقرير، لم يقل الرئيس إن الانتخابات سيتم إلغاؤها. هذا الادعاء كاذب والصورة
+            التقطت قبل عدة سنوات في بلد آخر. وسئلوا عما إذا كانت مياه المدينة صالحة للشرب، فأجاب المسؤولون
+            بأنها تفحص كل أسبوع. يجب علينا دائما التحقق من مصدر الخبر قبل مشاركته مع أصدقائنا، لأن ما نقرؤه
+            على الإنترنت غالبا ما يكون مضللا.
+        """,
+        'ur': """
+            حکومت نے منگل کو کہا کہ نئی ویکسین محفوظ ہے اور اس بات کا کوئی ثبوت نہیں ہے کہ اس سے کوئی سنگین
+            مضر اثرات ہوتے ہیں۔ ماہرین نے خبردار کیا ہے کہ سوشل میڈیا پر شیئر کی جانے والی ویڈیو میں ترمیم کی
+            گئی تھی اور یہ نہیں دکھاتی کہ اصل میں کیا ہوا تھا۔ رپورٹ کے مطابق صدر نے یہ نہیں کہا کہ انتخابات
+            منسوخ کر دیے جائیں گے۔ یہ دعویٰ جھوٹا ہے اور یہ تصویر کئی سال پہلے کسی دوسرے ملک میں لی گئی تھی۔
+            ان سے پوچھا گیا کہ کیا شہر کا پانی پینے کے قابل ہے، اور حکام نے جواب دیا کہ اس کی ہر ہفتے جانچ کی
+            جاتی ہے۔ ہمیں کوئی بھی خبر اپنے دوستوں کے ساتھ شیئر کرنے سے پہلے ہمیشہ اس کا ذریعہ چیک کرنا
+            چاہیے، کیونکہ ہم انٹرنیٹ پر جو پڑھتے ہیں وہ اکثر گمراہ کن ہوتا ہے۔
+        """,
+        'fa': """
+            دولت روز سه‌شنبه اعلام کرد که واکسن جدید ایمن است و هیچ مدرکی وجود ندارد که نشان دهد عوارض جانبی
+            جدی ایجاد می‌کند. کارشناسان هشدار داده‌اند که ویدیویی که در شبکه‌های اجتماعی منتشر می‌شود ویرایش
+            شده است و آنچه را واقعا اتفاق افتاده نشان نمی‌دهد. بر اساس این گزارش، رئیس جمهور نگفته است که
+            انتخابات لغو خواهد شد. این ادعا نادرست است و این عکس چند سال پیش در کشور دیگری گرفته شده است. از
+            آنها پرسیده شد که آیا آب شهر قابل نوشیدن است، و مسئولان پاسخ دادند که هر هفته آزمایش می‌شود. ما
+            همیشه باید منبع یک خبر را پیش از اینکه آن را با دوستانمان به اشتراک بگذاریم بررسی کنیم، چون آنچه
+            در اینترنت می‌خوانیم اغلب گمراه‌کننده است.
+        """,
+    },
+    'cyrillic': {
+        'ru': """
+            Правительство заявило во вторник, что новая вакцина безопасна и нет никаких доказательств того,
+            что она вызывает серьёзные побочные эффекты. Эксперты предупредили, что видео, которое
+            распространяется в социальных сетях, было смонтировано и не показывает, что произошло на самом
+            деле. Согласно докладу, президент не говорил, что выборы будут отменены. Это утверждение ложно,
+            а фотография была сделана несколько лет назад в другой стране. Их спросили, можно ли пить воду в
+            городе, и чиновники ответили, что её проверяют каждую неделю. Мы всегда должны проверять
+            источник новости, прежде чем делиться ею с друзьями, потому что то, что мы читаем в интернете,
+            часто вводит в заблуждение.
+        """,
+        'uk': """
+            Уряд заявив у вівторок, що нова вакцина безпечна і немає жодних доказів того, що вона спричиняє
+            серйозні побічні ефекти. Експерти попередили, що відео, яке поширюється в соціальних мережах,
+            було змонтоване і не показує, що насправді сталося. Згідно з доповіддю, президент не казав, що
+            вибори буде скасовано. Це твердження неправдиве, а фотографію було зроблено кілька років тому в
+            іншій країні. Їх запитали, чи можна пити воду в місті, і посадовці відповіли, що її перевіряють
+            щотижня. Ми завжди повинні перевіряти джерело новини, перш ніж ділитися нею з друзями, тому що
+            те, що ми читаємо в інтернеті, часто вводить в оману.
+        """,
+        'bg': """
+            Правителството заяви във вторник, че новата ваксина е безопасна и няма никакви доказателства, че
+            тя причинява сериозни странични ефекти. Експерти предупредиха, че видеото, което се
+            разпространява в социалните мрежи, е било редактирано и не показва какво всъщност се е случило.
+            Според доклада президентът не е казал, че изборите ще бъдат отменени. Това твърдение е невярно, а
+            снимката е направена преди няколко години в друга държава. Те бяха попитани дали водата в града
+            може да се пие, и служителите отговориха, че тя се проверява всяка седмица. Винаги трябва да
+            проверяваме източника на една новина, преди да я споделим с приятелите си, защото това, което
+            четем в интернет, често е подвеждащо.
+        """,
+    },
+}
+
+# Search localisation for claims: Serper (Google) hl/gl and DuckDuckGo region
+SEARCH_LOCALES = {
+    'en': ('en', 'us', 'wt-wt'),
+    'es': ('es', 'es', 'es-es'),
+    'fr': ('fr', 'fr', 'fr-fr'),
+    'de': ('de', 'de', 'de-de'),
+    'pt': ('pt', 'br', 'br-pt'),
+    'it': ('it', 'it', 'it-it'),
+    'nl': ('nl', 'nl', 'nl-nl'),
+    'hi': ('hi', 'in', 'in-en'),
+    'ar': ('ar', 'sa', 'xa-ar'),
+    'ru': ('ru', 'ru', 'ru-ru'),
+    'ko': ('ko', 'kr', 'kr-kr'),
+    'ja': ('ja', 'jp', 'jp-jp'),
+    'zh-cn': ('zh-cn', 'cn', 'cn-zh'),
+    'el': ('el', 'gr', 'gr-el'),
+    'he': ('iw', 'il', 'il-he'),
+    'th': ('th', 'th', 'th-th'),
+    'mr': ('mr', 'in', 'in-en'),
+    'ne': ('ne', 'np', 'wt-wt'),
+    'ur': ('ur', 'pk', 'pk-en'),
+    'fa': ('fa', 'ir', 'wt-wt'),
+    'uk': ('uk', 'ua', 'ua-uk'),
+    'bg': ('bg', 'bg', 'bg-bg'),
+}
+
+_stats_lock = threading.Lock()
+_stats = {'detections': 0, 'script': 0, 'model': 0, 'fasttext': 0, 'undetermined': 0, 'time_us_total': 0.0}
+_fasttext = None
+_fasttext_lock = threading.Lock()
+
+
+def _features(text):
+    """Whole words (prefixed 'w:') and character trigrams of space-padded words"""
+    words = LETTERS.findall(text.lower())
+    features = ['w:' + word for word in words]
+    for word in words:
+        padded = f' {word} '
+        features.extend(padded[i:i + 3] for i in range(len(padded) - 2))
+    return features
+
+
+def _train(seed_texts):
+    """
+    Naive Bayes tables: one {feature: log P(feature | lang)} dict per language,
+    plus the log probability of an unseen feature per language.
+    """
+    languages = list(seed_texts)
+    counts = {lang: {} for lang in languages}
+    for lang, text in seed_texts.items():
+        for feature in _features(text):
+            counts[lang][feature] = counts[lang].get(feature, 0) + 1
+    vocabulary = set().union(*counts.values())
+    totals = {lang: sum(c.values()) + SMOOTHING * len(vocabulary) for lang, c in counts.items()}
+    unseen = [math.log(SMOOTHING / totals[lang]) for lang in languages]
+    tables = [
+        {feature: math.log((counts[lang].get(feature, 0) + SMOOTHING) / totals[lang]) for feature in vocabulary}
+        for lang in languages
+    ]
+    return languages, tables, unseen
+
+
+# One (languages, tables, unseen) model per script that several languages share
+MODELS = {'latin': _train(SEED_TEXTS)}
+MODELS.update((script, _train(texts)) for script, texts in SCRIPT_SEED_TEXTS.items())
+SCRIPT_LANGUAGES = {script: languages for script, _, languages in SCRIPTS}
+SCRIPT_LANGUAGES['latin'] = tuple(SEED_TEXTS)
+LANGUAGES = sorted({lang for languages in SCRIPT_LANGUAGES.values() for lang in languages})
+
+
+def _count(key, n=1):
+    with _stats_lock:
+        _stats[key] += n
+
+
+def _get_fasttext():
+    """The fastText lid.176 model, or False when it is not configured or installed"""
+    global _fasttext
+    with _fasttext_lock:
+        if _fasttext is None:
+            _fasttext = False
+            if LANGID_FASTTEXT_MODEL and os.path.exists(LANGID_FASTTEXT_MODEL):
+                try:
+                    import fasttext
+                    _fasttext = fasttext.load_model(LANGID_FASTTEXT_MODEL)
+                except ImportError:
+                    print("fasttext not installed, using the built-in language model")
+        return _fasttext
+
+
+def _detect_script(text):
+    """(script, share of the letters written in it) for the most used script, or (None, 0.0)"""
+    counts = {script: len(pattern.findall(text)) for script, pattern, _ in SCRIPTS}
+    counts['latin'] = len(LATIN.findall(text))
+    if counts['kana']:
+        counts['kana'] += counts.pop('han')
+    total = sum(counts.values())
+    if not total:
+        return None, 0.0
+    script = max(counts, key=counts.get)
+    return script, counts[script] / total
+
+
+def _detect_model(text, model):
+    languages, tables, unseen_scores = model
+    features = _features(text)
+    if not features:
+        return None, 0.0
+    scores = [sum(map(table.get, features, repeat(unseen))) for table, unseen in zip(tables, unseen_scores)]
+    # Posterior with a uniform prior; the per-feature average keeps long texts from saturating
+    scale = 1.0 / math.sqrt(len(features))
+    best = max(scores)
+    weights = [math.exp((score - best) * scale) for score in scores]
+    index = scores.index(best)
+    return languages[index], weights[index] / sum(weights)
+
+
+def _detect_fasttext(model, text):
+    labels, probs = model.predict(text.replace('\n', ' '))
+    code = labels[0].replace('__label__', '')
+    return ('zh-cn' if code == 'zh' else code), float(probs[0])
+
+
+def identify(text):
+    """
+    (language_code, confidence, source) for text, where source is 'script'
+    when the script alone decided (it belongs to one language), 'model' or
+    'fasttext' when a language model did, and 'undetermined' with
+    ('und', 0.0) when there are no letters to go on. Only the first
+    LANGID_MAX_CHARS characters are read.
+    """
+    started = time.perf_counter()
+    sample = (text or '')[:LANGID_MAX_CHARS]
+    script, share = _detect_script(sample)
+    lang, confidence = None, 0.0
+    if script is None:
+        source = 'undetermined'
+    elif len(SCRIPT_LANGUAGES[script]) == 1:
+        source = 'script'
+        lang, confidence = SCRIPT_LANGUAGES[script][0], 1.0
+    else:
+        model = _get_fasttext()
+        if model:
+            source = 'fasttext'
+            lang, confidence = _detect_fasttext(model, sample)
+        else:
+            source = 'model'
+            lang, confidence = _detect_model(sample, MODELS[script])
+    if lang is None:
+        source = 'undetermined'
+        lang = 'und'
+    # Letters in other scripts make any guess less certain
+    confidence *= share
+
+    with _stats_lock:
+        _stats['detections'] += 1
+        _stats[source] += 1
+        _stats['time_us_total'] += (time.perf_counter() - started) * 1e6
+    return lang, round(confidence, 4), source
+
+
+def detect(text):
+    """(language_code, confidence) for text; see identify()"""
+    lang, confidence, _ = identify(text)
+    return lang, confidence
+
+
+def detect_confident(text, min_confidence=LANGID_MIN_CONFIDENCE):
+    """The detected language code, or None when the detector is not confident enough"""
+    lang, confidence = detect(text)
+    return lang if lang != 'und' and confidence >= min_confidence else None
+
+
+def tag(text, min_confidence=LANGID_MIN_CONFIDENCE):
+    """(language_code, confidence) to store on a post: 'und' unless the detector is confident enough"""
+    lang, confidence = detect(text)
+    return (lang if confidence >= min_confidence else 'und'), confidence
+
+
+def same_language(a, b):
+    """'zh-CN' and 'zh' match, as do 'EN' and 'en'"""
+    return bool(a and b) and a.split('-')[0].lower() == b.split('-')[0].lower()
+
+
+def search_locale(lang):
+    """(serper_hl, serper_gl, ddg_region) for a language, or None to search unlocalised"""
+    return SEARCH_LOCALES.get((lang or '').lower())
+
+
+def stats():
+    with _stats_lock:
+        result = dict(_stats)
+    detections = result['detections'] or 1
+    result['mean_time_us'] = round(result.pop('time_us_total') / detections, 1)
+    result['languages'] = LANGUAGES
+    result['fasttext_model'] = bool(_fasttext) if _fasttext is not None else None
+    return result
+
+
+def backfill(posts_collection, batch_size=100):
+    """Tag posts that have no language yet, and retag ones tagged below LANGID_MIN_CONFIDENCE"""
+    cursor = posts_collection.find(
+        {'$or': [
+            {'language': {'$exists': False}},
+            {'language': {'$ne': 'und'}, 'language_confidence': {'$lt': LANGID_MIN_CONFIDENCE}},
+        ]},
+        {'_id': 1, 'title': 1, 'content': 1}
+    ).batch_size(batch_size)
+    done = 0
+    for post in cursor:
+        lang, confidence = tag(f"{post.get('title') or ''}\n{post.get('content') or ''}")
+        posts_collection.update_one(
+            {'_id': post['_id']},
+            {'$set': {'language': lang, 'language_confidence': confidence}}
+        )
+        done += 1
+        if done % batch_size == 0:
+            print(f"Tagged {done} posts...")
+    print(f"Backfill complete: {done} posts tagged")
+    return {'tagged': done}
+
+
+if __name__ == '__main__':
+    if sys.argv[1:2] == ['backfill']:
+        from dotenv import load_dotenv
+        from pymongo import MongoClient
+
+        load_dotenv()
+        client = MongoClient(os.getenv('MONGO_URI', 'mongodb://localhost:27017/'))
+        backfill(client['social_media_db']['posts'])
+    else:
+        print("Usage: python language_id.py backfill")
@@ -0,0 +1,233 @@
+"""
+Shared LLM gateway
+File: llm_gateway.py
+
+One place that owns the language-model clients for every route and script:
+warm client instances, a concurrency cap, retries with backoff and a backend
+interface. Pick the backend with LLM_BACKEND:
+- gemini (default): Google Gemini through google-generativeai
+- stub: canned, deterministic responses for load tests and CI (no network)
+- local: an offline Hugging Face text-generation model (text-only)
+"""
+
+import json
+import os
+import random
+import threading
+import time
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+LLM_BACKEND = os.getenv('LLM_BACKEND', 'gemini').lower()
+DEFAULT_MODEL = os.getenv('LLM_MODEL', 'gemini-2.5-flash')
+MAX_CONCURRENCY = int(os.getenv('LLM_MAX_CONCURRENCY', '8'))
+MAX_RETRIES = int(os.getenv('LLM_MAX_RETRIES', '2'))
+RETRY_BASE_DELAY = float(os.getenv('LLM_RETRY_BASE_DELAY', '0.5'))
+STUB_LATENCY_MS = int(os.getenv('LLM_STUB_LATENCY_MS', '0'))
+LOCAL_MODEL = os.getenv('LLM_LOCAL_MODEL', 'TinyLlama/TinyLlama-1.1B-Chat-v1.0')
+
+# Error class names worth retrying (matched by name so no SDK import is needed here)
+RETRYABLE_ERRORS = {
+    'ResourceExhausted', 'ServiceUnavailable', 'DeadlineExceeded', 'InternalServerError',
+    'TooManyRequests', 'Timeout', 'ConnectionError', 'ReadTimeout', 'RemoteDisconnected',
+}
+
+
+class LLMError(Exception):
+    """
+    A model call failed for good (after any retries). Wraps the backend's own
+    exception, which can be anything, e.g. a ValueError from Gemini's .text on
+    a blocked response, so callers can tell model failures from bad input.
+    """
+
+
+class LLMBackend:
+    """Backend interface: turn prompt contents into response text"""
+
+    name = 'base'
+
+    def warm(self, model):
+        """Prepare a client for `model` ahead of the first request"""
+
+    def generate(self, contents, model, generation_config=None):
+        raise NotImplementedError
+
+
+class GeminiBackend(LLMBackend):
+    """Google Gemini with one configured SDK and one cached model object per model name"""
+
+    name = 'gemini'
+
+    def __init__(self):
+        import google.generativeai as genai
+        self.genai = genai
+        self.genai.configure(api_key=os.getenv('GEMINI_API_KEY'))
+        self.models = {}
+        self.lock = threading.Lock()
+
+    def _model(self, model):
+        with self.lock:
+            client = self.models.get(model)
+            if client is None:
+                client = self.models[model] = self.genai.GenerativeModel(model)
+            return client
+
+    def warm(self, model):
+        self._model(model)
+
+    def generate(self, contents, model, generation_config=None):
+        response = self._model(model).generate_content(contents, generation_config=generation_config)
+        return response.text
+
+
+class StubBackend(LLMBackend):
+    """
+    Offline backend with canned answers. Prompts that ask for the fact-check JSON
+    format get valid JSON back, so the full request path can be exercised.
+    """
+
+    name = 'stub'
+
+    def generate(self, contents, model, generation_config=None):
+        if STUB_LATENCY_MS:
+            time.sleep(STUB_LATENCY_MS / 1000)
+        prompt = _text_of(contents)
+        if '"agent_response"' in prompt:
+            return json.dumps({
+                "agent_response": "Stub response: no language model was called.",
+                "verdict": "UNVERIFIABLE",
+                "confidence_score": 0,
+                "evidence_summary": "Generated by the stub LLM backend."
+            })
+        if 'VERDICT:' in prompt:
+            return "VERDICT: FALSE\nEXPLANATION: Stub response: no language model was called.\nCONFIDENCE: 0%"
+        if 'Misinformation:' in prompt:
+            return "\n\n".join(
+                f"Misinformation: Stub claim {i}\nSource: Stub source {i}" for i in range(1, 5)
+            )
+        return "Stub response: no language model was called."
+
+
+class LocalBackend(LLMBackend):
+    """Offline Hugging Face text-generation model; non-text parts (images, video) are ignored"""
+
+    name = 'local'
+
+    def __init__(self):
+        self.pipe = None
+        self.lock = threading.Lock()
+
+    def warm(self, model):
+        with self.lock:
+            if self.pipe is None:
+                import model_serving
+                self.pipe = model_serving.get_pipeline('text-generation', LOCAL_MODEL, device=-1)
+
+    def generate(self, contents, model, generation_config=None):
+        self.warm(model)
+        config = dict(generation_config or {})
+        prompt = _text_of(contents)
+        output = self.pipe(
+            prompt,
+            max_new_tokens=config.get('max_output_tokens', 512),
+            do_sample=False,
+            return_full_text=False
+        )
+        return output[0]['generated_text'].strip()
+
+
+BACKENDS = {
+    'gemini': GeminiBackend,
+    'stub': StubBackend,
+    'local': LocalBackend,
+}
+
+
+def _text_of(contents):
+    """Concatenate the text parts of a prompt given as a string or a list of parts"""
+    if isinstance(contents, str):
+        return contents
+    return "\n".join(part for part in contents if isinstance(part, str))
+
+
+def _retryable(error):
+    return type(error).__name__ in RETRYABLE_ERRORS or '429' in str(error) or '503' in str(error)
+
+
+class LLMGateway:
+    """Concurrency-limited, retrying front door to the configured backend"""
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.slots = threading.BoundedSemaphore(MAX_CONCURRENCY)
+        self.lock = threading.Lock()
+        self.stats = {'calls': 0, 'errors': 0, 'retries': 0, 'in_flight': 0, 'total_ms': 0.0}
+
+    def _count(self, key, n=1):
+        with self.lock:
+            self.stats[key] += n
+
+    def generate(self, contents, model=DEFAULT_MODEL, generation_config=None, retries=MAX_RETRIES):
+        """
+        Return the response text for `contents` (a prompt string or list of parts).
+        A slot is held only while a call is in flight: it is released during the
+        backoff before a retry, so waiting retries do not block other callers.
+        """
+        self._count('in_flight')
+        started = time.perf_counter()
+        try:
+            attempt = 0
+            while True:
+                with self.slots:
+                    try:
+                        self._count('calls')
+                        return self.backend.generate(contents, model, generation_config)
+                    except Exception as e:
+                        if attempt >= retries or not _retryable(e):
+                            self._count('errors')
+                            raise LLMError(f"{type(e).__name__}: {str(e)}") from e
+                        error = e
+                attempt += 1
+                self._count('retries')
+                delay = RETRY_BASE_DELAY * (2 ** (attempt - 1)) * (1 + random.random())
+                print(f"LLM call failed ({type(error).__name__}), retry {attempt}/{retries} in {delay:.1f}s")
+                time.sleep(delay)
+        finally:
+            self._count('in_flight', -1)
+            self._count('total_ms', (time.perf_counter() - started) * 1000)
+
+    def snapshot(self):
+        with self.lock:
+            stats = dict(self.stats)
+        stats['backend'] = self.backend.name
+        stats['max_concurrency'] = MAX_CONCURRENCY
+        return stats
+
+
+def _create_gateway():
+    backend_cls = BACKENDS.get(LLM_BACKEND)
+    if backend_cls is None:
+        raise ValueError(f"Unknown LLM_BACKEND '{LLM_BACKEND}'. Choose one of: {', '.join(BACKENDS)}")
+    backend = backend_cls()
+    if backend.name != 'local':
+        # Local models load lazily: they take seconds and most processes never use them
+        backend.warm(DEFAULT_MODEL)
+    return LLMGateway(backend)
+
+
+# Process-wide gateway shared by every caller
+gateway = _create_gateway()
+
+
+def generate(contents, model=DEFAULT_MODEL, generation_config=None):
+    return gateway.generate(contents, model=model, generation_config=generation_config)
+
+
+def backend_name():
+    return gateway.backend.name
+
+
+def stats():
+    return gateway.snapshot()
@@ -0,0 +1,214 @@
+"""
+Local text-generation engine (TinyLlama by default)
+File: local_generation.py
+
+- generate_batch(): left-pads a list of prompts and generates them in a single
+  model.generate() call instead of one prompt at a time
+- early stop: a sequence is finished once its answer reaches the terminator
+  line (SOURCES: by default) and that section has ended
+- GEN_MAX_NEW_TOKENS caps the generated length
+- results are cached by (model, prompt, token cap)
+- stream() yields text pieces as the tokens are produced
+"""
+
+import hashlib
+import os
+import threading
+import time
+
+import model_serving
+from scrape_scheduler import ResultCache
+
+GEN_MODEL = os.getenv('GEN_MODEL', 'TinyLlama/TinyLlama-1.1B-Chat-v1.0')
+GEN_MAX_NEW_TOKENS = int(os.getenv('GEN_MAX_NEW_TOKENS', '400'))
+GEN_BATCH_SIZE = int(os.getenv('GEN_BATCH_SIZE', '8'))
+GEN_TERMINATOR = os.getenv('GEN_TERMINATOR', 'SOURCES:')
+# Tokens allowed after the terminator before the section is considered over
+GEN_TERMINATOR_TAIL_TOKENS = int(os.getenv('GEN_TERMINATOR_TAIL_TOKENS', '60'))
+GEN_MAX_CONCURRENCY = int(os.getenv('GEN_MAX_CONCURRENCY', '1'))
+GEN_CACHE_TTL = int(os.getenv('GEN_CACHE_TTL', str(24 * 3600)))
+GEN_CACHE_SIZE = int(os.getenv('GEN_CACHE_SIZE', '1000'))
+
+# Chat-template markers that mean the model has started a new turn
+TURN_MARKERS = ('<|user|>', '<|system|>', '<|end|>', '</s>')
+
+generation_cache = ResultCache(GEN_CACHE_TTL, GEN_CACHE_SIZE)
+# CPU generation saturates every core; more than one at a time only adds contention
+_slots = threading.BoundedSemaphore(GEN_MAX_CONCURRENCY)
+_stats_lock = threading.Lock()
+_stats = {'prompts': 0, 'batches': 0, 'generated_tokens': 0, 'early_stops': 0, 'streams': 0, 'generate_ms': 0.0}
+
+
+def _count(key, n=1):
+    with _stats_lock:
+        _stats[key] += n
+
+
+def cache_key(prompt, max_new_tokens, model_name=GEN_MODEL, terminator=GEN_TERMINATOR):
+    raw = f"{model_name}\0{max_new_tokens}\0{terminator}\0{prompt}"
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+def _stop_index(text, terminator):
+    """
+    Character index where the answer is complete, or None if generation should
+    continue: the end of the terminator section (blank line or a new chat turn
+    after it, or GEN_TERMINATOR_TAIL_TOKENS tokens of it), or any new chat turn.
+    """
+    markers = [text.find(m) for m in TURN_MARKERS if m in text]
+    if markers:
+        return min(markers)
+    if not terminator:
+        return None
+    found = text.find(terminator)
+    if found < 0:
+        return None
+    tail_start = found + len(terminator)
+    tail = text[tail_start:]
+    blank = tail.lstrip('\n').find('\n\n')
+    if blank >= 0:
+        return tail_start + (len(tail) - len(tail.lstrip('\n'))) + blank
+    if len(tail) // 4 >= GEN_TERMINATOR_TAIL_TOKENS:
+        return tail_start + GEN_TERMINATOR_TAIL_TOKENS * 4
+    return None
+
+
+def trim(text, terminator=GEN_TERMINATOR):
+    stop = _stop_index(text, terminator)
+    return (text[:stop] if stop is not None else text).strip()
+
+
+def _stopping_criteria(tokenizer, prompt_length, terminator):
+    """Per-sequence early stop on the terminator section (finished rows are padded while the rest continue)"""
+    import torch
+    from transformers import StoppingCriteria, StoppingCriteriaList
+
+    class TerminatorStop(StoppingCriteria):
+        def __call__(self, input_ids, scores, **kwargs):
+            texts = tokenizer.batch_decode(input_ids[:, prompt_length:], skip_special_tokens=True)
+            return torch.tensor([_stop_index(t, terminator) is not None for t in texts], device=input_ids.device)
+
+    return StoppingCriteriaList([TerminatorStop()])
+
+
+def _generate_uncached(prompts, max_new_tokens, terminator):
+    import torch
+
+    tokenizer, model = model_serving.load_causal_lm(GEN_MODEL)
+    tokenizer.padding_side = 'left'
+    if tokenizer.pad_token is None:
+        tokenizer.pad_token = tokenizer.eos_token
+
+    encoded = tokenizer(prompts, return_tensors='pt', padding=True)
+    prompt_length = encoded['input_ids'].shape[1]
+    started = time.perf_counter()
+    with _slots, torch.no_grad():
+        output = model.generate(
+            **encoded,
+            max_new_tokens=max_new_tokens,
+            do_sample=False,
+            pad_token_id=tokenizer.pad_token_id,
+            stopping_criteria=_stopping_criteria(tokenizer, prompt_length, terminator)
+        )
+    new_tokens = output[:, prompt_length:]
+    texts = tokenizer.batch_decode(new_tokens, skip_special_tokens=True)
+
+    _count('batches')
+    _count('generate_ms', (time.perf_counter() - started) * 1000)
+    _count('generated_tokens', int((new_tokens != tokenizer.pad_token_id).sum()))
+    _count('early_stops', sum(1 for t in texts if _stop_index(t, terminator) is not None))
+    return [trim(t, terminator) for t in texts]
+
+
+def generate_batch(prompts, max_new_tokens=GEN_MAX_NEW_TOKENS, terminator=GEN_TERMINATOR):
+    """Answers for a list of prompts, in order. Cached prompts are skipped; the rest run in batches"""
+    results = [None] * len(prompts)
+    missing = {}
+    for i, prompt in enumerate(prompts):
+        _count('prompts')
+        cached = generation_cache.get(cache_key(prompt, max_new_tokens, terminator=terminator))
+        if cached is not None:
+            results[i] = cached
+        else:
+            missing.setdefault(prompt, []).append(i)
+
+    unique = list(missing)
+    for first in range(0, len(unique), GEN_BATCH_SIZE):
+        batch = unique[first:first + GEN_BATCH_SIZE]
+        for prompt, text in zip(batch, _generate_uncached(batch, max_new_tokens, terminator)):
+            generation_cache.set(cache_key(prompt, max_new_tokens, terminator=terminator), text)
+            for i in missing[prompt]:
+                results[i] = text
+    return results
+
+
+def generate(prompt, max_new_tokens=GEN_MAX_NEW_TOKENS, terminator=GEN_TERMINATOR):
+    return generate_batch([prompt], max_new_tokens, terminator)[0]
+
+
+def stream(prompt, max_new_tokens=GEN_MAX_NEW_TOKENS, terminator=GEN_TERMINATOR):
+    """Yield the answer in pieces as tokens are produced (a cached answer is yielded whole)"""
+    import torch
+    from transformers import TextIteratorStreamer
+
+    _count('prompts')
+    key = cache_key(prompt, max_new_tokens, terminator=terminator)
+    cached = generation_cache.get(key)
+    if cached is not None:
+        yield cached
+        return
+
+    _count('streams')
+    tokenizer, model = model_serving.load_causal_lm(GEN_MODEL)
+    encoded = tokenizer(prompt, return_tensors='pt')
+    streamer = TextIteratorStreamer(tokenizer, skip_prompt=True, skip_special_tokens=True)
+    errors = []
+
+    def run():
+        started = time.perf_counter()
+        try:
+            with _slots, torch.no_grad():
+                model.generate(
+                    **encoded,
+                    max_new_tokens=max_new_tokens,
+                    do_sample=False,
+                    pad_token_id=tokenizer.pad_token_id or tokenizer.eos_token_id,
+                    streamer=streamer,
+                    stopping_criteria=_stopping_criteria(tokenizer, encoded['input_ids'].shape[1], terminator)
+                )
+        except Exception as e:
+            errors.append(e)
+            streamer.end()
+        finally:
+            _count('generate_ms', (time.perf_counter() - started) * 1000)
+
+    threading.Thread(target=run, daemon=True).start()
+
+    text = ""
+    sent = 0
+    for piece in streamer:
+        text += piece
+        stop = _stop_index(text, terminator)
+        end = stop if stop is not None else len(text)
+        if end > sent:
+            yield text[sent:end]
+            sent = end
+        if stop is not None:
+            _count('early_stops')
+            break
+    if errors:
+        raise errors[0]
+
+    _count('generated_tokens', len(tokenizer(text, add_special_tokens=False)['input_ids']))
+    generation_cache.set(key, trim(text, terminator))
+
+
+def stats():
+    with _stats_lock:
+        result = dict(_stats)
+    seconds = result['generate_ms'] / 1000
+    result['tokens_per_sec'] = round(result['generated_tokens'] / seconds, 2) if seconds else None
+    result['cache'] = generation_cache.stats()
+    result['model'] = GEN_MODEL
+    result['max_new_tokens'] = GEN_MAX_NEW_TOKENS
+    return result
@@ -1,22 +1,13 @@
 # 
 
 import os
-from transformers import AutoTokenizer, AutoModelForSequenceClassification, pipeline
 
 # Force offline mode
 os.environ["TRANSFORMERS_OFFLINE"] = "1"
+os.environ.setdefault("AI_DETECTOR_LOCAL_ONLY", "1")
 
-model_name = "openai-community/roberta-base-openai-detector"
+import ai_text_detector
 
-# Load tokenizer & model locally only
-tokenizer = AutoTokenizer.from_pretrained(model_name, local_files_only=True)
-model = AutoModelForSequenceClassification.from_pretrained(model_name, local_files_only=True)
-
-pipe = pipeline(
-    "text-classification",
-    model=model,
-    tokenizer=tokenizer
-)
-
-response = pipe("i like big nutts and i cannot lie")
+# Same detector the /api/detect-ai-text endpoint serves
+response = ai_text_detector.detect_one("i like big nutts and i cannot lie")
 print(response)
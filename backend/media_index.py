@@ -0,0 +1,311 @@
+"""
+Perceptual-hash index of post media and past image analyses
+File: media_index.py
+
+Every analyzed image and every image posted is indexed by its 64-bit dHash
+(the same normalization and hash as image_pipeline) with multi-index
+hashing, so the near-duplicates of an upload are found in well under a
+millisecond. Analyses
+whose structured verdict says the image is AI-generated or edited count as
+flagged (see parse_verdict);
+postsave attaches those matches (and earlier posts of the same image) to a new
+post.
+
+Backfill hashes and matches for existing posts:
+    python media_index.py backfill
+"""
+
+import base64
+import io
+import json
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+from itertools import combinations
+
+import image_pipeline
+
+MATCH_DISTANCE = int(os.getenv('MEDIA_MATCH_DISTANCE', str(image_pipeline.IMAGE_HASH_DISTANCE)))
+MAX_MATCHES = int(os.getenv('MEDIA_MAX_MATCHES', '10'))
+
+# The image analysis prompt ends with this, so the verdict is read from a field
+# rather than guessed from the wording of the analysis
+VERDICT_FIELD = 'ai_generated_or_edited'
+VERDICT_INSTRUCTIONS = (
+    'After the analysis, add one last line with only this JSON object: '
+    '{"%s": true or false, "confidence": your confidence in that verdict as a number from 0 to 100}'
+    % VERDICT_FIELD
+)
+VERDICT_PATTERN = re.compile(r'\{[^{}]*\}')
+FLAG_CONFIDENCE = int(os.getenv('MEDIA_FLAG_CONFIDENCE', '60'))
+
+
+def parse_verdict(analysis):
+    """
+    (text, verdict) for a model analysis: verdict is the last JSON object with
+    a boolean VERDICT_FIELD, or None when the model gave none (analyses from
+    before the structured prompt); text is the analysis without it, for display.
+    """
+    text = analysis or ''
+    for match in reversed(list(VERDICT_PATTERN.finditer(text))):
+        try:
+            verdict = json.loads(match.group(0))
+        except ValueError:
+            continue
+        if isinstance(verdict, dict) and isinstance(verdict.get(VERDICT_FIELD), bool):
+            before = re.sub(r'```(json)?\s*$', '', text[:match.start()].rstrip())
+            after = re.sub(r'^\s*```', '', text[match.end():])
+            return (before + after).strip(), verdict
+    return text.strip(), None
+
+
+def is_flagged(analysis):
+    """
+    The model's structured verdict says the image is AI-generated or edited,
+    with at least FLAG_CONFIDENCE percent confidence. Analyses without a
+    verdict are never flagged.
+    """
+    _, verdict = parse_verdict(analysis)
+    if verdict is None or not verdict[VERDICT_FIELD]:
+        return False
+    try:
+        return float(str(verdict.get('confidence', 100)).rstrip('% ')) >= FLAG_CONFIDENCE
+    except ValueError:
+        return True
+
+
+class MultiIndexHash:
+    """
+    Multi-index hashing over 64-bit hashes: each hash is split into BANDS
+    16-bit substrings with one lookup table per band. Two hashes within r bits
+    differ by at most r // BANDS bits in at least one band (pigeonhole), so a
+    search only probes the band values within that distance and verifies the
+    candidates with the full Hamming distance.
+    """
+
+    BANDS = 4
+    BAND_BITS = 16
+
+    def __init__(self):
+        self.tables = [{} for _ in range(self.BANDS)]
+        self.items = {}
+
+    @property
+    def size(self):
+        return len(self.items)
+
+    def _bands(self, value):
+        mask = (1 << self.BAND_BITS) - 1
+        return [(value >> (band * self.BAND_BITS)) & mask for band in range(self.BANDS)]
+
+    def _neighbours(self, band_value, radius):
+        """Every band value within `radius` bits of band_value"""
+        values = [band_value]
+        for flips in range(1, radius + 1):
+            for bits in combinations(range(self.BAND_BITS), flips):
+                flipped = band_value
+                for bit in bits:
+                    flipped ^= 1 << bit
+                values.append(flipped)
+        return values
+
+    def add(self, value, item):
+        """Index `item` under hash `value`; items with an identical hash share an entry"""
+        if value in self.items:
+            self.items[value].append(item)
+            return
+        self.items[value] = [item]
+        for table, band_value in zip(self.tables, self._bands(value)):
+            table.setdefault(band_value, []).append(value)
+
+    def search(self, value, radius):
+        """[(distance, item)] for every indexed hash within `radius` bits, nearest first"""
+        band_radius = radius // self.BANDS
+        candidates = set()
+        for table, band_value in zip(self.tables, self._bands(value)):
+            for probe in self._neighbours(band_value, band_radius):
+                candidates.update(table.get(probe, ()))
+        found = []
+        for candidate in candidates:
+            distance = image_pipeline.hamming(value, candidate)
+            if distance <= radius:
+                found.extend((distance, item) for item in self.items[candidate])
+        found.sort(key=lambda pair: pair[0])
+        return found
+
+
+class MediaIndex:
+    """Thread-safe hash index of post media and image analyses, loaded lazily"""
+
+    def __init__(self):
+        self.hashes = MultiIndexHash()
+        self.lock = threading.Lock()
+        self.loaded = False
+        self.stats = {'posts': 0, 'analyses': 0, 'flagged': 0, 'lookups': 0, 'lookup_ms_total': 0.0}
+
+    def _add(self, image_hash, item):
+        self.hashes.add(image_hash, item)
+        self.stats['posts' if item['kind'] == 'post' else 'analyses'] += 1
+        if item.get('flagged'):
+            self.stats['flagged'] += 1
+
+    def load(self, posts_collection=None):
+        """Index the persisted analyses and, if given, the hashed media of existing posts"""
+        with self.lock:
+            if self.loaded:
+                return
+            self.loaded = True
+            try:
+                conn = image_pipeline._connect()
+                try:
+                    rows = conn.execute('SELECT image_hash, analysis, created_at FROM image_analyses').fetchall()
+                finally:
+                    conn.close()
+                for image_hash, analysis, created_at in rows:
+                    self._add(int(image_hash, 16), _analysis_item(analysis, created_at))
+            except sqlite3.Error as e:
+                print(f"Media index could not load analyses: {str(e)}")
+
+            if posts_collection is not None:
+                try:
+                    cursor = posts_collection.find(
+                        {'media_hash': {'$exists': True}},
+                        {'_id': 0, 'post_id': 1, 'media_hash': 1, 'timestamp': 1}
+                    )
+                    for post in cursor:
+                        self._add(int(post['media_hash'], 16), _post_item(post['post_id'], post.get('timestamp')))
+                except Exception as e:
+                    print(f"Media index could not load posts: {str(e)}")
+            print(f"Media index loaded: {self.hashes.size} distinct hashes")
+
+    def add_analysis(self, image_hash, analysis):
+        with self.lock:
+            self._add(image_hash, _analysis_item(analysis, time.time()))
+
+    def add_post(self, image_hash, post_id, timestamp=None):
+        with self.lock:
+            self._add(image_hash, _post_item(post_id, timestamp))
+
+    def lookup(self, image_hash, radius=MATCH_DISTANCE):
+        started = time.perf_counter()
+        with self.lock:
+            found = self.hashes.search(image_hash, radius)
+            self.stats['lookups'] += 1
+            self.stats['lookup_ms_total'] += (time.perf_counter() - started) * 1000
+        return found
+
+    def matches(self, image_hash, exclude_post_id=None):
+        """
+        Matches to attach to a post: 'previously_flagged' (flagged analyses) and
+        'similar_posts' (earlier posts with the same image), nearest first.
+        """
+        flagged = []
+        similar = []
+        for distance, item in self.lookup(image_hash):
+            if item['kind'] == 'analysis' and item['flagged'] and len(flagged) < MAX_MATCHES:
+                flagged.append({**item, 'distance': distance})
+            elif item['kind'] == 'post' and item['post_id'] != exclude_post_id and len(similar) < MAX_MATCHES:
+                similar.append({**item, 'distance': distance})
+        return {'previously_flagged': flagged, 'similar_posts': similar}
+
+    def snapshot(self):
+        with self.lock:
+            stats = dict(self.stats)
+            stats['distinct_hashes'] = self.hashes.size
+        lookups = stats['lookups'] or 1
+        stats['mean_lookup_ms'] = round(stats.pop('lookup_ms_total') / lookups, 4)
+        stats['loaded'] = self.loaded
+        return stats
+
+
+def _analysis_item(analysis, created_at):
+    return {
+        'kind': 'analysis',
+        'flagged': is_flagged(analysis),
+        'analysis': parse_verdict(analysis)[0][:300],
+        'analyzed_at': int(created_at * 1000),
+    }
+
+
+def _post_item(post_id, timestamp):
+    return {'kind': 'post', 'post_id': post_id, 'timestamp': timestamp}
+
+
+def hash_data_url(media):
+    """dHash (int) of a base64 image or data URL as stored on posts; None if it is not a readable image"""
+    if not media:
+        return None
+    payload = media.split(',', 1)[1] if media.startswith('data:') else media
+    try:
+        img, _ = image_pipeline.preprocess(io.BytesIO(base64.b64decode(payload)))
+    except Exception:
+        return None
+    return image_pipeline.dhash(img)
+
+
+def hash_image_file(path):
+    """dHash (int) of an image file, e.g. a finalized upload; None if it is not a readable image"""
+    try:
+        with open(path, 'rb') as f:
+            img, _ = image_pipeline.preprocess(f)
+    except Exception:
+        return None
+    return image_pipeline.dhash(img)
+
+
+def hash_post_media(post):
+    """dHash of a post's image, whether stored inline (base64) or as a finalized upload"""
+    if post.get('media_upload_id'):
+        import uploads
+        try:
+            path, _ = uploads.open_finalized(post['media_upload_id'])
+        except uploads.UploadError:
+            return None
+        return hash_image_file(path)
+    return hash_data_url(post.get('media'))
+
+
+# Process-wide index
+index = MediaIndex()
+
+
+def backfill(posts_collection, batch_size=100):
+    """Hash the image media of posts that have no media_hash yet and attach their matches"""
+    index.load(posts_collection)
+    cursor = posts_collection.find(
+        {'mediaType': 'image', 'media': {'$ne': None}, 'media_hash': {'$exists': False}},
+        {'_id': 1, 'post_id': 1, 'media': 1, 'media_upload_id': 1, 'timestamp': 1}
+    ).sort('timestamp', 1).batch_size(batch_size)
+
+    done = skipped = 0
+    for post in cursor:
+        image_hash = hash_post_media(post)
+        if image_hash is None:
+            skipped += 1
+            continue
+        matches = index.matches(image_hash, exclude_post_id=post.get('post_id'))
+        posts_collection.update_one(
+            {'_id': post['_id']},
+            {'$set': {'media_hash': f'{image_hash:016x}', 'media_matches': matches}}
+        )
+        index.add_post(image_hash, post.get('post_id'), post.get('timestamp'))
+        done += 1
+        if done % batch_size == 0:
+            print(f"Backfilled {done} posts...")
+    print(f"Backfill complete: {done} posts hashed, {skipped} skipped")
+    return {'hashed': done, 'skipped': skipped}
+
+
+if __name__ == '__main__':
+    if sys.argv[1:2] == ['backfill']:
+        from dotenv import load_dotenv
+        from pymongo import MongoClient
+
+        load_dotenv()
+        client = MongoClient(os.getenv('MONGO_URI', 'mongodb://localhost:27017/'))
+        backfill(client['social_media_db']['posts'])
+    else:
+        print("Usage: python media_index.py backfill")
@@ -0,0 +1,225 @@
+"""
+Dynamic micro-batching for the local classifiers
+File: micro_batcher.py
+
+Concurrent classification requests are queued; a worker thread per model
+collects them for up to BATCH_MAX_WAIT_MS or until BATCH_MAX_SIZE items are
+waiting, pads the whole batch once, runs a single forward pass and hands each
+caller its own result. Models come from model_serving, so the configured
+runtime (PyTorch or int8 ONNX) is used.
+"""
+
+import math
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import model_serving
+
+BATCH_MAX_SIZE = int(os.getenv('BATCH_MAX_SIZE', '16'))
+BATCH_MAX_WAIT_MS = float(os.getenv('BATCH_MAX_WAIT_MS', '10'))
+BATCH_MAX_LENGTH = int(os.getenv('BATCH_MAX_LENGTH', '512'))
+BATCH_TIMEOUT = float(os.getenv('BATCH_TIMEOUT', '30'))
+
+
+class MicroBatcher:
+    """
+    Queue in front of a batch function. batch_fn(items) must return one result
+    per item, in order; submit() blocks until the caller's result is ready.
+    """
+
+    def __init__(self, name, batch_fn, max_batch_size=BATCH_MAX_SIZE, max_wait_ms=BATCH_MAX_WAIT_MS):
+        self.name = name
+        self.batch_fn = batch_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.queue = queue.Queue()
+        self.lock = threading.Lock()
+        self.stats = {
+            'batches': 0,
+            'items': 0,
+            'errors': 0,
+            'max_batch_size': 0,
+            'max_queue_depth': 0,
+            'wait_ms_total': 0.0,
+            'forward_ms_total': 0.0,
+        }
+        self.size_histogram = {}
+        self.worker = threading.Thread(target=self._run, name=f'batcher-{name}', daemon=True)
+        self.worker.start()
+
+    def submit_many(self, items, timeout=BATCH_TIMEOUT):
+        """Queue several items at once (so they can share a batch) and return their results"""
+        futures = []
+        for item in items:
+            future = Future()
+            self.queue.put((item, future, time.perf_counter()))
+            futures.append(future)
+        depth = self.queue.qsize()
+        with self.lock:
+            self.stats['max_queue_depth'] = max(self.stats['max_queue_depth'], depth)
+        return [future.result(timeout=timeout) for future in futures]
+
+    def submit(self, item, timeout=BATCH_TIMEOUT):
+        return self.submit_many([item], timeout=timeout)[0]
+
+    def _collect(self):
+        """Block for the first item, then gather more until the batch is full or the window closes"""
+        batch = [self.queue.get()]
+        window_ends = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = window_ends - time.perf_counter()
+            try:
+                batch.append(self.queue.get(timeout=remaining) if remaining > 0 else self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            started = time.perf_counter()
+            items = [item for item, _, _ in batch]
+            try:
+                results = self.batch_fn(items)
+                error = None
+            except Exception as e:
+                results, error = None, e
+            forward_ms = (time.perf_counter() - started) * 1000
+
+            for i, (_, future, queued_at) in enumerate(batch):
+                if error is not None:
+                    future.set_exception(error)
+                else:
+                    future.set_result(results[i])
+
+            with self.lock:
+                self.stats['batches'] += 1
+                self.stats['items'] += len(batch)
+                self.stats['errors'] += 1 if error is not None else 0
+                self.stats['max_batch_size'] = max(self.stats['max_batch_size'], len(batch))
+                self.stats['wait_ms_total'] += sum((started - queued_at) * 1000 for _, _, queued_at in batch)
+                self.stats['forward_ms_total'] += forward_ms
+                self.size_histogram[len(batch)] = self.size_histogram.get(len(batch), 0) + 1
+            if error is not None:
+                print(f"Batch for {self.name} failed: {str(error)}")
+
+    def snapshot(self):
+        with self.lock:
+            stats = dict(self.stats)
+            histogram = dict(sorted(self.size_histogram.items()))
+        batches = stats['batches'] or 1
+        items = stats['items'] or 1
+        return {
+            'batches': stats['batches'],
+            'items': stats['items'],
+            'errors': stats['errors'],
+            'mean_batch_size': round(stats['items'] / batches, 2),
+            'max_batch_size': stats['max_batch_size'],
+            'batch_size_histogram': histogram,
+            'mean_wait_ms': round(stats['wait_ms_total'] / items, 2),
+            'mean_forward_ms': round(stats['forward_ms_total'] / batches, 2),
+            'queue_depth': self.queue.qsize(),
+            'max_queue_depth': stats['max_queue_depth'],
+            'config': {'max_batch_size': self.max_batch_size, 'max_wait_ms': self.max_wait * 1000},
+        }
+
+
+# -----------------------------------------------------------------------------
+# Sequence classifiers
+# -----------------------------------------------------------------------------
+
+def _forward_logits(model_name, local_files_only, items):
+    """One padded forward pass; items are texts or (text, text_pair) tuples. Returns logits per item"""
+    import torch
+
+    tokenizer, model = model_serving.load_model(model_name, local_files_only=local_files_only)
+    texts = [item[0] if isinstance(item, tuple) else item for item in items]
+    pairs = [item[1] if isinstance(item, tuple) else None for item in items]
+    encoded = tokenizer(
+        texts,
+        pairs if any(p is not None for p in pairs) else None,
+        padding=True,
+        truncation=True,
+        max_length=BATCH_MAX_LENGTH,
+        return_tensors='pt'
+    )
+    with torch.no_grad():
+        logits = model(**encoded).logits
+    return logits.tolist()
+
+
+_batchers = {}
+_batchers_lock = threading.Lock()
+
+
+def get_batcher(model_name, local_files_only=False):
+    """The process-wide batcher for a sequence-classification model"""
+    with _batchers_lock:
+        batcher = _batchers.get(model_name)
+        if batcher is None:
+            batcher = _batchers[model_name] = MicroBatcher(
+                model_name, lambda items: _forward_logits(model_name, local_files_only, items)
+            )
+        return batcher
+
+
+def _labels(model_name, local_files_only):
+    _, model = model_serving.load_model(model_name, local_files_only=local_files_only)
+    return [model.config.id2label[i] for i in range(len(model.config.id2label))]
+
+
+def _softmax(values):
+    peak = max(values)
+    exps = [math.exp(v - peak) for v in values]
+    total = sum(exps)
+    return [e / total for e in exps]
+
+
+def classify_many(model_name, items, local_files_only=False):
+    """
+    Label probabilities for each item (a text or a (text, text_pair) tuple),
+    as [{'label', 'score'}] sorted by score like a text-classification pipeline
+    called with top_k=None.
+    """
+    if not items:
+        return []
+    all_logits = get_batcher(model_name, local_files_only).submit_many(list(items))
+    labels = _labels(model_name, local_files_only)
+    results = []
+    for logits in all_logits:
+        scores = [{'label': label, 'score': score} for label, score in zip(labels, _softmax(logits))]
+        results.append(sorted(scores, key=lambda s: s['score'], reverse=True))
+    return results
+
+
+def classify(model_name, text, text_pair=None, local_files_only=False):
+    item = (text, text_pair) if text_pair is not None else text
+    return classify_many(model_name, [item], local_files_only)[0]
+
+
+def zero_shot(model_name, text, candidate_labels, hypothesis_template="This example is {}.", local_files_only=False):
+    """
+    Single-label zero-shot classification through an NLI model, batched: every
+    (text, hypothesis) pair goes through the model's batcher. Same output shape
+    as the zero-shot-classification pipeline: {'sequence', 'labels', 'scores'}.
+    """
+    pairs = [(text, hypothesis_template.format(label)) for label in candidate_labels]
+    all_logits = get_batcher(model_name, local_files_only).submit_many(pairs)
+    labels = [label.lower() for label in _labels(model_name, local_files_only)]
+    entail_id = labels.index('entailment') if 'entailment' in labels else len(labels) - 1
+    scores = _softmax([logits[entail_id] for logits in all_logits])
+    ranked = sorted(zip(candidate_labels, scores), key=lambda pair: pair[1], reverse=True)
+    return {
+        'sequence': text,
+        'labels': [label for label, _ in ranked],
+        'scores': [score for _, score in ranked],
+    }
+
+
+def stats():
+    with _batchers_lock:
+        batchers = dict(_batchers)
+    return {name: batcher.snapshot() for name, batcher in batchers.items()}
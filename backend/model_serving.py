@@ -0,0 +1,312 @@
+"""
+Process-wide serving of the local transformer models
+File: model_serving.py
+
+Models are loaded once per process and shared by every caller. Two runtimes
+are supported for sequence-classification models (the roberta detector and
+bart-large-mnli):
+- transformers (default): PyTorch on CPU. With MODEL_SHARE_MMAP=1 the weights
+  are saved once as a plain state dict and memory-mapped back, so every worker
+  process on the host shares the same physical pages.
+- onnx: the model is exported once to ONNX with optimum, dynamically quantized
+  to int8 with onnxruntime and served through ORT.
+
+Choose with MODEL_RUNTIME. Call preload() before forking workers (e.g. gunicorn
+--preload) so the loaded weights are shared copy-on-write.
+
+Benchmark the runtimes against each other:
+    python model_serving.py bench --model openai-community/roberta-base-openai-detector
+"""
+
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+
+MODEL_RUNTIME = os.getenv('MODEL_RUNTIME', 'transformers').lower()
+MODEL_CACHE_DIR = os.getenv('MODEL_CACHE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), '.model_cache'))
+MODEL_THREADS = int(os.getenv('MODEL_THREADS', '0'))  # 0 = library default
+MODEL_SHARE_MMAP = os.getenv('MODEL_SHARE_MMAP', '0') == '1'
+
+SEQUENCE_TASKS = {'text-classification', 'zero-shot-classification'}
+
+_models = {}
+_pipelines = {}
+_load_times = {}
+_lock = threading.RLock()
+
+
+def _cache_dir(model_name, kind):
+    path = os.path.join(MODEL_CACHE_DIR, model_name.replace('/', '__'), kind)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def _set_threads():
+    if MODEL_THREADS:
+        import torch
+        torch.set_num_threads(MODEL_THREADS)
+
+
+# -----------------------------------------------------------------------------
+# transformers runtime
+# -----------------------------------------------------------------------------
+
+def _load_mmap_shared(model_name, local_files_only):
+    """Load a sequence classifier whose weights are memory-mapped from a shared state-dict file"""
+    import torch
+    from transformers import AutoConfig, AutoModelForSequenceClassification
+
+    weights_path = os.path.join(_cache_dir(model_name, 'mmap'), 'state_dict.pt')
+    if not os.path.exists(weights_path):
+        model = AutoModelForSequenceClassification.from_pretrained(model_name, local_files_only=local_files_only)
+        tmp_path = weights_path + f'.{os.getpid()}.tmp'
+        torch.save(model.state_dict(), tmp_path)
+        os.replace(tmp_path, weights_path)
+        del model
+
+    config = AutoConfig.from_pretrained(model_name, local_files_only=local_files_only)
+    with torch.device('meta'):
+        model = AutoModelForSequenceClassification.from_config(config)
+    state_dict = torch.load(weights_path, mmap=True, weights_only=True)
+    model.load_state_dict(state_dict, assign=True)
+    model.tie_weights()
+    return model
+
+
+def _load_transformers(model_name, local_files_only):
+    from transformers import AutoModelForSequenceClassification
+
+    _set_threads()
+    if MODEL_SHARE_MMAP:
+        model = _load_mmap_shared(model_name, local_files_only)
+    else:
+        model = AutoModelForSequenceClassification.from_pretrained(
+            model_name, local_files_only=local_files_only, low_cpu_mem_usage=True
+        )
+    model.eval()
+    return model
+
+
+# -----------------------------------------------------------------------------
+# ONNX runtime with int8 dynamic quantization
+# -----------------------------------------------------------------------------
+
+def export_onnx(model_name, quantize=True, local_files_only=False):
+    """Export a sequence classifier to ONNX (and an int8 copy) under MODEL_CACHE_DIR"""
+    from optimum.onnxruntime import ORTModelForSequenceClassification
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+    from transformers import AutoTokenizer
+
+    out_dir = _cache_dir(model_name, 'onnx')
+    if not os.path.exists(os.path.join(out_dir, 'model.onnx')):
+        print(f"Exporting {model_name} to ONNX...")
+        model = ORTModelForSequenceClassification.from_pretrained(
+            model_name, export=True, local_files_only=local_files_only
+        )
+        model.save_pretrained(out_dir)
+        AutoTokenizer.from_pretrained(model_name, local_files_only=local_files_only).save_pretrained(out_dir)
+
+    int8_path = os.path.join(out_dir, 'model_int8.onnx')
+    if quantize and not os.path.exists(int8_path):
+        print(f"Quantizing {model_name} to int8...")
+        quantize_dynamic(os.path.join(out_dir, 'model.onnx'), int8_path, weight_type=QuantType.QInt8)
+    return out_dir
+
+
+def _load_onnx(model_name, local_files_only):
+    import onnxruntime
+    from optimum.onnxruntime import ORTModelForSequenceClassification
+
+    out_dir = export_onnx(model_name, quantize=True, local_files_only=local_files_only)
+    options = onnxruntime.SessionOptions()
+    options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+    if MODEL_THREADS:
+        options.intra_op_num_threads = MODEL_THREADS
+    return ORTModelForSequenceClassification.from_pretrained(
+        out_dir, file_name='model_int8.onnx', session_options=options
+    )
+
+
+# -----------------------------------------------------------------------------
+# Public API
+# -----------------------------------------------------------------------------
+
+def load_model(model_name, runtime=None, local_files_only=False):
+    """(tokenizer, model) for a sequence classifier, loaded once per process and runtime"""
+    runtime = runtime or MODEL_RUNTIME
+    key = (model_name, runtime)
+    with _lock:
+        if key not in _models:
+            from transformers import AutoTokenizer
+
+            started = time.perf_counter()
+            tokenizer = AutoTokenizer.from_pretrained(model_name, local_files_only=local_files_only)
+            if runtime == 'onnx':
+                model = _load_onnx(model_name, local_files_only)
+            elif runtime == 'transformers':
+                model = _load_transformers(model_name, local_files_only)
+            else:
+                raise ValueError(f"Unknown MODEL_RUNTIME '{runtime}'. Choose transformers or onnx")
+            _models[key] = (tokenizer, model)
+            _load_times[f"{model_name} [{runtime}]"] = round(time.perf_counter() - started, 2)
+            print(f"Loaded {model_name} ({runtime}) in {_load_times[f'{model_name} [{runtime}]']}s")
+        return _models[key]
+
+
+def get_pipeline(task, model_name, runtime=None, local_files_only=False, **pipeline_kwargs):
+    """
+    A transformers pipeline built once per process. Sequence-classification
+    tasks run on the configured runtime; other tasks (e.g. text-generation)
+    always use plain transformers.
+    """
+    runtime = runtime or MODEL_RUNTIME
+    key = (task, model_name, runtime, tuple(sorted((k, repr(v)) for k, v in pipeline_kwargs.items())))
+    with _lock:
+        if key not in _pipelines:
+            from transformers import pipeline
+
+            if task in SEQUENCE_TASKS:
+                tokenizer, model = load_model(model_name, runtime, local_files_only)
+                _pipelines[key] = pipeline(task, model=model, tokenizer=tokenizer, **pipeline_kwargs)
+            else:
+                _set_threads()
+                started = time.perf_counter()
+                _pipelines[key] = pipeline(task, model=model_name, **pipeline_kwargs)
+                _load_times[f"{model_name} [{task}]"] = round(time.perf_counter() - started, 2)
+        return _pipelines[key]
+
+
+def load_causal_lm(model_name, local_files_only=False):
+    """(tokenizer, model) for a text-generation model, loaded once per process (PyTorch on CPU)"""
+    key = (model_name, 'causal-lm')
+    with _lock:
+        if key not in _models:
+            from transformers import AutoModelForCausalLM, AutoTokenizer
+
+            _set_threads()
+            started = time.perf_counter()
+            tokenizer = AutoTokenizer.from_pretrained(model_name, local_files_only=local_files_only)
+            model = AutoModelForCausalLM.from_pretrained(
+                model_name, local_files_only=local_files_only, low_cpu_mem_usage=True
+            )
+            model.eval()
+            _models[key] = (tokenizer, model)
+            _load_times[f"{model_name} [causal-lm]"] = round(time.perf_counter() - started, 2)
+            print(f"Loaded {model_name} (causal-lm) in {_load_times[f'{model_name} [causal-lm]']}s")
+        return _models[key]
+
+
+def preload(specs):
+    """Load models up front, e.g. in the gunicorn master before workers fork. specs: [(task, model_name)]"""
+    for task, model_name in specs:
+        get_pipeline(task, model_name)
+
+
+def stats():
+    with _lock:
+        return {
+            'runtime': MODEL_RUNTIME,
+            'share_mmap': MODEL_SHARE_MMAP,
+            'loaded': dict(_load_times),
+        }
+
+
+# -----------------------------------------------------------------------------
+# Benchmark
+# -----------------------------------------------------------------------------
+
+BENCH_TEXTS = [
+    "The city council approved the new budget after a long debate on Tuesday.",
+    "Drinking lemon water every morning cures cancer within two weeks.",
+    "Scientists have confirmed that the Great Wall of China is visible from the Moon with the naked eye.",
+    "The central bank kept interest rates unchanged, citing stable inflation.",
+    "5G towers spread viruses through radio waves, according to a viral post.",
+    "The football match was postponed because of heavy rain in the region.",
+    "A new study suggests regular exercise improves sleep quality in adults.",
+    "Vaccines contain microchips that track people's locations.",
+]
+
+
+def _rss_mb():
+    """Current resident set size in MB (Linux /proc, falling back to peak RSS)"""
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _bench_single(model_name, runtime, repeats):
+    """
+    Measure one runtime in the current (fresh) process. 'baseline' is the plain
+    transformers pipeline the scripts used before; 'mmap' is the transformers
+    runtime with memory-mapped shared weights.
+    """
+    global MODEL_SHARE_MMAP
+    rss_before = _rss_mb()
+    started = time.perf_counter()
+    if runtime == 'baseline':
+        from transformers import pipeline
+        pipe = pipeline('text-classification', model=model_name)
+    elif runtime == 'mmap':
+        MODEL_SHARE_MMAP = True
+        pipe = get_pipeline('text-classification', model_name, runtime='transformers')
+    else:
+        pipe = get_pipeline('text-classification', model_name, runtime=runtime)
+    pipe(BENCH_TEXTS[0])
+    cold_start = time.perf_counter() - started
+
+    latencies = []
+    for _ in range(repeats):
+        for text in BENCH_TEXTS:
+            t0 = time.perf_counter()
+            pipe(text)
+            latencies.append((time.perf_counter() - t0) * 1000)
+    latencies.sort()
+    return {
+        'runtime': runtime,
+        'cold_start_s': round(cold_start, 2),
+        'latency_ms_mean': round(sum(latencies) / len(latencies), 2),
+        'latency_ms_p50': round(latencies[len(latencies) // 2], 2),
+        'latency_ms_p95': round(latencies[int(len(latencies) * 0.95) - 1], 2),
+        'rss_mb': round(_rss_mb(), 1),
+        'rss_delta_mb': round(_rss_mb() - rss_before, 1),
+    }
+
+
+def benchmark(model_name, runtimes=('baseline', 'transformers', 'mmap', 'onnx'), repeats=5):
+    """Benchmark each runtime in its own subprocess so cold start and RSS are not shared"""
+    results = []
+    for runtime in runtimes:
+        proc = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), 'bench-single', model_name, runtime, str(repeats)],
+            capture_output=True, text=True
+        )
+        if proc.returncode != 0:
+            results.append({'runtime': runtime, 'error': proc.stderr.strip().splitlines()[-1:]})
+            continue
+        results.append(json.loads(proc.stdout.strip().splitlines()[-1]))
+    return results
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    if args[:1] == ['bench-single']:
+        print(json.dumps(_bench_single(args[1], args[2], int(args[3]))))
+    elif args[:1] == ['bench']:
+        model = args[args.index('--model') + 1] if '--model' in args else 'openai-community/roberta-base-openai-detector'
+        runtimes = args[args.index('--runtimes') + 1].split(',') if '--runtimes' in args else ['baseline', 'transformers', 'mmap', 'onnx']
+        for row in benchmark(model, runtimes):
+            print(json.dumps(row))
+    elif args[:1] == ['export']:
+        print(export_onnx(args[1]))
+    else:
+        print("Usage: python model_serving.py bench [--model NAME] [--runtimes baseline,transformers,mmap,onnx]")
+        print("       python model_serving.py export MODEL_NAME")
@@ -0,0 +1,225 @@
+"""
+Local NLI pre-screening stage for fact-checks
+File: nli_cascade.py
+
+Before a claim goes to Gemini, a local NLI model (facebook/bart-large-mnli by
+default) scores the claim against each retrieved search snippet. If the
+snippets clearly entail or clearly contradict the claim, that verdict is
+returned right away. Everything else escalates to the LLM tier.
+
+A sample of the claims the NLI tier decides is also sent to the LLM in the
+background (NLI_SHADOW_RATE), so the stats report how often the two tiers agree;
+only the other NLI-settled claims count as LLM calls saved. NLI verdicts are
+returned to the caller but not recorded in the shared verdict store, which
+only holds LLM verdicts.
+
+The stage is off unless NLI_CASCADE_ENABLED=1: the default model is about
+1.6GB. The model takes seconds to load, so it is never loaded on a request
+thread: preload() (called at startup, or by the first prescreen) loads it in
+the background, and until it is ready every claim goes straight to the LLM tier.
+"""
+
+import os
+import random
+import re
+import threading
+
+NLI_ENABLED = os.getenv('NLI_CASCADE_ENABLED', '0') == '1'
+NLI_MODEL = os.getenv('NLI_MODEL', 'facebook/bart-large-mnli')
+
+# Tier thresholds: minimum probability needed to settle a claim without the LLM
+ENTAIL_THRESHOLD = float(os.getenv('NLI_ENTAIL_THRESHOLD', '0.90'))
+CONTRADICT_THRESHOLD = float(os.getenv('NLI_CONTRADICT_THRESHOLD', '0.90'))
+# Snippets that point the other way above this probability count as conflicting evidence
+MAX_CONFLICT = float(os.getenv('NLI_MAX_CONFLICT', '0.30'))
+MIN_AGREEING_SNIPPETS = int(os.getenv('NLI_MIN_AGREEING_SNIPPETS', '2'))
+SHADOW_RATE = float(os.getenv('NLI_SHADOW_RATE', '0.05'))
+MAX_SNIPPETS = int(os.getenv('NLI_MAX_SNIPPETS', '5'))
+
+_classifier = None
+_load_failed = False
+_load_started = False
+_load_lock = threading.Lock()
+_stats_lock = threading.Lock()
+_stats = {
+    'claims': 0,
+    'decided_true': 0,
+    'decided_false': 0,
+    'escalated': 0,
+    'errors': 0,
+    'skipped_loading': 0,
+    'shadow_calls': 0,
+    'shadow_checks': 0,
+    'shadow_agreements': 0,
+}
+
+
+def _count(key, n=1):
+    with _stats_lock:
+        _stats[key] += n
+
+
+def _load():
+    global _classifier, _load_failed
+    try:
+        import micro_batcher
+        import model_serving
+        model_serving.load_model(NLI_MODEL)
+        _classifier = micro_batcher.get_batcher(NLI_MODEL)
+        print(f"NLI cascade ready ({NLI_MODEL})")
+    except Exception as e:
+        print(f"NLI cascade disabled, model could not be loaded: {str(e)}")
+        _load_failed = True
+
+
+def preload():
+    """Start loading the NLI model in a background thread (once per process)"""
+    global _load_started
+    if not NLI_ENABLED:
+        return
+    with _load_lock:
+        if _load_started:
+            return
+        _load_started = True
+    threading.Thread(target=_load, name='nli-preload', daemon=True).start()
+
+
+def _get_classifier():
+    """The NLI model's micro-batcher once it is loaded; None while loading or if it cannot be loaded"""
+    if _classifier is None and not _load_failed:
+        preload()
+    return _classifier
+
+
+def _label_scores(output):
+    """Map one pipeline output (list of {label, score}) to entailment/contradiction probabilities"""
+    scores = {item['label'].lower(): item['score'] for item in output}
+    return {
+        'entailment': scores.get('entailment', 0.0),
+        'neutral': scores.get('neutral', 0.0),
+        'contradiction': scores.get('contradiction', 0.0),
+    }
+
+
+def score_claim(claim, snippets):
+    """Entailment/contradiction probabilities of the claim against each snippet (premise)"""
+    classifier = _get_classifier()
+    if classifier is None:
+        return None
+    snippets = [s for s in snippets if s and s.strip()][:MAX_SNIPPETS]
+    if not snippets:
+        return []
+    # All snippets of this claim share one batch (with any other claims being scored right now)
+    import micro_batcher
+    outputs = micro_batcher.classify_many(NLI_MODEL, [(snippet, claim) for snippet in snippets])
+    return [_label_scores(output) for output in outputs]
+
+
+def prescreen(claim, snippets):
+    """
+    Run the NLI tier for a claim. Returns None when the stage is disabled or
+    unavailable, otherwise a dict whose 'decision' is 'TRUE', 'FALSE' or None
+    (escalate to the LLM).
+    """
+    if not NLI_ENABLED or not claim:
+        return None
+    try:
+        scores = score_claim(claim, snippets)
+    except Exception as e:
+        _count('errors')
+        print(f"NLI scoring error: {str(e)}")
+        return None
+    if scores is None:
+        if not _load_failed:
+            _count('skipped_loading')
+        return None
+
+    _count('claims')
+    entail = max((s['entailment'] for s in scores), default=0.0)
+    contradict = max((s['contradiction'] for s in scores), default=0.0)
+    entailing = sum(1 for s in scores if s['entailment'] >= ENTAIL_THRESHOLD)
+    contradicting = sum(1 for s in scores if s['contradiction'] >= CONTRADICT_THRESHOLD)
+
+    decision = None
+    confidence = 0
+    if entailing >= MIN_AGREEING_SNIPPETS and contradict < MAX_CONFLICT:
+        decision, confidence = 'TRUE', entail
+        _count('decided_true')
+    elif contradicting >= MIN_AGREEING_SNIPPETS and entail < MAX_CONFLICT:
+        decision, confidence = 'FALSE', contradict
+        _count('decided_false')
+    else:
+        _count('escalated')
+
+    return {
+        'decision': decision,
+        'confidence_score': int(round(confidence * 100)),
+        'entailment': round(entail, 4),
+        'contradiction': round(contradict, 4),
+        'snippet_scores': scores,
+    }
+
+
+def as_fact_check_response(result, evidence_summary):
+    """Fact-check JSON (same shape as the LLM tier's) for a claim the NLI tier settled"""
+    verdict = result['decision']
+    agreeing = 'support' if verdict == 'TRUE' else 'contradict'
+    return {
+        "agent_response": f"The search results clearly {agreeing} this claim, so it looks {verdict.lower()}.",
+        "verdict": verdict,
+        "confidence_score": result['confidence_score'],
+        "evidence_summary": evidence_summary,
+    }
+
+
+def extract_verdict(text):
+    """Pull TRUE/FALSE/UNVERIFIABLE out of an LLM answer (JSON or VERDICT: line)"""
+    match = re.search(r'"?verdict"?\s*[:=]\s*"?\s*(TRUE|FALSE|UNVERIFIABLE)', text or '', re.IGNORECASE)
+    return match.group(1).upper() if match else None
+
+
+def maybe_shadow(nli_verdict, llm_call):
+    """
+    For a sample of NLI-settled claims, call the LLM tier in the background and
+    record whether it agrees. llm_call() must return the LLM's raw answer text.
+    """
+    if random.random() >= SHADOW_RATE:
+        return
+    _count('shadow_calls')
+
+    def check():
+        try:
+            llm_verdict = extract_verdict(llm_call())
+        except Exception as e:
+            print(f"NLI shadow check failed: {str(e)}")
+            return
+        if llm_verdict:
+            record_agreement(nli_verdict, llm_verdict)
+
+    threading.Thread(target=check, daemon=True).start()
+
+
+def record_agreement(nli_verdict, llm_verdict):
+    _count('shadow_checks')
+    if nli_verdict == llm_verdict:
+        _count('shadow_agreements')
+
+
+def stats():
+    """Counters for the stage, including LLM calls saved and agreement with the LLM tier"""
+    with _stats_lock:
+        result = dict(_stats)
+    # Shadowed claims still made their LLM call, just off the request path
+    result['llm_calls_saved'] = result['decided_true'] + result['decided_false'] - result['shadow_calls']
+    result['agreement_rate'] = (
+        round(result['shadow_agreements'] / result['shadow_checks'], 4) if result['shadow_checks'] else None
+    )
+    result['enabled'] = NLI_ENABLED and not _load_failed
+    result['ready'] = _classifier is not None
+    result['thresholds'] = {
+        'entail': ENTAIL_THRESHOLD,
+        'contradict': CONTRADICT_THRESHOLD,
+        'max_conflict': MAX_CONFLICT,
+        'min_agreeing_snippets': MIN_AGREEING_SNIPPETS,
+    }
+    return result
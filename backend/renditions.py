@@ -0,0 +1,364 @@
+"""
+Background renditions of post media
+File: renditions.py
+
+Images: a worker pool renders each image post into a set of sizes (thumb,
+feed, full) in WebP and JPEG with Pillow. Videos: the same pool extracts a
+poster frame and a short, silent, low-bitrate preview clip with ffmpeg, and
+keeps the original as a file so it can be served with range requests.
+
+Originals are never read into memory: an upload-backed post is rendered
+straight from the upload's file (which also serves the original video), and
+inline base64 media is decoded in chunks to a temporary file first.
+
+Files live under RENDITION_DIR keyed by the content hash of the original.
+postsave only enqueues the job; once the files exist the post document gets a
+'renditions' (or 'video_renditions') map and feed responses reference those
+instead of the inline original.
+
+Backfill existing posts:
+    python renditions.py backfill
+"""
+
+import base64
+import hashlib
+import mimetypes
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image, ImageOps
+
+from video_pipeline import FFMPEG, FFMPEG_TIMEOUT, SPOOL_CHUNK_SIZE, probe
+
+RENDITION_DIR = os.getenv('RENDITION_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), '.renditions'))
+RENDITION_WORKERS = int(os.getenv('RENDITION_WORKERS', '2'))
+WEBP_QUALITY = int(os.getenv('RENDITION_WEBP_QUALITY', '80'))
+JPEG_QUALITY = int(os.getenv('RENDITION_JPEG_QUALITY', '82'))
+
+# Longest side in pixels for each rendition, smallest first
+SIZES = {
+    'thumb': int(os.getenv('RENDITION_THUMB_SIDE', '320')),
+    'feed': int(os.getenv('RENDITION_FEED_SIDE', '960')),
+    'full': int(os.getenv('RENDITION_FULL_SIDE', '2048')),
+}
+FORMATS = {'webp': ('WEBP', 'image/webp'), 'jpg': ('JPEG', 'image/jpeg')}
+
+PREVIEW_SECONDS = int(os.getenv('RENDITION_PREVIEW_SECONDS', '6'))
+PREVIEW_HEIGHT = int(os.getenv('RENDITION_PREVIEW_HEIGHT', '360'))
+PREVIEW_BITRATE = os.getenv('RENDITION_PREVIEW_BITRATE', '300k')
+POSTER_SIDE = int(os.getenv('RENDITION_POSTER_SIDE', '960'))
+VIDEO_EXTENSIONS = {'video/mp4': 'mp4', 'video/webm': 'webm', 'video/quicktime': 'mov', 'video/mpeg': 'mpeg', 'video/x-msvideo': 'avi'}
+VIDEO_FILES = {'poster': {'jpg'}, 'preview': {'mp4'}, 'original': set(VIDEO_EXTENSIONS.values())}
+
+_executor = ThreadPoolExecutor(max_workers=RENDITION_WORKERS, thread_name_prefix='rendition')
+_stats_lock = threading.Lock()
+_stats = {
+    'jobs': 0,
+    'rendered': 0,
+    'errors': 0,
+    'feed_pages': 0,
+    'feed_response_bytes': 0,
+    'feed_media_bytes': 0,
+    'feed_media_bytes_original': 0,
+}
+
+
+def _count(key, n=1):
+    with _stats_lock:
+        _stats[key] += n
+
+
+def _file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(SPOOL_CHUNK_SIZE)
+            if not chunk:
+                break
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+@contextmanager
+def open_source(media=None, path=None, sha256=None):
+    """
+    (path, sha256, size) of a post's original media: the file at path (an
+    upload; sha256 is computed in chunks unless given), or the base64 media
+    decoded in chunks to a temporary file that is removed on exit.
+    """
+    if path:
+        yield path, sha256 or _file_sha256(path), os.path.getsize(path)
+        return
+    payload = media.split(',', 1)[1] if media.startswith('data:') else media
+    payload = ''.join(payload.split())
+    os.makedirs(RENDITION_DIR, exist_ok=True)
+    handle = tempfile.NamedTemporaryFile(prefix='source_', dir=RENDITION_DIR, delete=False)
+    digest = hashlib.sha256()
+    size = 0
+    step = SPOOL_CHUNK_SIZE // 3 * 4  # whole base64 quanta
+    try:
+        with handle:
+            for start in range(0, len(payload), step):
+                chunk = base64.b64decode(payload[start:start + step])
+                digest.update(chunk)
+                handle.write(chunk)
+                size += len(chunk)
+        yield handle.name, digest.hexdigest(), size
+    finally:
+        try:
+            os.remove(handle.name)
+        except OSError:
+            pass
+
+
+def render(source, sha256, size):
+    """
+    Write every rendition of the image file at source and return its description:
+    {'key', 'original_bytes', 'sizes': {name: {'width', 'height', 'files': {ext: bytes}}}}
+    """
+    key = sha256[:32]
+    directory = os.path.join(RENDITION_DIR, key)
+    os.makedirs(directory, exist_ok=True)
+
+    img = Image.open(source)
+    img = ImageOps.exif_transpose(img)
+    if img.mode in ('RGBA', 'LA', 'P'):
+        rgba = img.convert('RGBA')
+        img = Image.new('RGB', rgba.size, (255, 255, 255))
+        img.paste(rgba, mask=rgba.split()[-1])
+    elif img.mode != 'RGB':
+        img = img.convert('RGB')
+
+    sizes = {}
+    previous = None
+    for name, side in SIZES.items():
+        rendition = img.copy()
+        rendition.thumbnail((side, side), Image.LANCZOS)
+        if previous and rendition.size == previous:
+            # The original is smaller than this size: reuse the previous rendition
+            sizes[name] = dict(sizes[list(sizes)[-1]])
+            continue
+        previous = rendition.size
+        files = {}
+        for ext, (fmt, _) in FORMATS.items():
+            path = os.path.join(directory, f'{name}.{ext}')
+            if not os.path.exists(path):
+                tmp = f'{path}.{threading.get_ident()}.tmp'
+                options = {'quality': WEBP_QUALITY, 'method': 4} if fmt == 'WEBP' else {'quality': JPEG_QUALITY, 'optimize': True, 'progressive': True}
+                rendition.save(tmp, format=fmt, **options)
+                os.replace(tmp, path)
+            files[ext] = os.path.getsize(path)
+        sizes[name] = {'width': rendition.size[0], 'height': rendition.size[1], 'files': files, 'name': name}
+    return {'key': key, 'original_bytes': size, 'sizes': sizes}
+
+
+def _video_extension(media, content_type):
+    if content_type in VIDEO_EXTENSIONS:
+        return VIDEO_EXTENSIONS[content_type]
+    if media and media.startswith('data:'):
+        return VIDEO_EXTENSIONS.get(media[5:].split(';', 1)[0], 'mp4')
+    return 'mp4'
+
+
+def _ffmpeg(args):
+    result = subprocess.run([FFMPEG, '-v', 'error', '-nostdin', '-y'] + args, capture_output=True, text=True, timeout=FFMPEG_TIMEOUT)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip()[-200:])
+
+
+def render_video(source, sha256, size, content_type=None, media=None, store_original=True):
+    """
+    Make a poster frame and a short silent preview clip of the video file at
+    source when ffmpeg is available, and keep a copy of the original unless
+    store_original is False (an upload, which serves the original itself).
+    ffmpeg reads source directly. Returns {'key', 'original', 'original_bytes',
+    'poster', 'preview'}, where original is the stored file's extension (None
+    when not stored) and poster/preview are byte sizes (None when they could
+    not be made).
+    """
+    key = sha256[:32]
+    directory = os.path.join(RENDITION_DIR, key)
+    os.makedirs(directory, exist_ok=True)
+    ext = None
+    if store_original:
+        ext = _video_extension(media, content_type)
+        original = os.path.join(directory, f'original.{ext}')
+        if not os.path.exists(original):
+            shutil.copyfile(source, original + '.tmp')
+            os.replace(original + '.tmp', original)
+
+    result = {'key': key, 'original': ext, 'original_bytes': size, 'poster': None, 'preview': None}
+    if not FFMPEG:
+        print("ffmpeg not found, video posts get no poster or preview")
+        return result
+
+    poster = os.path.join(directory, 'poster.jpg')
+    preview = os.path.join(directory, 'preview.mp4')
+    scale = f"scale='min({POSTER_SIDE},iw)':-2"
+    try:
+        if not os.path.exists(poster):
+            # A frame one second in skips fade-ins and black openers (first frame for very short clips)
+            try:
+                duration = probe(source)['duration_s']
+            except Exception:
+                duration = 0
+            seek = '1' if duration >= 2 else '0'
+            _ffmpeg(['-ss', seek, '-i', source, '-vf', scale, '-frames:v', '1', '-q:v', '4', poster + '.tmp.jpg'])
+            os.replace(poster + '.tmp.jpg', poster)
+        result['poster'] = os.path.getsize(poster)
+    except Exception as e:
+        print(f"Poster extraction failed for {key}: {str(e)}")
+    try:
+        if not os.path.exists(preview):
+            _ffmpeg([
+                '-i', source, '-t', str(PREVIEW_SECONDS), '-an',
+                '-vf', f"scale=-2:'trunc(min({PREVIEW_HEIGHT},ih)/2)*2'", '-c:v', 'libx264', '-preset', 'veryfast',
+                '-b:v', PREVIEW_BITRATE, '-maxrate', PREVIEW_BITRATE, '-bufsize', '600k',
+                '-pix_fmt', 'yuv420p', '-movflags', '+faststart', preview + '.tmp.mp4'
+            ])
+            os.replace(preview + '.tmp.mp4', preview)
+        result['preview'] = os.path.getsize(preview)
+    except Exception as e:
+        print(f"Preview clip failed for {key}: {str(e)}")
+    return result
+
+
+def file_path(key, name, ext):
+    """Path of a stored rendition, or None for invalid names"""
+    if not key or not all(c in '0123456789abcdef' for c in key):
+        return None
+    if (name in SIZES and ext in FORMATS) or ext in VIDEO_FILES.get(name, ()):
+        return os.path.join(RENDITION_DIR, key, f'{name}.{ext}')
+    return None
+
+
+def mime_type(ext):
+    if ext in FORMATS:
+        return FORMATS[ext][1]
+    return mimetypes.guess_type(f'file.{ext}')[0] or 'application/octet-stream'
+
+
+def render_post(media=None, path=None, media_type='image', content_type=None, sha256=None):
+    """Renditions of a post's media, from its upload file (path) or inline base64 media"""
+    with open_source(media, path, sha256) as (source, digest, size):
+        if media_type == 'video':
+            return render_video(source, digest, size, content_type, media, store_original=not path)
+        return render(source, digest, size)
+
+
+def submit(post_id, on_done, media=None, path=None, media_type='image', content_type=None, sha256=None):
+    """
+    Render a post's media in the background; on_done(post_id, media_type,
+    renditions) is called when ready.
+    """
+    _count('jobs')
+
+    def job():
+        try:
+            renditions = render_post(media, path, media_type, content_type, sha256)
+            on_done(post_id, media_type, renditions)
+            _count('rendered')
+        except Exception as e:
+            _count('errors')
+            print(f"Rendition job for post {post_id} failed: {str(e)}")
+
+    return _executor.submit(job)
+
+
+def pick(renditions, size, ext):
+    """(url_name, entry) of the rendition to use for `size`, falling back to larger ones"""
+    names = list(SIZES)
+    for name in names[names.index(size):]:
+        entry = renditions['sizes'].get(name)
+        if entry and ext in entry['files']:
+            return entry['name'], entry
+    return None, None
+
+
+def url_for(base_url, renditions, size, ext):
+    name, entry = pick(renditions, size, ext)
+    if entry is None:
+        return None, 0
+    return f"{base_url}api/media/{renditions['key']}/{name}.{ext}", entry['files'][ext]
+
+
+def video_urls(base_url, video_renditions):
+    """
+    (preview_or_full_url, poster_url, full_url, served_bytes) for a video post;
+    the full URL is None when the original is served from its upload instead.
+    """
+    prefix = f"{base_url}api/media/{video_renditions['key']}"
+    full_url = f"{prefix}/original.{video_renditions['original']}" if video_renditions.get('original') else None
+    poster_url = f"{prefix}/poster.jpg" if video_renditions.get('poster') else None
+    if video_renditions.get('preview'):
+        return f"{prefix}/preview.mp4", poster_url, full_url, video_renditions['preview'] + (video_renditions.get('poster') or 0)
+    return full_url, poster_url, full_url, video_renditions.get('poster') or 0
+
+
+def record_feed_page(response_bytes, media_bytes, original_media_bytes):
+    """Bytes of one feed response plus the media it references, and what the originals would have cost"""
+    _count('feed_pages')
+    _count('feed_response_bytes', response_bytes)
+    _count('feed_media_bytes', media_bytes)
+    _count('feed_media_bytes_original', original_media_bytes)
+
+
+def stats():
+    with _stats_lock:
+        result = dict(_stats)
+    pages = result['feed_pages'] or 1
+    result['mean_bytes_per_page'] = round((result['feed_response_bytes'] + result['feed_media_bytes']) / pages)
+    result['mean_original_media_bytes_per_page'] = round(result['feed_media_bytes_original'] / pages)
+    result['sizes'] = SIZES
+    return result
+
+
+def backfill(posts_collection):
+    """Render every image and video post that has no renditions yet (synchronously)"""
+    cursor = posts_collection.find(
+        {'$or': [
+            {'mediaType': 'image', 'media': {'$ne': None}, 'renditions': {'$exists': False}},
+            {'mediaType': 'video', 'media': {'$ne': None}, 'video_renditions': {'$exists': False}},
+        ]},
+        {'_id': 1, 'post_id': 1, 'media': 1, 'mediaType': 1, 'media_upload_id': 1}
+    )
+    done = failed = 0
+    for post in cursor:
+        try:
+            path = content_type = sha256 = None
+            if post.get('media_upload_id'):
+                import uploads
+                path, meta = uploads.open_finalized(post['media_upload_id'])
+                # The sniffed type, never the one the client declared
+                content_type = uploads.serve_type(meta)
+                if content_type.split('/')[0] != post['mediaType']:
+                    raise ValueError(f"upload is {content_type}, not {post['mediaType']}")
+                sha256 = meta['sha256']
+            renditions = render_post(None if path else post.get('media'), path, post['mediaType'], content_type, sha256)
+            field = 'video_renditions' if post['mediaType'] == 'video' else 'renditions'
+            update = {field: renditions}
+            posts_collection.update_one({'_id': post['_id']}, {'$set': update})
+            done += 1
+        except Exception as e:
+            failed += 1
+            print(f"Post {post.get('post_id')}: {str(e)}")
+    print(f"Backfill complete: {done} posts rendered, {failed} failed")
+    return {'rendered': done, 'failed': failed}
+
+
+if __name__ == '__main__':
+    if sys.argv[1:2] == ['backfill']:
+        from dotenv import load_dotenv
+        from pymongo import MongoClient
+
+        load_dotenv()
+        client = MongoClient(os.getenv('MONGO_URI', 'mongodb://localhost:27017/'))
+        backfill(client['social_media_db']['posts'])
+    else:
+        print("Usage: python renditions.py backfill")
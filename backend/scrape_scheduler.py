@@ -0,0 +1,364 @@
+"""
+Per-domain politeness scheduler for outbound scraping
+File: scrape_scheduler.py
+
+Every scrape goes through one process-wide scheduler that:
+- caps concurrent fetches per domain
+- paces requests per domain with a token bucket
+- honours robots.txt Crawl-delay and Retry-After on 429/503
+- shares in-flight fetches so concurrent requests for one URL wait on a single download
+- caches scraped text briefly, keyed on the canonical URL
+
+Callers with a deadline of their own (a time.monotonic() instant) pass it to
+slot/run/fetch: every wait (domain slot, rate limit, crawl delay, a shared
+in-flight fetch) and the request timeout are cut to the time left, and
+SchedulerBusy is raised rather than starting work the caller no longer wants.
+"""
+
+import os
+import threading
+import time
+from contextlib import contextmanager
+from urllib import robotparser
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import url_utils
+
+# Configuration
+MAX_PER_DOMAIN = int(os.getenv('SCRAPE_MAX_PER_DOMAIN', '2'))
+DOMAIN_RATE = float(os.getenv('SCRAPE_DOMAIN_RATE', '1.0'))      # requests per second per domain
+DOMAIN_BURST = int(os.getenv('SCRAPE_DOMAIN_BURST', '3'))
+QUEUE_TIMEOUT = float(os.getenv('SCRAPE_QUEUE_TIMEOUT', '20'))   # max seconds to wait for a domain slot
+MAX_CRAWL_DELAY = float(os.getenv('SCRAPE_MAX_CRAWL_DELAY', '10'))
+ROBOTS_TTL = int(os.getenv('SCRAPE_ROBOTS_TTL', '3600'))
+ROBOTS_USER_AGENT = os.getenv('SCRAPE_ROBOTS_USER_AGENT', '*')
+SCRAPE_CACHE_TTL = int(os.getenv('SCRAPE_CACHE_TTL', '900'))
+SCRAPE_CACHE_SIZE = int(os.getenv('SCRAPE_CACHE_SIZE', '500'))
+
+
+class SchedulerBusy(requests.exceptions.RequestException):
+    """Raised when a domain slot could not be acquired within QUEUE_TIMEOUT or the caller's deadline"""
+
+
+def _time_left(deadline, limit):
+    """Seconds to wait: limit, cut to what is left before deadline (None for no deadline)"""
+    if deadline is None:
+        return limit
+    return min(limit, deadline - time.monotonic())
+
+
+class TokenBucket:
+    """Thread-safe token bucket: `rate` tokens per second, bursting up to `capacity`"""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self, now):
+        elapsed = now - self.updated
+        self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+        self.updated = now
+
+    def try_acquire(self, tokens=1):
+        """Take tokens without waiting; returns True on success"""
+        with self.lock:
+            self._refill(time.monotonic())
+            if self.tokens >= tokens:
+                self.tokens -= tokens
+                return True
+            return False
+
+    def acquire(self, tokens=1, timeout=None):
+        """Block until tokens are available; returns False if `timeout` expires first"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return True
+                wait = (tokens - self.tokens) / self.rate if self.rate > 0 else 1.0
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                wait = min(wait, remaining)
+            time.sleep(wait)
+
+
+class ResultCache:
+    """Small thread-safe TTL cache with oldest-first eviction"""
+
+    def __init__(self, ttl, max_entries):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.entries = {}
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry and entry[0] > time.time():
+                self.hits += 1
+                return entry[1]
+            if entry:
+                del self.entries[key]
+            self.misses += 1
+            return None
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries.pop(key, None)
+            self.entries[key] = (time.time() + self.ttl, value)
+            while len(self.entries) > self.max_entries:
+                del self.entries[next(iter(self.entries))]
+
+    def stats(self):
+        with self.lock:
+            return {'entries': len(self.entries), 'hits': self.hits, 'misses': self.misses}
+
+
+class _DomainState:
+    def __init__(self):
+        self.slots = threading.BoundedSemaphore(MAX_PER_DOMAIN)
+        self.bucket = TokenBucket(DOMAIN_RATE, DOMAIN_BURST)
+        self.lock = threading.Lock()
+        self.crawl_delay = 0.0
+        self.robots_checked_at = 0.0
+        self.next_allowed = 0.0
+        self.active = 0
+        self.waiting = 0
+
+
+class _InFlight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class ScrapeScheduler:
+    """Coordinates outbound fetches across all request threads"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._domains = {}
+        self._inflight = {}
+        self._stats = {
+            'fetches': 0,
+            'shared': 0,
+            'throttled': 0,
+            'busy': 0,
+            'backoffs': 0,
+        }
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=32, pool_maxsize=MAX_PER_DOMAIN * 16)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def _domain(self, host):
+        with self._lock:
+            state = self._domains.get(host)
+            if state is None:
+                state = self._domains[host] = _DomainState()
+            return state
+
+    def _count(self, key, n=1):
+        with self._lock:
+            self._stats[key] += n
+
+    def _load_robots(self, scheme, netloc, state, deadline=None):
+        """Fetch robots.txt once per ROBOTS_TTL and remember its Crawl-delay"""
+        timeout = _time_left(deadline, 5)
+        if timeout <= 0:
+            return
+        with state.lock:
+            if time.time() - state.robots_checked_at < ROBOTS_TTL:
+                return
+            state.robots_checked_at = time.time()
+        delay = 0.0
+        try:
+            resp = self.session.get(f"{scheme}://{netloc}/robots.txt", timeout=timeout)
+            if resp.status_code == 200:
+                parser = robotparser.RobotFileParser()
+                parser.parse(resp.text.splitlines())
+                delay = parser.crawl_delay(ROBOTS_USER_AGENT) or 0.0
+                rate = parser.request_rate(ROBOTS_USER_AGENT)
+                if rate and rate.requests:
+                    delay = max(delay, rate.seconds / rate.requests)
+        except Exception as e:
+            print(f"robots.txt fetch failed for {netloc}: {str(e)}")
+        with state.lock:
+            state.crawl_delay = min(float(delay), MAX_CRAWL_DELAY)
+
+    @contextmanager
+    def slot(self, url, deadline=None):
+        """
+        Hold a politeness slot for the URL's domain for the duration of the
+        block. Waiting for it, for the rate limit and for the crawl delay
+        together ends at deadline, if given.
+        """
+        parsed = urlparse(url)
+        host = (parsed.hostname or '').lower()
+        state = self._domain(host)
+        self._load_robots(parsed.scheme or 'https', parsed.netloc, state, deadline)
+
+        with state.lock:
+            state.waiting += 1
+        try:
+            if not state.slots.acquire(timeout=max(0.0, _time_left(deadline, QUEUE_TIMEOUT))):
+                self._count('busy')
+                raise SchedulerBusy(f"Too many concurrent fetches to {host}")
+        finally:
+            with state.lock:
+                state.waiting -= 1
+
+        try:
+            if not state.bucket.try_acquire():
+                self._count('throttled')
+                if not state.bucket.acquire(timeout=max(0.0, _time_left(deadline, QUEUE_TIMEOUT))):
+                    self._count('busy')
+                    raise SchedulerBusy(f"Rate limit wait exceeded for {host}")
+
+            # Space requests by the crawl delay (or a Retry-After backoff)
+            with state.lock:
+                now = time.monotonic()
+                start = max(now, state.next_allowed)
+                if deadline is not None and start >= deadline:
+                    self._count('busy')
+                    raise SchedulerBusy(f"Crawl delay for {host} runs past the deadline")
+                state.next_allowed = start + state.crawl_delay
+                state.active += 1
+            if start > now:
+                time.sleep(start - now)
+
+            try:
+                yield state
+            finally:
+                with state.lock:
+                    state.active -= 1
+        finally:
+            state.slots.release()
+
+    def backoff(self, state, seconds):
+        """Push back the next allowed request to a domain"""
+        seconds = min(max(seconds, 0.0), MAX_CRAWL_DELAY)
+        with state.lock:
+            state.next_allowed = max(state.next_allowed, time.monotonic() + seconds)
+        self._count('backoffs')
+
+    def run(self, url, fn, key=None, deadline=None):
+        """
+        Run fn() inside a domain slot, sharing the result with any concurrent
+        caller for the same key (defaults to the canonical URL). A caller that
+        joins a fetch already in flight waits for it until deadline at most.
+        """
+        key = key or url_utils.cache_key(url)
+        with self._lock:
+            flight = self._inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._inflight[key] = _InFlight()
+            else:
+                flight.waiters += 1
+                self._stats['shared'] += 1
+
+        if not leader:
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            if not flight.done.wait(timeout):
+                self._count('busy')
+                raise SchedulerBusy(f"Deadline passed waiting for a shared fetch of {url}")
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            with self.slot(url, deadline):
+                self._count('fetches')
+                flight.result = fn()
+        except Exception as e:
+            flight.error = e
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            flight.done.set()
+
+        if flight.error is not None:
+            raise flight.error
+        return flight.result
+
+    def fetch(self, url, headers=None, timeout=10, deadline=None):
+        """
+        GET a URL through the scheduler; concurrent identical requests share one
+        download. The request timeout is cut to the time left before deadline.
+        """
+        def do_get():
+            parsed = urlparse(url)
+            state = self._domain((parsed.hostname or '').lower())
+            request_timeout = _time_left(deadline, timeout)
+            if request_timeout <= 0:
+                self._count('busy')
+                raise SchedulerBusy(f"Deadline passed before fetching {url}")
+            response = self.session.get(url, headers=headers, timeout=request_timeout)
+            if response.status_code in (429, 503):
+                retry_after = response.headers.get('Retry-After', '')
+                self.backoff(state, float(retry_after) if retry_after.isdigit() else 5.0)
+            return response
+
+        return self.run(url, do_get, deadline=deadline)
+
+    def stats(self):
+        """Snapshot of scheduler counters and per-domain activity"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['in_flight'] = len(self._inflight)
+            domains = dict(self._domains)
+        stats['domains'] = {
+            host: {
+                'active': state.active,
+                'waiting': state.waiting,
+                'crawl_delay': state.crawl_delay,
+            }
+            for host, state in domains.items()
+            if state.active or state.waiting
+        }
+        stats['cache'] = scrape_cache.stats()
+        return stats
+
+
+# Process-wide scheduler and scraped-text cache shared by every scraper
+scheduler = ScrapeScheduler()
+scrape_cache = ResultCache(SCRAPE_CACHE_TTL, SCRAPE_CACHE_SIZE)
+
+
+def fetch(url, headers=None, timeout=10, deadline=None):
+    return scheduler.fetch(url, headers=headers, timeout=timeout, deadline=deadline)
+
+
+def run(url, fn, key=None, deadline=None):
+    return scheduler.run(url, fn, key=key, deadline=deadline)
+
+
+def cached_scrape(url, scrape_fn, is_error=None):
+    """
+    Return scraped text for a URL from the cache, or call scrape_fn(url) and
+    cache the result unless is_error(result) says it failed.
+    """
+    key = url_utils.cache_key(url)
+    text = scrape_cache.get(key)
+    if text is not None:
+        return text
+    text = scrape_fn(url)
+    if text and not (is_error and is_error(text)):
+        scrape_cache.set(key, text)
+    return text
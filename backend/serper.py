@@ -1,36 +1,14 @@
 @app.route('/conversational-fact-check', methods=['POST'])
 def conversational_fact_check():
-    import requests
-    from dotenv import load_dotenv
-    load_dotenv()
-
-    SERPER_API_KEY = os.getenv("SERPER_API_KEY")
+    import fact_engine
 
     data = request.json
     user_message = data.get('message')
     conversation_history = data.get('conversation_history', [])
 
     try:
-        # ------ 1️⃣ Perform Real-time Search using Serper ------
-        search_url = "https://google.serper.dev/search"
-        payload = {"q": user_message}
-        headers = {
-            "X-API-KEY": SERPER_API_KEY,
-            "Content-Type": "application/json"
-        }
-
-        search_results = requests.post(search_url, json=payload, headers=headers).json()
-
-        # Extract relevant text summary
-        result_snippets = []
-
-        if "organic" in search_results:
-            for item in search_results["organic"][:5]:
-                snippet = item.get("snippet", "")
-                title = item.get("title", "")
-                result_snippets.append(f"{title}: {snippet}")
-
-        live_summary = "\n".join(result_snippets) if result_snippets else "No reliable real-time data found."
+        # ------ 1️⃣ Real-time search evidence from the shared engine ------
+        live_summary = fact_engine.gather(user_message)['live_summary']
 
         # ------ 2️⃣ System Prompt ------
         system_prompt = f"""
@@ -74,17 +52,10 @@ Now respond in the required JSON format.
 """
 
         # ------ 4️⃣ Get Gemini Output ------
-        model = genai.GenerativeModel('gemini-2.5-flash')
-        response = model.generate_content(final_prompt)
-
-        ai_raw = response.text
+        ai_raw = fact_engine.generate(final_prompt)
 
         # Clean JSON output if model added extra text
-        try:
-            import json
-            parsed = json.loads(ai_raw)
-        except:
-            parsed = {"agent_response": ai_raw, "verdict": "UNKNOWN", "confidence_score": "0", "evidence_summary": live_summary}
+        parsed = fact_engine.parse_response(ai_raw, live_summary)
 
         # ------ 5️⃣ Return response ------
         return jsonify({
@@ -0,0 +1,138 @@
+"""
+Tiny dependency-graph runner for request pipelines
+File: stage_graph.py
+
+Stages are plain callables. A stage starts as soon as all of its dependencies
+have finished, independent stages run concurrently on a shared thread pool, and
+the whole graph shares one deadline. Stages that miss the deadline are reported
+as timed out and their results are left as None.
+
+At the deadline, stages still queued are cancelled (or skip themselves if a
+worker picks them up anyway), but a stage already running cannot be stopped:
+it is abandoned and keeps its worker until fn returns. Abandoned stages can
+therefore never exceed STAGE_WORKERS, and while they pile up they delay the
+stages of later requests, so every stage fn must bound its own run time.
+Scrapes are given the graph's deadline: scrape_scheduler ends their waits for
+a domain slot, the rate limit and the crawl delay by then and cuts the fetch
+(or Selenium page load) timeout to the time left. Searches are bounded only by
+their per-request timeouts (10s each), so a search stage can outlive the
+deadline. stats() reports how many abandoned stages are still running.
+"""
+
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+STAGE_WORKERS = int(os.getenv('STAGE_WORKERS', '16'))
+
+_executor = ThreadPoolExecutor(max_workers=STAGE_WORKERS, thread_name_prefix='stage')
+_stats_lock = threading.Lock()
+_stats = {'timed_out': 0, 'cancelled': 0, 'abandoned': 0, 'abandoned_running': 0}
+
+
+def _count(key, n=1):
+    with _stats_lock:
+        _stats[key] += n
+
+
+def _abandoned_done(future):
+    _count('abandoned_running', -1)
+
+
+class StageGraph:
+    """Collects stages, then runs them under a single deadline"""
+
+    def __init__(self, deadline):
+        self.deadline = deadline
+        self.stages = {}
+
+    def add(self, name, fn, deps=()):
+        """
+        Register a stage. fn is called with the results of its dependencies as
+        keyword arguments, e.g. add('llm', fn, deps=['search']) calls fn(search=...).
+        Dependency names must be valid identifiers for that reason.
+        """
+        self.stages[name] = (fn, tuple(deps))
+        return self
+
+    def run(self):
+        """Run every stage; returns (results, timings) keyed by stage name"""
+        start = time.perf_counter()
+        stop_at = start + self.deadline
+        results = {}
+        timings = {}
+        pending = dict(self.stages)
+        running = {}
+
+        def timed(name, fn, kwargs):
+            began = time.perf_counter()
+            if began >= stop_at:
+                # Queued behind other work until after the deadline: not worth starting
+                return None, TimeoutError('deadline passed before the stage started'), began, began
+            try:
+                return fn(**kwargs), None, began, time.perf_counter()
+            except Exception as e:
+                return None, e, began, time.perf_counter()
+
+        while pending or running:
+            # Skip stages whose dependencies failed; start those whose dependencies are done
+            for name, (fn, deps) in list(pending.items()):
+                failed = [d for d in deps if d in timings and timings[d]['status'] != 'ok']
+                if failed:
+                    timings[name] = {'status': 'skipped', 'ms': 0.0, 'reason': f"dependency {failed[0]} {timings[failed[0]]['status']}"}
+                    results[name] = None
+                    del pending[name]
+                elif all(d in results and d in timings for d in deps):
+                    kwargs = {d: results[d] for d in deps}
+                    running[_executor.submit(timed, name, fn, kwargs)] = name
+                    del pending[name]
+
+            if not running:
+                if pending:
+                    # Unknown dependency names can never be satisfied
+                    for name in pending:
+                        timings[name] = {'status': 'skipped', 'ms': 0.0, 'reason': 'unmet dependency'}
+                        results[name] = None
+                break
+
+            remaining = stop_at - time.perf_counter()
+            done, _ = wait(running, timeout=max(remaining, 0), return_when=FIRST_COMPLETED)
+            if not done:
+                for future, name in running.items():
+                    _count('timed_out')
+                    if future.cancel():
+                        _count('cancelled')
+                    else:
+                        _count('abandoned')
+                        _count('abandoned_running')
+                        future.add_done_callback(_abandoned_done)
+                    timings[name] = {'status': 'timeout', 'ms': round((time.perf_counter() - start) * 1000, 1)}
+                    results[name] = None
+                for name in pending:
+                    timings[name] = {'status': 'skipped', 'ms': 0.0, 'reason': 'deadline'}
+                    results[name] = None
+                break
+
+            for future in done:
+                name = running.pop(future)
+                value, error, began, ended = future.result()
+                results[name] = value
+                timings[name] = {
+                    'status': 'ok' if error is None else 'error',
+                    'start_ms': round((began - start) * 1000, 1),
+                    'ms': round((ended - began) * 1000, 1),
+                }
+                if error is not None:
+                    timings[name]['error'] = str(error)
+                    print(f"Stage {name} failed: {str(error)}")
+
+        timings['total'] = {'status': 'ok', 'ms': round((time.perf_counter() - start) * 1000, 1)}
+        return results, timings
+
+
+def stats():
+    with _stats_lock:
+        result = dict(_stats)
+    result['workers'] = STAGE_WORKERS
+    return result
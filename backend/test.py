@@ -1,6 +1,7 @@
 import requests
 from bs4 import BeautifulSoup
-from transformers import pipeline
+import scrape_scheduler
+import micro_batcher
 from urllib.parse import urlparse
 
 def scrape_content(url):
@@ -9,7 +10,7 @@ def scrape_content(url):
         headers = {
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
         }
-        response = requests.get(url, headers=headers, timeout=10)
+        response = scrape_scheduler.fetch(url, headers=headers, timeout=10)
         response.raise_for_status()
         
         soup = BeautifulSoup(response.content, 'html.parser')
@@ -63,10 +64,8 @@ def check_truthfulness(url):
     print(f"\nExtracted {len(content)} characters of content")
     print("-" * 50)
     
-    # Load zero-shot classification model
-    print("Loading Hugging Face model...")
-    classifier = pipeline("zero-shot-classification", 
-                         model="facebook/bart-large-mnli")
+    # Zero-shot classification; the label hypotheses of each segment share one batched forward pass
+    model_name = "facebook/bart-large-mnli"
     
     candidate_labels = ["true", "false", "unverifiable"]
     
@@ -80,7 +79,7 @@ def check_truthfulness(url):
             continue
         
         try:
-            result = classifier(chunk, candidate_labels)
+            result = micro_batcher.zero_shot(model_name, chunk, candidate_labels)
             results.append({
                 'text': chunk[:100] + "..." if len(chunk) > 100 else chunk,
                 'label': result['labels'][0],
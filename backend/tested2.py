@@ -1,20 +1,16 @@
 import requests
-from bs4 import BeautifulSoup
+import url_utils
 import os
 import torch
-from ddgs import DDGS
 from dotenv import load_dotenv
-import google.generativeai as genai
-import re
+import fact_engine
+import nli_cascade
+from fact_engine import extract_verdict_and_confidence
 
 load_dotenv()
 SERPER_API_KEY = os.getenv("SERPER_API_KEY")
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 
-# Configure Gemini API
-genai.configure(api_key=GEMINI_API_KEY)
-model = genai.GenerativeModel('gemini-2.5-flash')
-
 # Twitter API credentials (get from developer.twitter.com)
 BEARER_TOKEN = "YOUR_BEARER_TOKEN_HERE"
 
@@ -49,64 +45,13 @@ def scrape_twitter_api(tweet_url):
         print(f"Error with Twitter API: {e}")
         return None
 
-def scrape_twitter_selenium(tweet_url):
-    """Fallback: Extract tweet using Selenium (requires JavaScript rendering)"""
-    try:
-        from selenium import webdriver
-        from selenium.webdriver.common.by import By
-        from selenium.webdriver.support.ui import WebDriverWait
-        from selenium.webdriver.support import expected_conditions as EC
-        
-        options = webdriver.ChromeOptions()
-        options.add_argument('--headless')
-        options.add_argument('--no-sandbox')
-        
-        driver = webdriver.Chrome(options=options)
-        driver.get(tweet_url)
-        
-        # Wait for tweet to load
-        WebDriverWait(driver, 10).until(
-            EC.presence_of_element_located((By.XPATH, "//article"))
-        )
-        
-        # Extract tweet text
-        tweet_elements = driver.find_elements(By.XPATH, "//article//div[@lang]")
-        tweet_text = " ".join([elem.text for elem in tweet_elements])
-        
-        driver.quit()
-        return tweet_text
-    
-    except ImportError:
-        print("Selenium not installed. Install with: pip install selenium")
-        return None
-    except Exception as e:
-        print(f"Error with Selenium: {e}")
-        return None
-
 def scrape_content(url):
-    """Extract text content from a URL"""
-    try:
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-        }
-        response = requests.get(url, headers=headers, timeout=10)
-        response.raise_for_status()
-        
-        soup = BeautifulSoup(response.content, 'html.parser')
-        
-        for script in soup(["script", "style"]):
-            script.decompose()
-        
-        text = soup.get_text(separator='\n')
-        lines = (line.strip() for line in text.splitlines())
-        chunks = (phrase.strip() for line in lines for phrase in line.split("  "))
-        text = '\n'.join(chunk for chunk in chunks if chunk)
-        
-        return text
-    
-    except requests.exceptions.RequestException as e:
-        print(f"Error fetching URL: {e}")
+    """Extract text content from a URL (None if it could not be scraped)"""
+    content = fact_engine.scrape_url_content(url, max_chars=None)
+    if fact_engine.is_scrape_error(content):
+        print(f"Error fetching URL: {content}")
         return None
+    return content
 
 def split_into_sentences(text, max_length=512):
     """Split text into chunks suitable for the model"""
@@ -139,73 +84,26 @@ def split_into_sentences(text, max_length=512):
 #         return None
 
 def search_real_time(query: str) -> list:
-    """Search the web for real-time information using Serper API"""
+    """Top 3 web results for query, numbered for the prompt (shared engine search)"""
     try:
-        url = "https://google.serper.dev/search"
-        payload = {
-            "q": query,
-            "num": 5
-        }
-        headers = {
-            "X-API-KEY": SERPER_API_KEY,
-            "Content-Type": "application/json"
-        }
-        
-        response = requests.post(url, json=payload, headers=headers)
-        results = response.json()
-        
-        # Extract organic search results and return as list
-        if "organic" in results:
-            search_data = []
-            for i, r in enumerate(results["organic"][:3], 1):
-                search_data.append({
-                    'id': i,
-                    'title': r['title'],
-                    'snippet': r['snippet'],
-                    'link': r.get('link', '')
-                })
-            return search_data
-        else:
-            return []
-            
+        return [
+            {'id': i, 'title': r.get('title', ''), 'snippet': r.get('snippet', ''), 'link': r.get('link', '')}
+            for i, r in enumerate(fact_engine.search(query, num_results=3), 1)
+        ]
     except Exception as e:
         print(f"Search error: {e}")
         return []
 
-def extract_verdict_and_confidence(analysis_text):
-    """Extract verdict and confidence from AI analysis"""
-    verdict = "UNKNOWN"
-    confidence = 0
-    
-    # Extract verdict
-    if "VERDICT:" in analysis_text:
-        verdict_match = re.search(r'VERDICT:\s*(TRUE|FALSE)', analysis_text, re.IGNORECASE)
-        if verdict_match:
-            verdict = verdict_match.group(1).upper()
-    
-    # Extract confidence if mentioned, otherwise estimate from analysis
-    confidence_match = re.search(r'CONFIDENCE:\s*(\d+)%', analysis_text, re.IGNORECASE)
-    if confidence_match:
-        confidence = int(confidence_match.group(1))
-    else:
-        # Default confidence based on verdict
-        confidence = 85 if verdict in ["TRUE", "FALSE"] else 0
-    
-    return verdict, confidence
-
 def check_truthfulness(url):
     """Scrape URL and check content truthfulness"""
+    url = url_utils.normalize_url(url)
     print(f"Processing URL: {url}\n")
     
-    # Check if it's a Twitter link
-    if 'twitter.com' in url or 'x.com' in url:
-        print("Detected Twitter/X link. Using Twitter-specific scraper...\n")
-        
-        if BEARER_TOKEN != "YOUR_BEARER_TOKEN_HERE":
-            content = scrape_twitter_api(url)
-        else:
-            print("No Bearer Token found. Trying Selenium fallback...\n")
-            content = scrape_twitter_selenium(url)
+    # Twitter/X links use the API when a token is configured; otherwise the
+    # engine's scraper (which renders X pages with Selenium) handles them
+    if ('twitter.com' in url or 'x.com' in url) and BEARER_TOKEN != "YOUR_BEARER_TOKEN_HERE":
+        print("Detected Twitter/X link. Using the Twitter API...\n")
+        content = scrape_twitter_api(url)
     else:
         content = scrape_content(url)
     
@@ -232,6 +130,21 @@ def check_truthfulness(url):
         try:
             print(f"Segment {i}: {chunk[:80]}...")
             
+            # Segments already settled by any channel need no search or model call
+            cached = fact_engine.verdicts.lookup(chunk)
+            if cached:
+                results.append({
+                    'claim': chunk[:100] + "..." if len(chunk) > 100 else chunk,
+                    'verdict': cached['verdict'],
+                    'confidence': cached['confidence'],
+                    'sources': "None",
+                    'search_results': [],
+                    'analysis': cached['response'],
+                    'tier': 'cache'
+                })
+                print(f"  Verdict (cached): {cached['verdict']} | Confidence: {cached['confidence']}%\n")
+                continue
+            
             # Search for information
             print(f"  Searching for: '{chunk}'")
             search_results = search_real_time(chunk)
@@ -257,17 +170,37 @@ VERDICT: [TRUE/FALSE]
 EXPLANATION: [2-3 sentences explaining why]
 CONFIDENCE: [percentage 0-100]"""
             
+            # Settle clear-cut claims locally; only uncertain ones go to Gemini
+            nli_result = nli_cascade.prescreen(chunk, [f"{r['title']}: {r['snippet']}" for r in search_results])
+            if nli_result and nli_result['decision']:
+                answer = (f"VERDICT: {nli_result['decision']}\n"
+                          f"EXPLANATION: Decided by the local NLI stage from the search results "
+                          f"(entailment {nli_result['entailment']:.2f}, contradiction {nli_result['contradiction']:.2f}).\n"
+                          f"CONFIDENCE: {nli_result['confidence_score']}%")
+                results.append({
+                    'claim': chunk[:100] + "..." if len(chunk) > 100 else chunk,
+                    'verdict': nli_result['decision'],
+                    'confidence': nli_result['confidence_score'],
+                    'sources': ",".join(str(r['id']) for r in search_results),
+                    'search_results': search_results,
+                    'analysis': answer,
+                    'tier': 'nli'
+                })
+                nli_cascade.maybe_shadow(nli_result['decision'], lambda prompt=prompt: fact_engine.generate(prompt))
+                print(f"  Verdict (NLI): {nli_result['decision']} | Confidence: {nli_result['confidence_score']}%\n")
+                continue
+            
             # Use Gemini 2.5 Flash
-            response = model.generate_content(
+            answer = fact_engine.generate(
                 prompt,
-                generation_config=genai.types.GenerationConfig(
-                    max_output_tokens=500,
-                    temperature=0.1,
-                )
+                generation_config={
+                    'max_output_tokens': 500,
+                    'temperature': 0.1,
+                }
             )
-            
-            answer = response.text
             verdict, confidence = extract_verdict_and_confidence(answer)
+            if search_results:
+                fact_engine.verdicts.record(chunk, verdict, confidence, answer, search_text, channel='url-check')
             
             # Summarize the claim
             claim_summary = chunk[:100] + "..." if len(chunk) > 100 else chunk
@@ -281,7 +214,8 @@ CONFIDENCE: [percentage 0-100]"""
                 'confidence': confidence,
                 'sources': source_ids,
                 'search_results': search_results,
-                'analysis': answer
+                'analysis': answer,
+                'tier': 'llm'
             })
             
             print(f"  Verdict: {verdict} | Confidence: {confidence}%\n")
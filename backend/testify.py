@@ -1,7 +1,7 @@
 from flask import Flask, request, jsonify
 from flask_cors import CORS
-import google.generativeai as genai
-from PIL import Image
+import llm_gateway
+import image_pipeline
 import os
 from dotenv import load_dotenv
 import traceback
@@ -16,15 +16,10 @@ GEMINI_API_KEY = os.getenv('GEMINI_API_KEY')
 
 print(f"\n🔧 Configuration:")
 print(f"   GEMINI_API_KEY: {'✓ Set' if GEMINI_API_KEY else '✗ NOT SET'}")
+print(f"   LLM backend: {llm_gateway.backend_name()}\n")
 
-# Initialize Gemini
-if GEMINI_API_KEY:
-    genai.configure(api_key=GEMINI_API_KEY)
-    model = genai.GenerativeModel('gemini-2.5-flash')
-    print("   ✓ Gemini API configured\n")
-else:
-    model = None
-    print("   ✗ GEMINI_API_KEY not found in .env\n")
+
+IMAGE_ANALYSIS_PROMPT = "Analyze this image in short. give confidence score talling the image is ai generated or not"
 
 
 @app.route('/api/analyze-image', methods=['POST'])
@@ -41,38 +36,27 @@ def analyze_image():
         if file.filename == '':
             return jsonify({'error': 'No file selected'}), 400
 
-        # Validate image
+        # Validate, downscale and strip metadata; reuse the analysis of a visually identical image
         try:
-            print("  → Validating image...")
-            img = Image.open(file.stream)
-            img.verify()
-            file.stream.seek(0)
-            img = Image.open(file.stream)
-            print(f"  ✓ Image valid: {img.format} {img.size}")
-        except Exception as e:
-            print(f"  ✗ Image validation failed: {e}")
-            return jsonify({'error': f'Invalid image: {str(e)}'}), 400
-
-        # Send to Gemini
-        if not model:
-            print("✗ Gemini model not configured")
-            return jsonify({'error': 'Gemini API not configured'}), 500
-
-        try:
-            print("  → Sending to Gemini API...")
-            file.stream.seek(0)
-            response = model.generate_content([
-                "Analyze this image in short. give confidence score talling the image is ai generated or not",
-                img
-            ])
-            analysis = response.text
-            print(f"  ✓ Gemini response received ({len(analysis)} chars)\n")
-
+            print("  → Preprocessing image and sending to Gemini API...")
+            analysis, details = image_pipeline.analyze(
+                file.stream,
+                IMAGE_ANALYSIS_PROMPT,
+                lambda img: llm_gateway.generate([IMAGE_ANALYSIS_PROMPT, img])
+            )
+            source = "cached analysis" if details['cached'] else "Gemini response"
+            print(f"  ✓ {source} ({len(analysis)} chars), image {tuple(details['original_size'])} -> {tuple(details['size'])}\n")
+            
             return jsonify({
                 'success': True,
-                'analysis': analysis
+                'analysis': analysis,
+                'cached': details['cached'],
+                'image': details
             }), 200
-
+        
+        except ValueError as e:
+            print(f"  ✗ Image validation failed: {e}")
+            return jsonify({'error': f'Invalid image: {str(e)}'}), 400
         except Exception as e:
             print(f"  ✗ Gemini error: {e}")
             traceback.print_exc()
@@ -88,7 +72,7 @@ def analyze_image():
 def health():
     return jsonify({
         'status': 'ok',
-        'gemini': 'configured' if model else 'not configured'
+        'llm_backend': llm_gateway.backend_name()
     }), 200
 
 
@@ -1,6 +1,7 @@
 import requests
 from bs4 import BeautifulSoup
-from transformers import pipeline
+import scrape_scheduler
+import micro_batcher
 
 import os
 
@@ -78,7 +79,7 @@ def scrape_content(url):
         headers = {
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
         }
-        response = requests.get(url, headers=headers, timeout=10)
+        response = scrape_scheduler.fetch(url, headers=headers, timeout=10)
         response.raise_for_status()
         
         soup = BeautifulSoup(response.content, 'html.parser')
@@ -141,10 +142,8 @@ def check_truthfulness(url):
     print(content[:300] + "...\n" if len(content) > 300 else content + "\n")
     print("-" * 50)
     
-    # Load zero-shot classification model
-    print("Loading Hugging Face model...")
-    classifier = pipeline("zero-shot-classification", 
-                         model="facebook/bart-large-mnli")
+    # Zero-shot classification; the label hypotheses of each segment share one batched forward pass
+    model_name = "facebook/bart-large-mnli"
     
     candidate_labels = ["true", "false", "unverifiable"]
     
@@ -158,7 +157,7 @@ def check_truthfulness(url):
             continue
         
         try:
-            result = classifier(chunk, candidate_labels)
+            result = micro_batcher.zero_shot(model_name, chunk, candidate_labels)
             results.append({
                 'text': chunk[:100] + "..." if len(chunk) > 100 else chunk,
                 'label': result['labels'][0],
@@ -1,21 +1,14 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response, stream_with_context
 from flask_cors import CORS
-import torch
-from transformers import pipeline
+import json
 import re
 
 from backend.tested2 import scrape_content
+import local_generation
 
 app = Flask(__name__)
 CORS(app)
 
-# Load model once globally
-print("Loading model...")
-generator = pipeline("text-generation", 
-                    model="TinyLlama/TinyLlama-1.1B-Chat-v1.0",
-                    device=0 if torch.cuda.is_available() else -1,
-                    torch_dtype=torch.float16 if torch.cuda.is_available() else torch.float32)
-
 def extract_confidence(text):
     """Extract confidence score from text"""
     patterns = [
@@ -48,22 +41,13 @@ def parse_verdict(analysis_text):
     
     return verdict, confidence
 
-def check_truthfulness(url, content):
-    """Check truthfulness of content"""
-    
-    if not content or len(content.strip()) < 20:
-        return {"error": "Content too short to analyze"}
-    
-    # Split into chunks
+def split_claims(content):
+    """Sentences long enough to check"""
     sentences = re.split(r'(?<=[.!?])\s+', content)
-    chunks = [s.strip() for s in sentences if len(s.strip()) > 20]
-    
-    results = []
-    
-    for i, chunk in enumerate(chunks[:5], 1):
-        try:
-            # Create comprehensive prompt
-            prompt = f"""<|user|>
+    return [s.strip() for s in sentences if len(s.strip()) > 20][:5]
+
+def build_prompt(chunk):
+    return f"""<|user|>
 You are an expert fact-checker. Analyze this claim carefully and provide a detailed verdict.
 
 CLAIM: {chunk}
@@ -75,38 +59,44 @@ EXPLANATION: [Provide 4-6 detailed sentences explaining your verdict, citing spe
 SOURCES: [List any sources you reference]
 <|end|>
 <|assistant|>"""
-            
-            response = generator(
-                prompt, 
-                max_new_tokens=1000,  # Much larger token limit
-                do_sample=False,
-                top_p=0.95,
-                temperature=0.1
-            )
-            
-            full_text = response[0]['generated_text']
-            answer = full_text.split("<|assistant|>")[-1].strip()
-            
-            # Parse verdict and confidence
-            verdict, confidence = parse_verdict(answer)
-            
-            results.append({
-                'text': chunk[:150],
-                'verdict': verdict,
-                'confidence': confidence,
-                'analysis': answer,
-                'full_text': chunk
-            })
-            
-        except Exception as e:
-            print(f"Error: {e}")
+
+def check_truthfulness(url, content):
+    """Check truthfulness of content"""
+    
+    if not content or len(content.strip()) < 20:
+        return {"error": "Content too short to analyze"}
+    
+    chunks = split_claims(content)
+    
+    try:
+        # All claims in one batched generate() call; repeated claims come from the cache
+        answers = local_generation.generate_batch([build_prompt(chunk) for chunk in chunks])
+    except Exception as e:
+        print(f"Error: {e}")
+        answers = [e] * len(chunks)
+    
+    results = []
+    for chunk, answer in zip(chunks, answers):
+        if isinstance(answer, Exception):
             results.append({
                 'text': chunk[:150],
                 'verdict': 'ERROR',
                 'confidence': 0,
-                'analysis': f"Error processing: {str(e)}",
+                'analysis': f"Error processing: {str(answer)}",
                 'full_text': chunk
             })
+            continue
+        
+        # Parse verdict and confidence
+        verdict, confidence = parse_verdict(answer)
+        
+        results.append({
+            'text': chunk[:150],
+            'verdict': verdict,
+            'confidence': confidence,
+            'analysis': answer,
+            'full_text': chunk
+        })
     
     return results
 
@@ -133,5 +123,41 @@ def fact_check():
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+@app.route('/fact-check-stream', methods=['POST'])
+def fact_check_stream():
+    """Same checks as /fact-check, streamed as server-sent events while tokens are generated"""
+    data = request.json
+    url = data.get('url', '')
+    
+    try:
+        content = scrape_content(url)
+        if not content:
+            return jsonify({"error": "Could not scrape content"}), 400
+        if len(content.strip()) < 20:
+            return jsonify({"error": "Content too short to analyze"}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+    
+    def events():
+        for index, chunk in enumerate(split_claims(content)):
+            yield f"data: {json.dumps({'event': 'claim', 'index': index, 'text': chunk})}\n\n"
+            answer = ""
+            try:
+                for piece in local_generation.stream(build_prompt(chunk)):
+                    answer += piece
+                    yield f"data: {json.dumps({'event': 'token', 'index': index, 'text': piece})}\n\n"
+                verdict, confidence = parse_verdict(answer)
+                result = {'event': 'result', 'index': index, 'verdict': verdict, 'confidence': confidence}
+            except Exception as e:
+                result = {'event': 'result', 'index': index, 'verdict': 'ERROR', 'confidence': 0, 'error': str(e)}
+            yield f"data: {json.dumps(result)}\n\n"
+        yield f"data: {json.dumps({'event': 'done'})}\n\n"
+    
+    return Response(stream_with_context(events()), mimetype='text/event-stream')
+
+@app.route('/generation-stats', methods=['GET'])
+def generation_stats():
+    return jsonify(local_generation.stats())
+
 if __name__ == '__main__':
     app.run(debug=True, port=5000)
\ No newline at end of file
@@ -0,0 +1,84 @@
+"""
+Shared fixtures: the Flask app with offline backends, temporary storage and
+an in-memory stand-in for the posts collection.
+"""
+
+import os
+import sys
+import tempfile
+
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+# Module configuration is read at import time
+_tmp = tempfile.mkdtemp(prefix='backend-tests-')
+os.environ['LLM_BACKEND'] = 'stub'
+os.environ['CACHE_DB_PATH'] = os.path.join(_tmp, 'cache.sqlite3')
+os.environ['UPLOAD_DIR'] = os.path.join(_tmp, 'uploads')
+os.environ['RENDITION_DIR'] = os.path.join(_tmp, 'renditions')
+
+
+class FakeCollection:
+    """The few pymongo collection calls the routes under test make, over a list of dicts"""
+
+    def __init__(self):
+        self.docs = []
+
+    @staticmethod
+    def _matches(doc, query):
+        for key, condition in (query or {}).items():
+            if isinstance(condition, dict) and '$exists' in condition:
+                if (key in doc) != condition['$exists']:
+                    return False
+            elif doc.get(key) != condition:
+                return False
+        return True
+
+    def insert_one(self, doc):
+        doc.setdefault('_id', f'id{len(self.docs)}')
+        self.docs.append(doc)
+        return type('InsertOneResult', (), {'inserted_id': doc['_id']})()
+
+    def find(self, query=None, projection=None):
+        return [dict(doc) for doc in self.docs if self._matches(doc, query)]
+
+    def find_one(self, query=None, projection=None):
+        found = self.find(query)
+        return found[0] if found else None
+
+    def update_one(self, query, update):
+        for doc in self.docs:
+            if self._matches(doc, query):
+                doc.update(update.get('$set', {}))
+                return
+
+
+@pytest.fixture
+def app_module(monkeypatch):
+    import app as app_module
+    monkeypatch.setattr(app_module, 'post_collection', FakeCollection())
+    monkeypatch.setattr(app_module, 'users_collection', FakeCollection())
+
+    # Background rendition jobs write to the posts collection: finish them while it is still the fake one
+    jobs = []
+    submit = app_module.renditions.submit
+    monkeypatch.setattr(app_module.renditions, 'submit', lambda *args, **kwargs: jobs.append(submit(*args, **kwargs)) or jobs[-1])
+    yield app_module
+    for job in jobs:
+        job.result(timeout=30)
+
+
+@pytest.fixture
+def client(app_module):
+    return app_module.app.test_client()
+
+
+@pytest.fixture
+def auth_headers(app_module):
+    def make(identity='tester@example.com'):
+        from flask_jwt_extended import create_access_token
+        with app_module.app.app_context():
+            return {'Authorization': f'Bearer {create_access_token(identity=identity)}'}
+    return make
@@ -0,0 +1,75 @@
+"""Conversation sessions shared through sqlite across stores (worker processes)"""
+
+import time
+
+import conversation_sessions
+from conversation_sessions import SessionStore
+
+
+def test_session_resumes_from_another_store(tmp_path):
+    path = str(tmp_path / 'sessions.db')
+    first, second = SessionStore(path=path), SessionStore(path=path)
+
+    session = first.get_or_create('user:alice')
+    session.add_turn('user', 'The moon is made of cheese')
+    session.set_last_claim('The moon is made of cheese')
+    session.remember_evidence('The moon is made of cheese', [], 'NASA samples are rock')
+
+    resumed = second.get_or_create('user:alice', session.id)
+    assert resumed.last_user_message() == 'The moon is made of cheese'
+    assert resumed.last_claim == 'The moon is made of cheese'
+    assert resumed.evidence_for('the moon  is made of CHEESE')['live_summary'] == 'NASA samples are rock'
+
+    # Turns added through either copy are kept
+    resumed.add_turn('assistant', 'False')
+    session.add_turn('user', 'Why?')
+    assert [t['content'] for t in second.get_or_create('user:alice', session.id).turns] == \
+        ['The moon is made of cheese', 'False', 'Why?']
+
+
+def test_other_owner_cannot_resume_session(tmp_path):
+    store = SessionStore(path=str(tmp_path / 'sessions.db'))
+    session = store.get_or_create('user:alice')
+    session.add_turn('user', 'private claim')
+
+    other = store.get_or_create('addr:10.0.0.9', session.id)
+    assert other.turns == []
+    assert store.get_or_create('user:alice', session.id).turns[0]['content'] == 'private claim'
+
+
+def test_sweep_expires_idle_and_evicts_oldest(tmp_path):
+    store = SessionStore(path=str(tmp_path / 'sessions.db'), ttl=60, max_sessions=2)
+    ids = [store.get_or_create('user:alice').id for _ in range(4)]
+    conn = store._connect()
+    conn.execute('UPDATE conversation_sessions SET updated_at = ? WHERE conversation_id = ?', (time.time() - 120, ids[0]))
+    conn.execute('UPDATE conversation_sessions SET updated_at = ? WHERE conversation_id = ?', (time.time() - 30, ids[1]))
+    conn.close()
+
+    store._last_sweep = 0.0
+    store.get_or_create('user:alice')  # sweeps before adding its own session
+    stats = store.stats()
+    assert stats['expired'] == 1 and stats['evicted'] == 1 and stats['active'] == 3
+    assert store.get_or_create('user:alice', ids[1]).turns == []
+
+
+def test_compaction_left_running_is_retried(tmp_path, monkeypatch):
+    monkeypatch.setattr(conversation_sessions, 'KEEP_RECENT_TURNS', 1)
+    store = SessionStore(path=str(tmp_path / 'sessions.db'))
+    session = store.get_or_create('user:alice')
+    for i in range(4):
+        session.add_turn('user', f'claim {i} ' + 'word ' * 40)
+
+    def dies(previous, turns):
+        raise SystemExit  # the worker goes away mid-summary
+
+    try:
+        session.compact(dies, budget=60)
+    except SystemExit:
+        pass
+    resumed = store.get_or_create('user:alice', session.id)
+    assert resumed.folding and not resumed.compact(lambda previous, turns: 'summary', budget=60)
+
+    monkeypatch.setattr(conversation_sessions, 'FOLD_TIMEOUT', 0)
+    assert resumed.compact(lambda previous, turns: 'summary', budget=60)
+    resumed = store.get_or_create('user:alice', session.id)
+    assert resumed.summary == 'summary' and not resumed.folding and len(resumed.turns) == 1
@@ -0,0 +1,45 @@
+"""media_index.is_flagged and parse_verdict on analyses the image prompt produces"""
+
+import pytest
+
+from media_index import VERDICT_FIELD, is_flagged, parse_verdict
+
+
+def verdict(flagged, confidence):
+    return '{"%s": %s, "confidence": %d}' % (VERDICT_FIELD, 'true' if flagged else 'false', confidence)
+
+
+CASES = [
+    # The prose no longer decides: these read as flagged to a keyword match
+    ("The image is not edited or manipulated. Confidence: 90%\n" + verdict(False, 90), False),
+    ("AI-generated: No. Confidence: 90%\n" + verdict(False, 90), False),
+    ("This is a real photograph, not AI-generated. Confidence score: 90%\n" + verdict(False, 90), False),
+    # ...and this one as unflagged
+    ("likely AI-generated (confidence: 15% real)\n" + verdict(True, 85), True),
+    ("This image is AI-generated. Confidence score: 92%\n" + verdict(True, 92), True),
+    ("Likely a deepfake around the jaw.\n```json\n" + verdict(True, 75) + "\n```", True),
+    # A flag the model is unsure of is withdrawn
+    ("The image may be AI-generated. Confidence score: 40%\n" + verdict(True, 40), False),
+    ("Possibly edited.\n" + '{"%s": true, "confidence": "70%%"}' % VERDICT_FIELD, True),
+    # No structured verdict: never flagged, whatever the wording
+    ("The image is not edited or manipulated. Confidence: 90%", False),
+    ("likely AI-generated (confidence: 15% real)", False),
+    ("The image is AI-generated {with braces} but no verdict", False),
+    ("", False),
+    (None, False),
+]
+
+
+@pytest.mark.parametrize('analysis, expected', CASES)
+def test_is_flagged(analysis, expected):
+    assert is_flagged(analysis) is expected
+
+
+def test_parse_verdict_strips_the_verdict_from_the_text():
+    text, found = parse_verdict("Looks real.\nConfidence: 90%\n```json\n" + verdict(False, 90) + "\n```")
+    assert text == "Looks real.\nConfidence: 90%"
+    assert found == {VERDICT_FIELD: False, 'confidence': 90}
+
+
+def test_parse_verdict_without_one():
+    assert parse_verdict("Looks real.\n") == ("Looks real.", None)
@@ -0,0 +1,39 @@
+"""Script-shared languages, mixed scripts and romanised Hindi in language_id.detect"""
+
+import pytest
+
+import language_id
+
+SAMPLES = [
+    ('hi', "मेरा नाम राहुल है और मैं दिल्ली में रहता हूं। आज बहुत बारिश हुई इसलिए स्कूल बंद था।"),
+    ('mr', "माझं नाव राहुल आहे आणि मी पुण्यात राहतो. आज पाऊस खूप पडला म्हणून शाळा बंद होती."),
+    ('ne', "मेरो नाम राहुल हो र म काठमाडौंमा बस्छु। आज धेरै पानी परेकोले विद्यालय बन्द थियो।"),
+    ('ar', "اسمي أحمد وأعيش في القاهرة. اليوم هطلت أمطار غزيرة لذلك كانت المدرسة مغلقة."),
+    ('ur', "میرا نام راحل ہے اور میں لاہور میں رہتا ہوں۔ آج بہت بارش ہوئی اس لیے اسکول بند تھا۔"),
+    ('fa', "نام من رضا است و در تهران زندگی می‌کنم. امروز باران زیادی بارید برای همین مدرسه تعطیل بود."),
+    ('ru', "Меня зовут Олег, и я живу в Москве. Сегодня шёл сильный дождь, поэтому школа была закрыта."),
+    ('uk', "Мене звати Олег, і я живу в Києві. Сьогодні йшов сильний дощ, тому школа була зачинена."),
+    ('bg', "Казвам се Олег и живея в София. Днес валеше силен дъжд, затова училището беше затворено."),
+    ('hi', "Yeh video bilkul fake hai bhai, isko forward mat karo, pehle check karo ki sach hai ya nahi"),
+    ('ja', "東京で大きな地震がありました。"),
+    ('zh-cn', "政府表示新疫苗是安全的。"),
+]
+
+
+@pytest.mark.parametrize('expected, text', SAMPLES)
+def test_detects_language_within_shared_scripts(expected, text):
+    lang, confidence = language_id.detect(text)
+    assert lang == expected
+    assert confidence < 1.0 or expected in ('ja', 'zh-cn')
+
+
+def test_one_foreign_word_does_not_decide_the_language():
+    lang, confidence = language_id.detect(
+        "The minister said the new policy is good for farmers, calling it a historic बदलाव for the country."
+    )
+    assert lang == 'en'
+    assert confidence < language_id.detect("The minister said the new policy is good for farmers.")[1]
+
+
+def test_no_letters_is_undetermined():
+    assert language_id.detect("12345 !!!") == ('und', 0.0)
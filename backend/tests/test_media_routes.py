@@ -0,0 +1,92 @@
+"""Image posts and image analysis through the Flask routes"""
+
+import base64
+import io
+import time
+
+from PIL import Image
+
+
+def png_bytes(color=(200, 30, 30), size=(64, 48)):
+    buffer = io.BytesIO()
+    image = Image.new('RGB', size, color)
+    for x in range(0, size[0], 8):
+        image.putpixel((x, x % size[1]), (0, 0, 0))
+    image.save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+def test_save_image_post_indexes_media(client, app_module):
+    data_url = 'data:image/png;base64,' + base64.b64encode(png_bytes()).decode('ascii')
+    response = client.post('/api/auth/savePost', json={
+        'post_id': 'p1', 'name': 'tester', 'email': 'tester@example.com',
+        'title': 'Flood photo', 'content': 'Seen on the river bank this morning',
+        'media': data_url, 'mediaType': 'image',
+    })
+    assert response.status_code == 201, response.get_json()
+    saved = app_module.post_collection.docs[0]
+    assert saved['media_hash']
+    assert saved['media_matches'] == {'previously_flagged': [], 'similar_posts': []}
+    deadline = time.time() + 10
+    while 'renditions' not in saved and time.time() < deadline:
+        time.sleep(0.05)
+    assert saved.get('renditions'), "image renditions were not attached to the post"
+
+
+def test_analyze_image_indexes_analysis(client, app_module):
+    response = client.post('/api/analyze-image', data={
+        'image': (io.BytesIO(png_bytes(color=(10, 120, 200))), 'photo.png', 'image/png'),
+    }, content_type='multipart/form-data')
+    assert response.status_code == 200, response.get_json()
+    body = response.get_json()
+    assert body['success'] and body['analysis']
+    assert app_module.get_media_index().lookup(int(body['image']['image_hash'], 16))
+
+
+def upload(client, headers, data, content_type='image/png'):
+    """Run a one-chunk resumable upload; returns the finalized upload id"""
+    response = client.post('/api/uploads', json={
+        'filename': 'photo.png', 'content_type': content_type, 'total_size': len(data),
+    }, headers=headers)
+    assert response.status_code == 201, response.get_json()
+    upload_id = response.get_json()['upload_id']
+    assert client.put(f'/api/uploads/{upload_id}/chunks/0', data=data, headers=headers).status_code == 200
+    assert client.post(f'/api/uploads/{upload_id}/finalize', headers=headers).status_code == 200
+    return upload_id
+
+
+def test_analyze_image_upload_checks_owner(client, auth_headers):
+    owner = auth_headers('owner@example.com')
+    upload_id = upload(client, owner, png_bytes(color=(90, 200, 40)))
+
+    for headers in ({}, auth_headers('someone-else@example.com')):
+        response = client.post('/api/analyze-image', data={'upload_id': upload_id}, headers=headers)
+        assert response.status_code == 404
+
+    response = client.post('/api/analyze-image', data={'upload_id': upload_id}, headers=owner)
+    assert response.status_code == 200, response.get_json()
+
+
+def test_analyze_image_upload_requires_a_sniffed_image(client, auth_headers):
+    owner = auth_headers()
+    upload_id = upload(client, owner, b'\x1a\x45\xdf\xa3' + b'\0' * 64, content_type='video/webm')
+    response = client.post('/api/analyze-image', data={'upload_id': upload_id}, headers=owner)
+    assert response.status_code == 415
+
+
+def test_save_post_upload_checks_owner_and_uses_sniffed_type(client, app_module, auth_headers):
+    owner = auth_headers('owner@example.com')
+    upload_id = upload(client, owner, png_bytes(color=(240, 220, 10)))
+    post = {
+        'post_id': 'p2', 'name': 'tester', 'email': 'owner@example.com',
+        'title': 'Upload', 'content': 'Posted from a resumable upload',
+        'media_upload_id': upload_id, 'mediaType': 'video',
+    }
+
+    response = client.post('/api/auth/savePost', json=post, headers=auth_headers('someone-else@example.com'))
+    assert response.status_code == 404
+    assert not app_module.uploads.open_finalized(upload_id)[1]['pinned']
+
+    response = client.post('/api/auth/savePost', json=post, headers=owner)
+    assert response.status_code == 201, response.get_json()
+    assert app_module.post_collection.docs[-1]['mediaType'] == 'image'
@@ -0,0 +1,31 @@
+"""LLM calls saved by the NLI tier, net of shadow checks"""
+
+import os
+import threading
+
+import pytest
+
+import nli_cascade
+
+
+def test_shadowed_claims_are_not_counted_as_saved(monkeypatch):
+    monkeypatch.setattr(nli_cascade, '_stats', dict.fromkeys(nli_cascade._stats, 0))
+    monkeypatch.setattr(nli_cascade, 'SHADOW_RATE', 1.0)
+    nli_cascade._count('decided_true', 3)
+    answered = threading.Event()
+
+    def llm_call():
+        answered.set()
+        return 'VERDICT: TRUE'
+
+    nli_cascade.maybe_shadow('TRUE', llm_call)
+    assert answered.wait(5)
+    stats = nli_cascade.stats()
+    assert stats['shadow_calls'] == 1
+    assert stats['llm_calls_saved'] == 2
+
+
+@pytest.mark.skipif(os.getenv('NLI_CASCADE_ENABLED') is not None, reason='NLI_CASCADE_ENABLED is set')
+def test_cascade_is_off_by_default():
+    assert nli_cascade.NLI_ENABLED is False
+    assert nli_cascade.prescreen('The sky is blue', ['The sky is blue.']) is None
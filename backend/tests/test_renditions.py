@@ -0,0 +1,38 @@
+"""Renditions are made from files: upload-backed originals are used in place, inline media is decoded in chunks"""
+
+import base64
+import hashlib
+import os
+
+import renditions
+
+VIDEO = b'\0\0\0\x18ftypmp42' + bytes(range(256)) * 64
+
+
+def test_upload_backed_video_is_not_copied(tmp_path):
+    source = tmp_path / 'data'
+    source.write_bytes(VIDEO)
+    result = renditions.render_post(path=str(source), media_type='video', content_type='video/mp4')
+    assert result['key'] == hashlib.sha256(VIDEO).hexdigest()[:32]
+    assert result['original'] is None
+    assert result['original_bytes'] == len(VIDEO)
+    assert not any(name.startswith('original') for name in os.listdir(os.path.join(renditions.RENDITION_DIR, result['key'])))
+
+
+def test_inline_video_is_decoded_and_stored():
+    media = 'data:video/mp4;base64,' + base64.b64encode(VIDEO).decode('ascii')
+    result = renditions.render_post(media=media, media_type='video')
+    assert result['original'] == 'mp4'
+    with open(renditions.file_path(result['key'], 'original', 'mp4'), 'rb') as f:
+        assert f.read() == VIDEO
+    assert not [name for name in os.listdir(renditions.RENDITION_DIR) if name.startswith('source_')]
+
+
+def test_open_source_decodes_across_chunks(monkeypatch):
+    monkeypatch.setattr(renditions, 'SPOOL_CHUNK_SIZE', 30)
+    media = base64.b64encode(VIDEO).decode('ascii')
+    with renditions.open_source(media) as (path, sha256, size):
+        with open(path, 'rb') as f:
+            assert f.read() == VIDEO
+        assert (sha256, size) == (hashlib.sha256(VIDEO).hexdigest(), len(VIDEO))
+    assert not os.path.exists(path)
@@ -0,0 +1,54 @@
+"""Deadlines bound every wait in scrape_scheduler"""
+
+import threading
+import time
+
+import pytest
+
+import scrape_scheduler
+
+
+@pytest.fixture
+def scheduler():
+    scheduler = scrape_scheduler.ScrapeScheduler()
+    state = scheduler._domain('example.invalid')
+    state.robots_checked_at = time.time()  # no robots.txt fetch
+    return scheduler
+
+
+def test_crawl_delay_past_the_deadline_is_refused(scheduler):
+    scheduler._domain('example.invalid').next_allowed = time.monotonic() + 30
+    started = time.monotonic()
+    with pytest.raises(scrape_scheduler.SchedulerBusy):
+        with scheduler.slot('http://example.invalid/', deadline=time.monotonic() + 1):
+            pass
+    assert time.monotonic() - started < 0.5
+
+
+def test_slot_wait_ends_at_the_deadline(scheduler):
+    held = [scheduler.slot('http://example.invalid/a') for _ in range(scrape_scheduler.MAX_PER_DOMAIN)]
+    for slot in held:
+        slot.__enter__()
+    try:
+        started = time.monotonic()
+        with pytest.raises(scrape_scheduler.SchedulerBusy):
+            with scheduler.slot('http://example.invalid/b', deadline=time.monotonic() + 0.3):
+                pass
+        assert time.monotonic() - started < 1.0
+    finally:
+        for slot in held:
+            slot.__exit__(None, None, None)
+
+
+def test_shared_fetch_wait_ends_at_the_deadline(scheduler):
+    release = threading.Event()
+    leader = threading.Thread(target=scheduler.run, args=('http://example.invalid/c', release.wait))
+    leader.start()
+    while not scheduler._inflight:
+        time.sleep(0.01)
+    try:
+        with pytest.raises(scrape_scheduler.SchedulerBusy):
+            scheduler.run('http://example.invalid/c', lambda: 'second', deadline=time.monotonic() + 0.2)
+    finally:
+        release.set()
+        leader.join()
@@ -0,0 +1,41 @@
+"""Which texts translation sends to the translator, and with which source language"""
+
+import pytest
+
+import translation
+
+
+@pytest.fixture
+def calls(monkeypatch):
+    sent = []
+
+    def fake_translate(text, target, source=None):
+        sent.append((text, target, source))
+        return f'[{target}] {text}'
+
+    monkeypatch.setattr(translation, '_translate_one', fake_translate)
+    monkeypatch.setattr(translation, '_cache_get_many', lambda keys, target: {})
+    monkeypatch.setattr(translation, '_cache_set_many', lambda entries, target: None)
+    return sent
+
+
+def test_shared_script_is_translated_with_auto_source(calls):
+    marathi = "माझं नाव राहुल आहे आणि मी पुण्यात राहतो. आज पाऊस खूप पडला म्हणून शाळा बंद होती."
+    translations, details = translation.translate_many([marathi], 'en')
+    assert details['translated'] == 1
+    assert calls == [(marathi, 'en', None)]
+
+
+def test_script_guess_never_skips_translation(calls):
+    korean = "정부는 화요일에 새로운 백신이 안전하다고 밝혔습니다."
+    translations, details = translation.translate_many([korean], 'ko')
+    assert details['skipped_same_language'] == 0
+    assert calls == [(korean, 'ko', 'ko')]
+
+
+def test_confident_model_match_is_skipped(calls):
+    english = "The government said on Tuesday that the new vaccine is safe for everyone."
+    translations, details = translation.translate_many([english], 'en')
+    assert translations == [english]
+    assert details['skipped_same_language'] == 1
+    assert calls == []
@@ -0,0 +1,35 @@
+"""Upload metadata updates from several worker processes"""
+
+import io
+import multiprocessing
+
+import pytest
+
+import uploads
+
+
+def touch_repeatedly(upload_id, times):
+    for _ in range(times):
+        uploads._touch(upload_id)
+
+
+@pytest.mark.skipif(uploads.fcntl is None, reason='needs fcntl')
+def test_pin_survives_concurrent_touches_from_other_processes(tmp_path, monkeypatch):
+    monkeypatch.setattr(uploads, 'UPLOAD_DIR', str(tmp_path))
+    session = uploads.init('photo.png', 'image/png', 16, owner='owner@example.com')
+    upload_id = session['upload_id']
+    uploads.put_chunk(upload_id, 0, io.BytesIO(b'\x89PNG\r\n\x1a\n' + b'\0' * 8))
+    uploads.finalize(upload_id)
+
+    context = multiprocessing.get_context('fork')
+    workers = [context.Process(target=touch_repeatedly, args=(upload_id, 300)) for _ in range(4)]
+    for worker in workers:
+        worker.start()
+    uploads.pin(upload_id)
+    for worker in workers:
+        worker.join()
+        assert worker.exitcode == 0
+
+    path, meta = uploads.open_finalized(upload_id)
+    assert meta['pinned']
+    assert meta['detected_type'] == 'image/png'
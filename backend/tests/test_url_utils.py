@@ -0,0 +1,33 @@
+"""url_utils.canonicalize_url keeps what a URL points to and drops only tracking noise"""
+
+import pytest
+
+from url_utils import cache_key, canonicalize_url
+
+CASES = [
+    # Aliases apply to www. hosts too, and so do the alias's tracking parameters
+    ("https://www.twitter.com/user/status/1?s=20&t=abc", "https://x.com/user/status/1"),
+    ("https://mobile.twitter.com/user/status/1", "https://x.com/user/status/1"),
+    ("https://www.youtube.com/watch?v=abc&si=zz&feature=share", "https://www.youtube.com/watch?v=abc"),
+    # Blank parameters and trailing slashes are kept
+    ("https://example.com/search?q", "https://example.com/search?q"),
+    ("https://example.com/search?q=", "https://example.com/search?q="),
+    ("https://example.com/a/?b=2&a=1&utm_source=x#frag", "https://example.com/a/?a=1&b=2"),
+    # Repeated keys keep their order; empty pairs and tracking parameters go
+    ("https://example.com/?a=1&a=0&&UTM_medium=x", "https://example.com/?a=1&a=0"),
+    # Escapes of reserved characters are kept, unreserved ones decoded
+    ("https://example.com/p%2fq?x=a%2fb&y=%7e&z=hello world", "https://example.com/p%2Fq?x=a%2Fb&y=~&z=hello%20world"),
+    ("https://example.com/?next=%26admin%3D1", "https://example.com/?next=%26admin%3D1"),
+    ("HTTP://[::1]:8080/x", "http://[::1]:8080/x"),
+    ("https://Example.com:443", "https://example.com/"),
+]
+
+
+@pytest.mark.parametrize('url, expected', CASES)
+def test_canonicalize_url(url, expected):
+    assert canonicalize_url(url) == expected
+    assert canonicalize_url(expected) == expected
+
+
+def test_cache_key_ignores_scheme_and_www():
+    assert cache_key("http://www.example.com/a?b=1") == cache_key("https://example.com/a?b=1")
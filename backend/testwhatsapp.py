@@ -0,0 +1,136 @@
+"""
+End-to-end check of the WhatsApp webhook against a local fake Twilio endpoint
+File: testwhatsapp.py
+
+Starts whatsapp_dispatch.run_fake_twilio on a free port, points TWILIO_API_BASE
+at it and drives the real webhook (create_whatsapp_app) with form posts:
+- the same MessageSid delivered twice produces exactly one outbound message
+- a reply over 1600 characters goes out as split_body's parts, each within
+  Twilio's limit and together carrying the whole reply
+- a check that runs longer than WHATSAPP_RECOVER_AFTER is kept alive by the
+  heartbeat, so recover() does not requeue it and it is answered once
+
+The fact check itself is replaced by fixed replies so no model or search is
+needed. Run: python testwhatsapp.py
+"""
+
+import os
+import socket
+import tempfile
+import threading
+import time
+
+import requests
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+PORT = free_port()
+FAKE_TWILIO = f'http://127.0.0.1:{PORT}'
+
+# Configuration is read at import time, so set it before importing the bot
+os.environ['TWILIO_API_BASE'] = FAKE_TWILIO
+os.environ.setdefault('TWILIO_ACCOUNT_SID', 'AC' + '0' * 32)
+os.environ.setdefault('TWILIO_AUTH_TOKEN', 'test')
+os.environ['CACHE_DB_PATH'] = os.path.join(tempfile.mkdtemp(), 'testwhatsapp.db')
+os.environ.setdefault('LLM_BACKEND', 'stub')
+os.environ['WHATSAPP_RECOVER_AFTER'] = '1'
+os.environ['WHATSAPP_HEARTBEAT_INTERVAL'] = '0.2'
+
+import whatsapp_dispatch
+import whatsapp_bot
+
+SHORT_REPLY = "VERDICT: FALSE CONFIDENCE: 90%"
+LONG_REPLY = "\n\n".join(f"Paragraph {i}: " + "evidence " * 60 for i in range(8))
+REPLIES = {}
+SLOW = {}
+
+
+def fake_fact_check(user_message, phone_number):
+    if user_message in SLOW:
+        time.sleep(SLOW[user_message])
+    return REPLIES[user_message]
+
+
+def sent_messages():
+    return requests.get(f'{FAKE_TWILIO}/messages', timeout=5).json()
+
+
+def wait_for_messages(count, timeout=10):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        messages = sent_messages()
+        if len(messages) >= count:
+            return messages
+        time.sleep(0.1)
+    return sent_messages()
+
+
+def post(client, message_sid, from_number, body):
+    return client.post('/whatsapp', data={'MessageSid': message_sid, 'From': from_number, 'Body': body})
+
+
+def main():
+    threading.Thread(target=whatsapp_dispatch.run_fake_twilio, args=(PORT,), daemon=True).start()
+    for _ in range(50):
+        try:
+            sent_messages()
+            break
+        except requests.ConnectionError:
+            time.sleep(0.1)
+
+    whatsapp_bot.fact_check_message = fake_fact_check
+    client = whatsapp_bot.create_whatsapp_app().test_client()
+
+    # 1. Twilio retrying the same delivery must not produce a second reply
+    claim = "Drinking hot water every hour cures the flu within a day"
+    REPLIES[claim] = SHORT_REPLY
+    first = post(client, 'SM' + 'a' * 32, 'whatsapp:+15550000001', claim)
+    second = post(client, 'SM' + 'a' * 32, 'whatsapp:+15550000001', claim)
+    assert first.status_code == 200 and second.status_code == 200
+    assert 'Checking that now' in first.get_data(as_text=True)
+    assert '<Message>' not in second.get_data(as_text=True), "retry should get an empty TwiML reply"
+    wait_for_messages(1)
+    time.sleep(1)  # give a wrongly processed retry time to show up
+    messages = sent_messages()
+    assert len(messages) == 1, f"expected exactly one outbound message, got {len(messages)}"
+    assert messages[0]['body'] == SHORT_REPLY
+    assert messages[0]['to'] == 'whatsapp:+15550000001'
+    print("✓ duplicate MessageSid answered once")
+
+    # 2. A long reply is split into bodies Twilio accepts
+    claim = "The moon landing footage was filmed in a studio in 1969"
+    REPLIES[claim] = LONG_REPLY
+    expected = whatsapp_dispatch.split_body(LONG_REPLY)
+    assert len(LONG_REPLY) > whatsapp_dispatch.WHATSAPP_MAX_BODY and len(expected) > 1
+    post(client, 'SM' + 'b' * 32, 'whatsapp:+15550000002', claim)
+    parts = [m['body'] for m in wait_for_messages(1 + len(expected))[1:]]
+    assert parts == expected, f"expected {len(expected)} parts in order, got {len(parts)}"
+    assert all(len(part) <= whatsapp_dispatch.WHATSAPP_MAX_BODY for part in parts)
+    assert ' '.join(' '.join(parts).split()) == ' '.join(LONG_REPLY.split()), "split lost or changed text"
+    print(f"✓ {len(LONG_REPLY)}-character reply sent as {len(parts)} messages of at most "
+          f"{whatsapp_dispatch.WHATSAPP_MAX_BODY} characters")
+
+    # 3. recover() leaves a check that is still running to its worker
+    claim = "A new law makes it illegal to drive with headphones in every state"
+    REPLIES[claim] = SHORT_REPLY
+    SLOW[claim] = 3 * whatsapp_dispatch.WHATSAPP_RECOVER_AFTER
+    before = len(sent_messages())
+    post(client, 'SM' + 'c' * 32, 'whatsapp:+15550000003', claim)
+    time.sleep(2 * whatsapp_dispatch.WHATSAPP_RECOVER_AFTER)
+    assert whatsapp_bot.dispatcher.recover() == 0, "a running check was requeued"
+    wait_for_messages(before + 1)
+    time.sleep(1)
+    messages = sent_messages()[before:]
+    assert len(messages) == 1, f"expected the slow check answered once, got {len(messages)}"
+    print(f"✓ check running {SLOW[claim]}s (recover after {whatsapp_dispatch.WHATSAPP_RECOVER_AFTER}s) answered once")
+
+    print("\nAll WhatsApp checks passed")
+
+
+if __name__ == "__main__":
+    main()
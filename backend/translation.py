@@ -0,0 +1,213 @@
+"""
+Batched, cached translation
+File: translation.py
+
+translate_many(texts, target) translates a whole batch for one target
+language:
+- identical strings are translated once
+- a persistent sqlite cache keyed by (text hash, target) answers repeats
+  across requests and viewers
+- texts that the offline language identifier's model (language_id) is
+  confident are already in the target language are returned unchanged,
+  without a network call; a guess from the script alone never skips one
+- the remaining texts go to Google Translate a few at a time in parallel. The
+  source language is passed only when the script decided it (one language is
+  written in it, e.g. Hangul or Thai); otherwise Google detects it ('auto'),
+  since Devanagari, Arabic, Cyrillic and Latin are each shared by several
+  languages and a wrong explicit source gives a bad translation
+"""
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import language_id
+from url_utils import CACHE_DB_PATH
+
+TRANSLATE_MAX_TEXTS = int(os.getenv('TRANSLATE_MAX_TEXTS', '200'))
+TRANSLATE_MAX_CHARS = int(os.getenv('TRANSLATE_MAX_CHARS', '5000'))  # Google Translate's per-request limit
+TRANSLATE_CONCURRENCY = int(os.getenv('TRANSLATE_CONCURRENCY', '4'))
+TRANSLATE_CACHE_TTL = int(os.getenv('TRANSLATE_CACHE_TTL', str(90 * 24 * 3600)))
+TRANSLATE_DETECT_MIN_CHARS = int(os.getenv('TRANSLATE_DETECT_MIN_CHARS', '20'))
+TRANSLATE_DETECT_CONFIDENCE = float(os.getenv('TRANSLATE_DETECT_CONFIDENCE', '0.9'))
+
+# language_id / client codes that Google Translate spells differently
+TRANSLATOR_CODES = {'zh-cn': 'zh-CN', 'he': 'iw'}
+
+_db_lock = threading.Lock()
+_db_ready = False
+_executor = ThreadPoolExecutor(max_workers=TRANSLATE_CONCURRENCY, thread_name_prefix='translate')
+_stats_lock = threading.Lock()
+_stats = {'requests': 0, 'texts': 0, 'unique': 0, 'cache_hits': 0, 'skipped_same_language': 0,
+          'translated': 0, 'errors': 0}
+
+
+def _count(key, n=1):
+    with _stats_lock:
+        _stats[key] += n
+
+
+def _text_key(text):
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def source_language(text):
+    """
+    (language, source) for text from language_id.identify: language is None
+    when the text is too short or the detector is unsure; source is 'script'
+    when the script alone decided the language.
+    """
+    if len(text.strip()) < TRANSLATE_DETECT_MIN_CHARS:
+        return None, None
+    lang, confidence, source = language_id.identify(text)
+    if lang == 'und' or confidence < TRANSLATE_DETECT_CONFIDENCE:
+        return None, source
+    return lang, source
+
+
+# -----------------------------------------------------------------------------
+# Persistent cache
+# -----------------------------------------------------------------------------
+
+def _connect():
+    global _db_ready
+    conn = sqlite3.connect(CACHE_DB_PATH, timeout=10)
+    if not _db_ready:
+        with _db_lock:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS translations ('
+                'text_hash TEXT NOT NULL, target TEXT NOT NULL, translated TEXT NOT NULL, '
+                'created_at REAL NOT NULL, PRIMARY KEY (text_hash, target))'
+            )
+            conn.commit()
+            _db_ready = True
+    return conn
+
+
+def _cache_get_many(keys, target):
+    """{text_hash: translated} for the cached, unexpired entries among keys"""
+    if not keys:
+        return {}
+    found = {}
+    try:
+        conn = _connect()
+        try:
+            cutoff = time.time() - TRANSLATE_CACHE_TTL
+            for start in range(0, len(keys), 500):
+                batch = keys[start:start + 500]
+                rows = conn.execute(
+                    f"SELECT text_hash, translated FROM translations WHERE target = ? AND created_at > ? "
+                    f"AND text_hash IN ({','.join('?' * len(batch))})",
+                    [target, cutoff, *batch]
+                ).fetchall()
+                found.update(rows)
+        finally:
+            conn.close()
+    except sqlite3.Error as e:
+        print(f"Translation cache read error: {str(e)}")
+    return found
+
+
+def _cache_set_many(entries, target):
+    if not entries:
+        return
+    now = time.time()
+    try:
+        conn = _connect()
+        try:
+            conn.executemany(
+                'INSERT OR REPLACE INTO translations (text_hash, target, translated, created_at) VALUES (?, ?, ?, ?)',
+                [(key, target, translated, now) for key, translated in entries.items()]
+            )
+            conn.commit()
+        finally:
+            conn.close()
+    except sqlite3.Error as e:
+        print(f"Translation cache write error: {str(e)}")
+
+
+# -----------------------------------------------------------------------------
+# Translation
+# -----------------------------------------------------------------------------
+
+def _translate_one(text, target, source=None):
+    from deep_translator import GoogleTranslator
+
+    return GoogleTranslator(
+        source=TRANSLATOR_CODES.get(source, source or 'auto'),
+        target=TRANSLATOR_CODES.get(target, target)
+    ).translate(text)
+
+
+def translate_many(texts, target):
+    """
+    Translate texts into target. Returns (translations, details): translations
+    is aligned with texts (a text that failed to translate is returned as-is),
+    details counts unique, cached, skipped, translated and failed texts.
+    Raises ValueError for invalid batches.
+    """
+    if not isinstance(texts, list) or not all(isinstance(t, str) for t in texts):
+        raise ValueError('texts must be a list of strings')
+    if len(texts) > TRANSLATE_MAX_TEXTS:
+        raise ValueError(f'At most {TRANSLATE_MAX_TEXTS} texts per request')
+    if any(len(t) > TRANSLATE_MAX_CHARS for t in texts):
+        raise ValueError(f'Texts must be at most {TRANSLATE_MAX_CHARS} characters')
+
+    _count('requests')
+    _count('texts', len(texts))
+    unique = {}
+    for text in texts:
+        if text.strip():
+            unique.setdefault(_text_key(text), text)
+    _count('unique', len(unique))
+
+    results = _cache_get_many(list(unique), target)
+    cached = len(results)
+    _count('cache_hits', cached)
+
+    skipped = 0
+    pending = {}
+    for key, text in unique.items():
+        if key in results:
+            continue
+        lang, source = source_language(text)
+        if source != 'script' and language_id.same_language(lang, target):
+            results[key] = text
+            skipped += 1
+        else:
+            pending[key] = (text, lang if source == 'script' else None)
+    _count('skipped_same_language', skipped)
+
+    translated = {}
+    failed = 0
+    futures = {key: _executor.submit(_translate_one, text, target, source) for key, (text, source) in pending.items()}
+    for key, future in futures.items():
+        try:
+            translated[key] = future.result() or pending[key][0]
+        except Exception as e:
+            print(f"Translation error: {str(e)}")
+            failed += 1
+            results[key] = pending[key][0]
+    _count('translated', len(translated))
+    _count('errors', failed)
+    results.update(translated)
+    _cache_set_many(translated, target)
+
+    translations = [results.get(_text_key(text), text) if text.strip() else text for text in texts]
+    return translations, {
+        'texts': len(texts),
+        'unique': len(unique),
+        'cached': cached,
+        'skipped_same_language': skipped,
+        'translated': len(translated),
+        'failed': failed,
+    }
+
+
+def stats():
+    with _stats_lock:
+        result = dict(_stats)
+    return result
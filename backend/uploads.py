@@ -0,0 +1,352 @@
+"""
+Resumable chunked uploads
+File: uploads.py
+
+Protocol:
+1. init: declare filename, content type and total size; get an upload id and chunk size
+2. put chunk: PUT each chunk by index (any order, retries allowed), optionally
+   with its SHA-256 in the X-Chunk-SHA256 header; chunks are verified and
+   written to disk
+3. status: list received / missing chunks to resume after a dropped connection
+4. finalize: chunks are assembled on disk in order and checked against the
+   declared size (and whole-file SHA-256, if given)
+
+The finalized upload id can then be passed to savePost or the analysis routes
+instead of the bytes. Sessions live under UPLOAD_DIR as a directory with a
+meta.json and one file per chunk, so any worker process can serve any step.
+Unfinished sessions expire after UPLOAD_TTL of inactivity; finalized uploads
+that were never attached to a post expire after UPLOAD_FINALIZED_TTL.
+
+Metadata updates (touch, finalize, pin) hold an exclusive flock on the
+session's meta.lock, so they are serialized across worker processes, not
+just threads. Where fcntl is unavailable (Windows) a process-local lock is
+used instead.
+
+Only image and video types in ALLOWED_TYPES are accepted, and each session
+belongs to the user who started it. The declared type is never trusted for
+serving: finalize sniffs the assembled file's signature, and serve_type()
+falls back to application/octet-stream when the bytes are not an allowed type.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: locks only cover this process
+    fcntl = None
+
+UPLOAD_DIR = os.getenv('UPLOAD_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), '.uploads'))
+UPLOAD_CHUNK_SIZE = int(os.getenv('UPLOAD_CHUNK_SIZE', str(5 * 1024 * 1024)))
+UPLOAD_MAX_BYTES = int(os.getenv('UPLOAD_MAX_BYTES', str(500 * 1024 * 1024)))
+UPLOAD_TTL = int(os.getenv('UPLOAD_TTL', str(24 * 3600)))
+UPLOAD_FINALIZED_TTL = int(os.getenv('UPLOAD_FINALIZED_TTL', str(7 * 24 * 3600)))
+UPLOAD_CLEANUP_INTERVAL = int(os.getenv('UPLOAD_CLEANUP_INTERVAL', '600'))
+COPY_BUFFER = 1024 * 1024
+
+ALLOWED_TYPES = {
+    'image/jpeg', 'image/png', 'image/gif', 'image/webp',
+    'video/mp4', 'video/webm', 'video/quicktime',
+}
+
+_meta_lock = threading.Lock()
+_cleanup_lock = threading.Lock()
+_last_cleanup = 0.0
+
+
+class UploadError(Exception):
+    """Raised for invalid upload requests; status is the HTTP status to return"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def _session_dir(upload_id):
+    if not upload_id or not all(c in '0123456789abcdef' for c in upload_id):
+        raise UploadError('Invalid upload id', 404)
+    return os.path.join(UPLOAD_DIR, upload_id)
+
+
+def _chunk_path(upload_id, index):
+    return os.path.join(_session_dir(upload_id), f'chunk_{index:06d}')
+
+
+def _data_path(upload_id):
+    return os.path.join(_session_dir(upload_id), 'data')
+
+
+def _write_meta(upload_id, meta):
+    path = os.path.join(_session_dir(upload_id), 'meta.json')
+    tmp = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(meta, f)
+    os.replace(tmp, path)
+
+
+@contextmanager
+def _meta_locked(upload_id):
+    """Exclusive lock on an upload's metadata, held across every worker process"""
+    if fcntl is None:
+        with _meta_lock:
+            yield
+        return
+    try:
+        lock_file = open(os.path.join(_session_dir(upload_id), 'meta.lock'), 'a')
+    except OSError:
+        raise UploadError('Upload not found', 404)
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        yield
+    finally:
+        lock_file.close()  # releases the flock
+
+
+def _read_meta(upload_id):
+    try:
+        with open(os.path.join(_session_dir(upload_id), 'meta.json')) as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        raise UploadError('Upload not found', 404)
+    ttl = UPLOAD_FINALIZED_TTL if meta.get('finalized') else UPLOAD_TTL
+    if not meta.get('pinned') and time.time() - meta['updated_at'] > ttl:
+        raise UploadError('Upload expired', 410)
+    return meta
+
+
+def _touch(upload_id):
+    with _meta_locked(upload_id):
+        meta = _read_meta(upload_id)
+        meta['updated_at'] = time.time()
+        _write_meta(upload_id, meta)
+
+
+def _received(upload_id, meta):
+    directory = _session_dir(upload_id)
+    return sorted(
+        int(name[len('chunk_'):]) for name in os.listdir(directory)
+        if name.startswith('chunk_') and not name.endswith('.tmp')
+    ) if not meta.get('finalized') else list(range(meta['total_chunks']))
+
+
+def _expected_size(meta, index):
+    if index == meta['total_chunks'] - 1:
+        return meta['total_size'] - meta['chunk_size'] * index
+    return meta['chunk_size']
+
+
+def init(filename, content_type, total_size, sha256=None, chunk_size=None, owner=None):
+    """Start an upload session for owner; returns its public description"""
+    cleanup_expired()
+    content_type = (content_type or '').split(';')[0].strip().lower()
+    if content_type not in ALLOWED_TYPES:
+        raise UploadError(f"Unsupported content type. Allowed: {', '.join(sorted(ALLOWED_TYPES))}", 415)
+    if not isinstance(total_size, int) or total_size <= 0:
+        raise UploadError('total_size must be a positive integer')
+    if total_size > UPLOAD_MAX_BYTES:
+        raise UploadError(f'File too large. Maximum size is {UPLOAD_MAX_BYTES // (1024 * 1024)}MB', 413)
+    chunk_size = min(int(chunk_size or UPLOAD_CHUNK_SIZE), UPLOAD_CHUNK_SIZE * 4)
+    if chunk_size < 256 * 1024 and chunk_size < total_size:
+        raise UploadError('chunk_size must be at least 256KB')
+
+    upload_id = uuid.uuid4().hex
+    os.makedirs(_session_dir(upload_id))
+    now = time.time()
+    meta = {
+        'upload_id': upload_id,
+        'filename': os.path.basename(filename or 'upload'),
+        'content_type': content_type,
+        'detected_type': None,
+        'owner': owner,
+        'total_size': total_size,
+        'chunk_size': chunk_size,
+        'total_chunks': (total_size + chunk_size - 1) // chunk_size,
+        'declared_sha256': (sha256 or '').lower() or None,
+        'sha256': None,
+        'finalized': False,
+        'pinned': False,
+        'created_at': now,
+        'updated_at': now,
+    }
+    _write_meta(upload_id, meta)
+    return describe(upload_id)
+
+
+def check_owner(upload_id, owner):
+    """Raise UploadError unless owner started the upload (404, so ids cannot be probed)"""
+    if owner is None or _read_meta(upload_id).get('owner') != owner:
+        raise UploadError('Upload not found', 404)
+
+
+def sniff_type(path):
+    """Content type from the file signature, or None if it is not an allowed type"""
+    with open(path, 'rb') as f:
+        head = f.read(32)
+    if head.startswith(b'\xff\xd8\xff'):
+        return 'image/jpeg'
+    if head.startswith(b'\x89PNG\r\n\x1a\n'):
+        return 'image/png'
+    if head[:6] in (b'GIF87a', b'GIF89a'):
+        return 'image/gif'
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'image/webp'
+    if head.startswith(b'\x1a\x45\xdf\xa3'):
+        return 'video/webm'
+    if head[4:8] == b'ftyp':
+        return 'video/quicktime' if head[8:10] == b'qt' else 'video/mp4'
+    return None
+
+
+def serve_type(meta):
+    """Content type to serve a finalized upload with: the sniffed type, never the declared one"""
+    detected = meta.get('detected_type')
+    return detected if detected in ALLOWED_TYPES else 'application/octet-stream'
+
+
+def put_chunk(upload_id, index, stream, checksum=None):
+    """Store chunk `index` read from `stream`; verifies its size and SHA-256 (if given)"""
+    meta = _read_meta(upload_id)
+    if meta['finalized']:
+        raise UploadError('Upload already finalized', 409)
+    if not 0 <= index < meta['total_chunks']:
+        raise UploadError(f"Chunk index must be between 0 and {meta['total_chunks'] - 1}")
+
+    expected = _expected_size(meta, index)
+    path = _chunk_path(upload_id, index)
+    tmp = f'{path}.{uuid.uuid4().hex[:8]}.tmp'
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with open(tmp, 'wb') as f:
+            while True:
+                data = stream.read(COPY_BUFFER)
+                if not data:
+                    break
+                size += len(data)
+                if size > expected:
+                    raise UploadError(f'Chunk {index} is larger than {expected} bytes')
+                digest.update(data)
+                f.write(data)
+        if size != expected:
+            raise UploadError(f'Chunk {index} has {size} bytes, expected {expected}')
+        if checksum and digest.hexdigest() != checksum.lower():
+            raise UploadError(f'Checksum mismatch for chunk {index}', 422)
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    _touch(upload_id)
+    return {'index': index, 'size': size, 'sha256': digest.hexdigest()}
+
+
+def describe(upload_id):
+    meta = _read_meta(upload_id)
+    received = _received(upload_id, meta)
+    received_set = set(received)
+    return {
+        'upload_id': upload_id,
+        'filename': meta['filename'],
+        'content_type': meta['content_type'],
+        'total_size': meta['total_size'],
+        'chunk_size': meta['chunk_size'],
+        'total_chunks': meta['total_chunks'],
+        'received_chunks': received,
+        'missing_chunks': [i for i in range(meta['total_chunks']) if i not in received_set],
+        'finalized': meta['finalized'],
+        'sha256': meta['sha256'],
+        'expires_at': int((meta['updated_at'] + (UPLOAD_FINALIZED_TTL if meta['finalized'] else UPLOAD_TTL)) * 1000)
+        if not meta.get('pinned') else None,
+    }
+
+
+def finalize(upload_id):
+    """Assemble all chunks into the final file and verify it"""
+    with _meta_locked(upload_id):
+        meta = _read_meta(upload_id)
+        if meta['finalized']:
+            return describe(upload_id)
+        missing = [i for i in range(meta['total_chunks']) if not os.path.exists(_chunk_path(upload_id, i))]
+        if missing:
+            raise UploadError(f'Missing chunks: {missing[:20]}', 409)
+
+        digest = hashlib.sha256()
+        data_path = _data_path(upload_id)
+        with open(data_path + '.tmp', 'wb') as out:
+            for index in range(meta['total_chunks']):
+                with open(_chunk_path(upload_id, index), 'rb') as chunk:
+                    while True:
+                        data = chunk.read(COPY_BUFFER)
+                        if not data:
+                            break
+                        digest.update(data)
+                        out.write(data)
+        sha256 = digest.hexdigest()
+        if meta['declared_sha256'] and sha256 != meta['declared_sha256']:
+            os.remove(data_path + '.tmp')
+            raise UploadError('Checksum mismatch for the assembled file', 422)
+        os.replace(data_path + '.tmp', data_path)
+        for index in range(meta['total_chunks']):
+            os.remove(_chunk_path(upload_id, index))
+
+        meta.update({'finalized': True, 'sha256': sha256, 'detected_type': sniff_type(data_path),
+                     'updated_at': time.time()})
+        _write_meta(upload_id, meta)
+    return describe(upload_id)
+
+
+def open_finalized(upload_id):
+    """(path, meta) of a finalized upload; raises UploadError otherwise"""
+    meta = _read_meta(upload_id)
+    if not meta['finalized']:
+        raise UploadError('Upload is not finalized', 409)
+    return _data_path(upload_id), meta
+
+
+def pin(upload_id):
+    """Keep a finalized upload indefinitely (e.g. once a post references it)"""
+    with _meta_locked(upload_id):
+        meta = _read_meta(upload_id)
+        meta['pinned'] = True
+        _write_meta(upload_id, meta)
+
+
+def abort(upload_id):
+    _read_meta(upload_id)
+    shutil.rmtree(_session_dir(upload_id), ignore_errors=True)
+
+
+def cleanup_expired(force=False):
+    """Remove expired, unpinned sessions (runs at most every UPLOAD_CLEANUP_INTERVAL)"""
+    global _last_cleanup
+    now = time.time()
+    with _cleanup_lock:
+        if not force and now - _last_cleanup < UPLOAD_CLEANUP_INTERVAL:
+            return 0
+        _last_cleanup = now
+    if not os.path.isdir(UPLOAD_DIR):
+        return 0
+    removed = 0
+    for upload_id in os.listdir(UPLOAD_DIR):
+        try:
+            _read_meta(upload_id)
+        except UploadError as e:
+            if e.status == 410 or (e.status == 404 and _stale_dir(upload_id, now)):
+                shutil.rmtree(os.path.join(UPLOAD_DIR, upload_id), ignore_errors=True)
+                removed += 1
+    if removed:
+        print(f"Removed {removed} expired uploads")
+    return removed
+
+
+def _stale_dir(upload_id, now):
+    """Directories without readable metadata are removed once they are older than UPLOAD_TTL"""
+    try:
+        return now - os.path.getmtime(os.path.join(UPLOAD_DIR, upload_id)) > UPLOAD_TTL
+    except OSError:
+        return False
@@ -0,0 +1,290 @@
+"""
+URL extraction, canonicalization and short-link resolution
+File: url_utils.py
+
+Canonical URLs are what every scrape and verdict cache keys on, so the same
+article shared with different tracking parameters, fragments or through a
+shortener maps to one entry.
+"""
+
+import os
+import re
+import sqlite3
+import threading
+import time
+from urllib.parse import urlsplit, urlunsplit, quote, unquote_plus
+
+# Persistent cache location (shared with the other sqlite-backed caches)
+CACHE_DB_PATH = os.getenv('CACHE_DB_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cache.sqlite3'))
+REDIRECT_TTL = int(os.getenv('URL_REDIRECT_TTL', str(30 * 24 * 3600)))
+RESOLVE_TIMEOUT = float(os.getenv('URL_RESOLVE_TIMEOUT', '5'))
+REDIRECT_MEMORY_SIZE = int(os.getenv('URL_REDIRECT_MEMORY_SIZE', '5000'))
+
+# Candidate URLs: scheme or www. prefix, then everything up to whitespace or an
+# obvious delimiter. Trailing punctuation is trimmed afterwards.
+URL_PATTERN = re.compile(r'(?:https?://|www\.)[^\s<>"\'`{}|\\^]+', re.IGNORECASE)
+TRAILING_PUNCTUATION = '.,;:!?\'"*'
+BRACKETS = {')': '(', ']': '[', '}': '{'}
+
+SHORTENER_HOSTS = {
+    'bit.ly', 'bitly.com', 't.co', 'tinyurl.com', 'goo.gl', 'ow.ly', 'buff.ly',
+    'is.gd', 'rb.gy', 'cutt.ly', 'shorturl.at', 'tiny.cc', 'rebrand.ly',
+    'lnkd.in', 'fb.me', 'dlvr.it', 'trib.al', 'youtu.be', 'amzn.to', 'wa.me',
+}
+
+TRACKING_PARAMS = {
+    'fbclid', 'gclid', 'dclid', 'gbraid', 'wbraid', 'msclkid', 'yclid', 'igshid',
+    'mc_cid', 'mc_eid', '_ga', '_gl', 'ref_src', 'ref_url', 'cmpid', 'smid',
+    'share', 'shared', 'spm', 'scid', 'twclid', 'ttclid', 'vero_id', 'mkt_tok',
+}
+TRACKING_PREFIXES = ('utm_', 'pk_', 'hsa_', 'oly_')
+
+# Parameters that are tracking-only on specific hosts but meaningful elsewhere
+HOST_TRACKING_PARAMS = {
+    'x.com': {'s', 't', 'ref_src'},
+    'youtube.com': {'si', 'feature', 'pp'},
+    'instagram.com': {'igsh', 'utm_source'},
+    'facebook.com': {'mibextid', 'rdid', 'sfnsn'},
+}
+
+# Host aliases that serve the same content
+HOST_ALIASES = {
+    'twitter.com': 'x.com',
+    'mobile.twitter.com': 'x.com',
+    'mobile.x.com': 'x.com',
+    'm.youtube.com': 'youtube.com',
+    'm.facebook.com': 'facebook.com',
+}
+
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+# RFC 3986: escapes of unreserved characters are decoded, every other escape is kept (%2F is not /)
+UNRESERVED = set('ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789-._~')
+PATH_SAFE = "/:@!$&'()*+,;=-._~"
+QUERY_SAFE = "/?:@!$'()*+,;-._~"  # '&' and '=' stay escaped inside a key or value
+PERCENT_ESCAPE = re.compile(r'(%[0-9A-Fa-f]{2})')
+
+_memory = {}
+_memory_lock = threading.Lock()
+_db_lock = threading.Lock()
+_db_ready = False
+
+
+def _trim_candidate(candidate):
+    """Strip trailing punctuation and unbalanced closing brackets from a raw match"""
+    while candidate:
+        last = candidate[-1]
+        if last in TRAILING_PUNCTUATION:
+            candidate = candidate[:-1]
+        elif last in BRACKETS and candidate.count(last) > candidate.count(BRACKETS[last]):
+            candidate = candidate[:-1]
+        else:
+            break
+    return candidate
+
+
+def _host_key(host):
+    return host[4:] if host.startswith('www.') else host
+
+
+def _normalize_path(path, safe=PATH_SAFE):
+    """
+    Percent-encoding normalized without decoding reserved characters: escapes of
+    unreserved characters are decoded, other escapes upper-cased, and characters
+    that must be escaped (spaces, non-ASCII, stray %) are encoded.
+    """
+    pieces = PERCENT_ESCAPE.split(path)
+    for i, piece in enumerate(pieces):
+        if i % 2:
+            char = chr(int(piece[1:], 16))
+            pieces[i] = char if char in UNRESERVED else piece.upper()
+        else:
+            pieces[i] = quote(piece, safe=safe)
+    return ''.join(pieces)
+
+
+def _normalize_query(query, host):
+    """
+    Tracking parameters dropped and the rest sorted by key (repeated keys keep
+    their order), each parameter kept as written apart from its
+    percent-encoding: a bare 'q' stays 'q', not 'q='.
+    """
+    host_params = HOST_TRACKING_PARAMS.get(_host_key(host), set())
+    params = []
+    for param in query.split('&'):
+        if not param:
+            continue
+        key = unquote_plus(param.split('=', 1)[0]).lower()
+        if key in TRACKING_PARAMS or key in host_params or key.startswith(TRACKING_PREFIXES):
+            continue
+        params.append(_normalize_path(param, safe=QUERY_SAFE + '='))
+    params.sort(key=lambda param: param.split('=', 1)[0])
+    return '&'.join(params)
+
+
+def canonicalize_url(url):
+    """
+    Normalize a URL without changing what it points to: lowercase scheme and
+    host, IDNA host, host aliases (www.twitter.com is x.com), no default port,
+    no fragment, tracking parameters removed, remaining parameters sorted and
+    percent-encoding normalized. Trailing slashes and blank parameters are
+    kept, since servers may treat '/a/' and '/a', or '?q' and '?q=', differently.
+    """
+    url = url.strip()
+    if url.lower().startswith('www.'):
+        url = 'https://' + url
+    parts = urlsplit(url)
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or '').lower().rstrip('.')
+    if not host:
+        return url
+    if ':' in host:
+        # urlsplit drops the brackets of an IPv6 literal; the netloc needs them back
+        host = f"[{host}]"
+    else:
+        try:
+            host = host.encode('idna').decode('ascii')
+        except UnicodeError:
+            pass
+    host = HOST_ALIASES.get(_host_key(host), host)
+
+    netloc = host
+    if parts.port and parts.port != DEFAULT_PORTS.get(scheme):
+        netloc = f"{host}:{parts.port}"
+    if parts.username:
+        netloc = f"{parts.username}@{netloc}"
+
+    path = _normalize_path(parts.path) or '/'
+    return urlunsplit((scheme, netloc, path, _normalize_query(parts.query, host), ''))
+
+
+def cache_key(url):
+    """Scheme- and www-insensitive key for caches built on canonical URLs"""
+    parts = urlsplit(canonicalize_url(url))
+    return urlunsplit(('', _host_key(parts.netloc), parts.path, parts.query, '')).lstrip('/')
+
+
+def is_shortener(url):
+    host = (urlsplit(url).hostname or '').lower()
+    return _host_key(host) in SHORTENER_HOSTS
+
+
+# -----------------------------------------------------------------------------
+# Persistent redirect-resolution cache
+# -----------------------------------------------------------------------------
+
+def _connect():
+    global _db_ready
+    conn = sqlite3.connect(CACHE_DB_PATH, timeout=10)
+    if not _db_ready:
+        with _db_lock:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS url_redirects ('
+                'short_url TEXT PRIMARY KEY, resolved_url TEXT NOT NULL, resolved_at REAL NOT NULL)'
+            )
+            conn.commit()
+            _db_ready = True
+    return conn
+
+
+def _remember(short_url, resolved_url, resolved_at):
+    with _memory_lock:
+        _memory.pop(short_url, None)
+        _memory[short_url] = (resolved_url, resolved_at)
+        while len(_memory) > REDIRECT_MEMORY_SIZE:
+            del _memory[next(iter(_memory))]
+
+
+def _lookup_redirect(short_url):
+    with _memory_lock:
+        hit = _memory.get(short_url)
+    if hit and time.time() - hit[1] < REDIRECT_TTL:
+        return hit[0]
+    try:
+        conn = _connect()
+        try:
+            row = conn.execute(
+                'SELECT resolved_url, resolved_at FROM url_redirects WHERE short_url = ?', (short_url,)
+            ).fetchone()
+        finally:
+            conn.close()
+    except sqlite3.Error as e:
+        print(f"Redirect cache read error: {str(e)}")
+        return None
+    if row and time.time() - row[1] < REDIRECT_TTL:
+        _remember(short_url, row[0], row[1])
+        return row[0]
+    return None
+
+
+def _store_redirect(short_url, resolved_url):
+    now = time.time()
+    _remember(short_url, resolved_url, now)
+    try:
+        conn = _connect()
+        try:
+            conn.execute(
+                'INSERT OR REPLACE INTO url_redirects (short_url, resolved_url, resolved_at) VALUES (?, ?, ?)',
+                (short_url, resolved_url, now)
+            )
+            conn.commit()
+        finally:
+            conn.close()
+    except sqlite3.Error as e:
+        print(f"Redirect cache write error: {str(e)}")
+
+
+def resolve_short_url(url):
+    """Follow a shortener's redirects once and remember where it pointed"""
+    import scrape_scheduler
+
+    short_url = canonicalize_url(url)
+    cached = _lookup_redirect(short_url)
+    if cached:
+        return cached
+
+    def follow():
+        session = scrape_scheduler.scheduler.session
+        response = session.head(short_url, allow_redirects=True, timeout=RESOLVE_TIMEOUT)
+        if response.status_code >= 400 or response.url == short_url:
+            # Some shorteners reject HEAD; fall back to a GET without reading the body
+            response = session.get(short_url, allow_redirects=True, timeout=RESOLVE_TIMEOUT, stream=True)
+            response.close()
+        return response.url
+
+    try:
+        resolved = scrape_scheduler.run(short_url, follow, key='resolve:' + short_url)
+    except Exception as e:
+        print(f"Short link resolution failed for {short_url}: {str(e)}")
+        return short_url
+
+    resolved = canonicalize_url(resolved)
+    _store_redirect(short_url, resolved)
+    return resolved
+
+
+def normalize_url(url, resolve=True):
+    """Canonical form of a URL, following shortener redirects when `resolve` is set"""
+    canonical = canonicalize_url(url)
+    if resolve and is_shortener(canonical):
+        return resolve_short_url(canonical)
+    return canonical
+
+
+def extract_urls(text, resolve=True):
+    """Find URLs in free text and return their canonical forms, de-duplicated in order"""
+    seen = set()
+    urls = []
+    for match in URL_PATTERN.finditer(text or ''):
+        candidate = _trim_candidate(match.group(0))
+        try:
+            if not urlsplit(candidate if '://' in candidate else 'https://' + candidate).hostname:
+                continue
+            url = normalize_url(candidate, resolve=resolve)
+        except ValueError:
+            # Malformed host or port
+            continue
+        key = cache_key(url)
+        if key not in seen:
+            seen.add(key)
+            urls.append(url)
+    return urls
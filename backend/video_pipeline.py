@@ -0,0 +1,293 @@
+"""
+Video upload spooling, keyframe sampling and analysis cache
+File: video_pipeline.py
+
+Uploads are copied to a temporary file in fixed-size chunks (hashed on the
+way) instead of being read into memory. Two analysis modes:
+- sampled (default): ffmpeg picks up to VIDEO_MAX_FRAMES scene-change
+  keyframes (uniform sampling if the clip has too few cuts); only those
+  frames plus the video metadata (no audio) are sent to the LLM
+- full: the whole file is sent, as before
+
+Analyses are cached by (content hash, mode, prompt). Bytes sent and latency
+are tracked per mode.
+"""
+
+import hashlib
+import io
+import json
+import os
+import re
+import shutil
+import sqlite3
+import subprocess
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+from url_utils import CACHE_DB_PATH
+
+VIDEO_ANALYSIS_MODE = os.getenv('VIDEO_ANALYSIS_MODE', 'sampled').lower()
+VIDEO_MAX_FRAMES = int(os.getenv('VIDEO_MAX_FRAMES', '8'))
+VIDEO_MIN_FRAMES = int(os.getenv('VIDEO_MIN_FRAMES', '3'))
+VIDEO_SCENE_THRESHOLD = float(os.getenv('VIDEO_SCENE_THRESHOLD', '0.3'))
+VIDEO_FRAME_MAX_SIDE = int(os.getenv('VIDEO_FRAME_MAX_SIDE', '768'))
+VIDEO_SPOOL_DIR = os.getenv('VIDEO_SPOOL_DIR') or None  # None = system temp dir
+VIDEO_CACHE_TTL = int(os.getenv('VIDEO_CACHE_TTL', str(30 * 24 * 3600)))
+FFMPEG_TIMEOUT = int(os.getenv('FFMPEG_TIMEOUT', '60'))
+SPOOL_CHUNK_SIZE = 1024 * 1024
+
+FFMPEG = shutil.which('ffmpeg')
+FFPROBE = shutil.which('ffprobe')
+
+_db_lock = threading.Lock()
+_db_ready = False
+_stats_lock = threading.Lock()
+_stats = {}
+
+
+def _record(mode, bytes_sent, latency_ms, cached):
+    with _stats_lock:
+        entry = _stats.setdefault(mode, {'requests': 0, 'cache_hits': 0, 'bytes_sent': 0, 'latency_ms_total': 0.0})
+        entry['requests'] += 1
+        entry['cache_hits'] += 1 if cached else 0
+        entry['bytes_sent'] += bytes_sent
+        entry['latency_ms_total'] += latency_ms
+
+
+class SpooledVideo:
+    def __init__(self, path, sha256, size, mime_type):
+        self.path = path
+        self.sha256 = sha256
+        self.size = size
+        self.mime_type = mime_type
+
+
+@contextmanager
+def spool(file_storage, max_bytes):
+    """
+    Copy an uploaded file to a temporary file in chunks, hashing as it goes.
+    Raises ValueError when the upload exceeds max_bytes. The file is removed on exit.
+    """
+    suffix = os.path.splitext(file_storage.filename or '')[1][:10]
+    handle = tempfile.NamedTemporaryFile(prefix='upload_', suffix=suffix, dir=VIDEO_SPOOL_DIR, delete=False)
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with handle:
+            while True:
+                chunk = file_storage.stream.read(SPOOL_CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_bytes:
+                    raise ValueError(f'File too large. Maximum size is {max_bytes / 1024 / 1024:.0f}MB')
+                digest.update(chunk)
+                handle.write(chunk)
+        yield SpooledVideo(handle.name, digest.hexdigest(), size, file_storage.content_type)
+    finally:
+        try:
+            os.remove(handle.name)
+        except OSError:
+            pass
+
+
+# -----------------------------------------------------------------------------
+# ffmpeg helpers
+# -----------------------------------------------------------------------------
+
+def sampling_available():
+    return bool(FFMPEG and FFPROBE)
+
+
+def probe(path):
+    """Container and video-stream metadata (audio streams are only counted)"""
+    result = subprocess.run(
+        [FFPROBE, '-v', 'error', '-print_format', 'json', '-show_format', '-show_streams', path],
+        capture_output=True, text=True, timeout=FFMPEG_TIMEOUT
+    )
+    if result.returncode != 0:
+        raise ValueError(f'Unreadable video: {result.stderr.strip()[:200]}')
+    info = json.loads(result.stdout or '{}')
+    streams = info.get('streams', [])
+    video = next((s for s in streams if s.get('codec_type') == 'video'), None)
+    if video is None:
+        raise ValueError('No video stream found')
+
+    rate = video.get('avg_frame_rate') or '0/1'
+    num, _, den = rate.partition('/')
+    fps = float(num) / float(den) if den and float(den) else 0.0
+    return {
+        'duration_s': round(float(info.get('format', {}).get('duration') or video.get('duration') or 0), 2),
+        'width': video.get('width'),
+        'height': video.get('height'),
+        'fps': round(fps, 2),
+        'codec': video.get('codec_name'),
+        'container': info.get('format', {}).get('format_name'),
+        'audio_streams': sum(1 for s in streams if s.get('codec_type') == 'audio'),
+    }
+
+
+def _extract(path, video_filter, out_dir, max_frames):
+    """Run ffmpeg with a frame-selection filter; returns [(timestamp_s, jpeg_bytes)]"""
+    scale = f"scale='min({VIDEO_FRAME_MAX_SIDE},iw)':-2"
+    result = subprocess.run(
+        [FFMPEG, '-v', 'info', '-nostdin', '-i', path, '-an',
+         '-vf', f'{video_filter},{scale},showinfo', '-vsync', 'vfr',
+         '-frames:v', str(max_frames), '-q:v', '4', os.path.join(out_dir, 'frame_%03d.jpg')],
+        capture_output=True, text=True, timeout=FFMPEG_TIMEOUT
+    )
+    if result.returncode != 0:
+        raise ValueError(f'Frame extraction failed: {result.stderr.strip()[-200:]}')
+    timestamps = [float(t) for t in re.findall(r'pts_time:\s*([\d.]+)', result.stderr)]
+    frames = []
+    for i, name in enumerate(sorted(os.listdir(out_dir))):
+        with open(os.path.join(out_dir, name), 'rb') as f:
+            frames.append((timestamps[i] if i < len(timestamps) else None, f.read()))
+    return frames
+
+
+def sample_keyframes(path, metadata, max_frames=VIDEO_MAX_FRAMES):
+    """
+    Up to max_frames representative frames: the first frame plus scene changes,
+    or evenly spaced frames when the clip has fewer than VIDEO_MIN_FRAMES cuts.
+    """
+    with tempfile.TemporaryDirectory(prefix='frames_', dir=VIDEO_SPOOL_DIR) as out_dir:
+        frames = _extract(path, f"select='eq(n\\,0)+gt(scene\\,{VIDEO_SCENE_THRESHOLD})'", out_dir, max_frames)
+    if len(frames) >= VIDEO_MIN_FRAMES or not metadata.get('duration_s'):
+        return frames, 'scene'
+    with tempfile.TemporaryDirectory(prefix='frames_', dir=VIDEO_SPOOL_DIR) as out_dir:
+        rate = max_frames / metadata['duration_s']
+        return _extract(path, f'fps={rate:.4f}', out_dir, max_frames), 'uniform'
+
+
+# -----------------------------------------------------------------------------
+# Analysis cache
+# -----------------------------------------------------------------------------
+
+def _connect():
+    global _db_ready
+    conn = sqlite3.connect(CACHE_DB_PATH, timeout=10)
+    if not _db_ready:
+        with _db_lock:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS video_analyses ('
+                'cache_key TEXT PRIMARY KEY, analysis TEXT NOT NULL, details TEXT NOT NULL, created_at REAL NOT NULL)'
+            )
+            conn.commit()
+            _db_ready = True
+    return conn
+
+
+def _cache_key(sha256, mode, prompt):
+    return hashlib.sha256(f"{sha256}\0{mode}\0{prompt}".encode('utf-8')).hexdigest()
+
+
+def _cache_get(key):
+    try:
+        conn = _connect()
+        try:
+            row = conn.execute(
+                'SELECT analysis, details, created_at FROM video_analyses WHERE cache_key = ?', (key,)
+            ).fetchone()
+        finally:
+            conn.close()
+    except sqlite3.Error as e:
+        print(f"Video cache read error: {str(e)}")
+        return None
+    if row and time.time() - row[2] < VIDEO_CACHE_TTL:
+        return row[0], json.loads(row[1])
+    return None
+
+
+def _cache_set(key, analysis, details):
+    try:
+        conn = _connect()
+        try:
+            conn.execute(
+                'INSERT OR REPLACE INTO video_analyses (cache_key, analysis, details, created_at) VALUES (?, ?, ?, ?)',
+                (key, analysis, json.dumps(details), time.time())
+            )
+            conn.commit()
+        finally:
+            conn.close()
+    except sqlite3.Error as e:
+        print(f"Video cache write error: {str(e)}")
+
+
+# -----------------------------------------------------------------------------
+# Analysis
+# -----------------------------------------------------------------------------
+
+def _sampled_contents(video, prompt):
+    from PIL import Image
+
+    metadata = probe(video.path)
+    frames, strategy = sample_keyframes(video.path, metadata)
+    if not frames:
+        raise ValueError('No frames could be extracted')
+    stamps = ", ".join(f"{t:.1f}s" if t is not None else "?" for t, _ in frames)
+    context = (
+        f"{prompt}\n\nYou are given {len(frames)} keyframes sampled from the video "
+        f"({'at scene changes' if strategy == 'scene' else 'at even intervals'}), in order, "
+        f"at timestamps {stamps}. Audio is not included.\n"
+        f"Video metadata: {json.dumps(metadata)}"
+    )
+    contents = [context] + [Image.open(io.BytesIO(data)) for _, data in frames]
+    details = {
+        'frames': len(frames),
+        'frame_timestamps': [t for t, _ in frames],
+        'sampling': strategy,
+        'metadata': metadata,
+    }
+    return contents, sum(len(data) for _, data in frames), details
+
+
+def analyze(video, prompt, generate, mode=None):
+    """
+    Analyze a spooled video; generate(contents) calls the LLM. Returns
+    (analysis, details) where details include mode, bytes_sent, latency_ms and cached.
+    """
+    mode = (mode or VIDEO_ANALYSIS_MODE).lower()
+    if mode == 'sampled' and not sampling_available():
+        print("ffmpeg/ffprobe not found, sending the full video instead of keyframes")
+        mode = 'full'
+
+    started = time.perf_counter()
+    key = _cache_key(video.sha256, mode, prompt)
+    hit = _cache_get(key)
+    if hit:
+        analysis, details = hit
+        latency_ms = round((time.perf_counter() - started) * 1000, 1)
+        _record(mode, 0, latency_ms, cached=True)
+        return analysis, {**details, 'mode': mode, 'bytes_sent': 0, 'latency_ms': latency_ms, 'cached': True}
+
+    if mode == 'sampled':
+        contents, bytes_sent, details = _sampled_contents(video, prompt)
+    else:
+        with open(video.path, 'rb') as f:
+            data = f.read()
+        contents = [prompt, {'mime_type': video.mime_type, 'data': data}]
+        bytes_sent, details = len(data), {}
+
+    analysis = generate(contents)
+    latency_ms = round((time.perf_counter() - started) * 1000, 1)
+    _record(mode, bytes_sent, latency_ms, cached=False)
+    details = {**details, 'video_bytes': video.size, 'sha256': video.sha256}
+    _cache_set(key, analysis, details)
+    return analysis, {**details, 'mode': mode, 'bytes_sent': bytes_sent, 'latency_ms': latency_ms, 'cached': False}
+
+
+def stats():
+    with _stats_lock:
+        modes = {mode: dict(entry) for mode, entry in _stats.items()}
+    for entry in modes.values():
+        fresh = entry['requests'] - entry['cache_hits']
+        entry['mean_bytes_sent'] = round(entry['bytes_sent'] / fresh) if fresh else None
+        entry['mean_latency_ms'] = round(entry.pop('latency_ms_total') / entry['requests'], 1)
+    return {
+        'default_mode': VIDEO_ANALYSIS_MODE,
+        'sampling_available': sampling_available(),
+        'modes': modes,
+    }
@@ -18,16 +18,14 @@ FREE SETUP INSTRUCTIONS:
 Note: Twilio free tier includes sandbox WhatsApp for testing
 """
 
-from flask import Flask, request
+from flask import Flask, request, jsonify
 from twilio.twiml.messaging_response import MessagingResponse
-from twilio.rest import Client
 import os
 from dotenv import load_dotenv
-import google.generativeai as genai
-import requests
-from bs4 import BeautifulSoup
-import re
-from duckduckgo_search import DDGS
+import fact_engine
+from fact_engine import detect_urls, scrape_url_content
+import chat_turn_store
+import whatsapp_dispatch
 
 load_dotenv()
 
@@ -36,172 +34,60 @@ TWILIO_ACCOUNT_SID = os.getenv('TWILIO_ACCOUNT_SID')
 TWILIO_AUTH_TOKEN = os.getenv('TWILIO_AUTH_TOKEN')
 TWILIO_WHATSAPP_NUMBER = os.getenv('TWILIO_WHATSAPP_NUMBER', 'whatsapp:+14155238886')
 
-# Configure Gemini API
-genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+# Last CHAT_STORE_MAX_TURNS turns per number, shared by every webhook worker (see chat_turn_store)
+conversation_store = chat_turn_store.create_store('whatsapp')
 
-# Store conversation history (in production, use Redis or database)
-conversation_store = {}
+# WhatsApp replies are short, so scraped pages are cut sooner than on the web
+WHATSAPP_SCRAPE_MAX_CHARS = 5000
 
-def detect_urls(text):
-    """Detect URLs in text"""
-    url_pattern = re.compile(r'http[s]?://(?:[a-zA-Z]|[0-9]|[$-_@.&+]|[!*\\(\\),]|(?:%[0-9a-fA-F][0-9a-fA-F]))+')
-    return url_pattern.findall(text)
+VERDICT_ICONS = {'TRUE': '✅', 'FALSE': '❌', 'MISLEADING': '⚠', 'PARTIALLY TRUE': '⚠'}
 
-def scrape_url_content(url):
-    """Extract text content from a URL"""
-    try:
-        # Check if it's an X/Twitter URL
-        if 'twitter.com' in url or 'x.com' in url:
-            return scrape_twitter_content(url)
-        
-        # Regular HTTP scraping for other sites
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-        }
-        response = requests.get(url, headers=headers, timeout=10)
-        response.raise_for_status()
-        
-        soup = BeautifulSoup(response.content, 'html.parser')
-        
-        # Remove script and style elements
-        for script in soup(['script', 'style', 'nav', 'footer', 'header']):
-            script.decompose()
-        
-        # Get text
-        text = soup.get_text()
-        
-        # Clean up text
-        lines = (line.strip() for line in text.splitlines())
-        chunks = (phrase.strip() for line in lines for phrase in line.split("  "))
-        text = ' '.join(chunk for chunk in chunks if chunk)
-        
-        # Limit text length to avoid token limits
-        max_chars = 5000
-        if len(text) > max_chars:
-            text = text[:max_chars] + "... [content truncated]"
-        
-        return text
-    except Exception as e:
-        return f"Error scraping URL: {str(e)}"
-
-def scrape_twitter_content(url):
-    """Scrape X/Twitter content using Selenium"""
-    from selenium import webdriver
-    from selenium.webdriver.chrome.options import Options
-    from selenium.webdriver.chrome.service import Service
-    from selenium.webdriver.common.by import By
-    from selenium.webdriver.support.ui import WebDriverWait
-    from selenium.common.exceptions import TimeoutException
-    from webdriver_manager.chrome import ChromeDriverManager
-    
-    try:
-        chrome_options = Options()
-        chrome_options.add_argument('--headless')
-        chrome_options.add_argument('--no-sandbox')
-        chrome_options.add_argument('--disable-dev-shm-usage')
-        chrome_options.add_argument('--disable-gpu')
-        chrome_options.add_argument('--window-size=1920,1080')
-        chrome_options.add_argument('user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36')
-        
-        service = Service(ChromeDriverManager().install())
-        driver = webdriver.Chrome(service=service, options=chrome_options)
-        driver.get(url)
-        
-        wait = WebDriverWait(driver, 10)
-        
-        try:
-            tweet_selectors = [
-                "article[data-testid='tweet']",
-                "div[data-testid='tweetText']",
-                "div[lang]",
-                "article div[lang]"
-            ]
-            
-            content = ""
-            for selector in tweet_selectors:
-                try:
-                    elements = driver.find_elements(By.CSS_SELECTOR, selector)
-                    if elements:
-                        for elem in elements[:3]:
-                            text = elem.text.strip()
-                            if text and len(text) > 10:
-                                content += text + "\n\n"
-                        if content:
-                            break
-                except:
-                    continue
-            
-            driver.quit()
-            
-            if content:
-                return content.strip()
-            else:
-                return "Could not extract tweet content. Please copy and paste the claim text."
-                
-        except TimeoutException:
-            driver.quit()
-            return "Timeout while loading tweet. Please copy and paste the claim text."
-            
-    except Exception as e:
-        return f"Error scraping Twitter/X: {str(e)}"
-
-def search_duckduckgo(query, max_results=3):
-    """Search DuckDuckGo for real-time information"""
-    try:
-        with DDGS() as ddgs:
-            results = []
-            for r in ddgs.text(query, max_results=max_results):
-                results.append({
-                    'title': r.get('title', ''),
-                    'body': r.get('body', ''),
-                    'url': r.get('href', '')
-                })
-            return results
-    except Exception as e:
-        print(f"DuckDuckGo search error: {str(e)}")
-        return []
+def cached_verdict_reply(cached):
+    """Reply for a claim already settled on this or another channel"""
+    icon = VERDICT_ICONS.get(cached['verdict'], '❓')
+    return f"{icon} {cached['verdict']} (confidence {cached['confidence']}%)\n\n{cached['response']}"
 
 def fact_check_message(user_message, phone_number):
     """Fact-check a message using Gemini AI"""
     try:
-        # Get or create conversation history
-        if phone_number not in conversation_store:
-            conversation_store[phone_number] = []
-        
-        conversation_history = conversation_store[phone_number]
+        # Get conversation history (empty for new or idle numbers)
+        conversation_history = conversation_store.get(phone_number)
         
         # Detect URLs in the message
         urls = detect_urls(user_message)
         enhanced_message = user_message
-        search_results_text = ""
+        live_summary = ""
         
         if urls:
             # URL found - use scraping only
             scraped_content = ""
             for url in urls:
-                content = scrape_url_content(url)
-                if "Error scraping" not in content:
+                content = scrape_url_content(url, max_chars=WHATSAPP_SCRAPE_MAX_CHARS)
+                if not fact_engine.is_scrape_error(content):
                     scraped_content += f"\n\n--- Content from {url} ---\n{content}\n"
             
             if scraped_content:
                 enhanced_message = f"{user_message}\n\nI've extracted the following content:{scraped_content}"
         else:
-            # No URL - perform DuckDuckGo search
+            # A claim already checked on the web or by another sender needs no search or model call
+            cached = fact_engine.verdicts.lookup(user_message)
+            if cached:
+                ai_response = cached_verdict_reply(cached)
+                conversation_store.append(phone_number, [
+                    {"role": "user", "content": user_message},
+                    {"role": "assistant", "content": ai_response}
+                ])
+                return ai_response
+            
+            # No URL - search with the engine (evidence is shared with the web app)
             try:
-                search_query = user_message[:150]
-                search_results = search_duckduckgo(search_query, max_results=3)
-                
-                if search_results:
-                    search_results_text = "\n\n--- Web Search Results ---\n"
-                    for i, result in enumerate(search_results, 1):
-                        search_results_text += f"\n{i}. {result['title']}\n{result['body']}\n"
-                    
-                    enhanced_message += search_results_text
+                evidence = fact_engine.gather(user_message)
+                if evidence['results']:
+                    live_summary = evidence['live_summary']
+                    enhanced_message += f"\n\n--- Web Search Results ---\n{live_summary}"
             except Exception as search_error:
                 print(f"Search error: {str(search_error)}")
         
-        model = genai.GenerativeModel('gemini-2.5-flash')
-        
         system_prompt = """You are an expert AI fact-checking agent on WhatsApp. Your job is to:
 1. Analyze claims about health, science, politics, or any topic
 2. Provide evidence-based fact-checking
@@ -214,6 +100,7 @@ When fact-checking:
 - Give concise explanations
 - No special characters like * or #
 - Keep it simple and clear
+- End with one line: VERDICT: <TRUE, FALSE, MISLEADING, PARTIALLY TRUE or UNVERIFIABLE> CONFIDENCE: <0-100>%
 
 If a URL can't be accessed, ask user to copy and paste the claim text."""
         
@@ -222,27 +109,59 @@ If a URL can't be accessed, ask user to copy and paste the claim text."""
         messages.append({"role": "user", "content": enhanced_message})
         
         # Generate response
-        response = model.generate_content(system_prompt + "\n\nConversation:\n" + 
-                                         "\n".join([f"{msg['role']}: {msg['content']}" for msg in messages]))
-        
-        ai_response = response.text
+        ai_response = fact_engine.generate(system_prompt + "\n\nConversation:\n" + 
+                                           "\n".join([f"{msg['role']}: {msg['content']}" for msg in messages]))
         
-        # Store conversation
-        conversation_store[phone_number].append({"role": "user", "content": user_message})
-        conversation_store[phone_number].append({"role": "assistant", "content": ai_response})
+        # Share the verdict with the other channels
+        if not urls and live_summary:
+            verdict, confidence = fact_engine.extract_verdict_and_confidence(ai_response)
+            fact_engine.verdicts.record(user_message, verdict, confidence, ai_response, live_summary, channel='whatsapp')
         
-        # Keep only last 10 messages to save memory
-        if len(conversation_store[phone_number]) > 10:
-            conversation_store[phone_number] = conversation_store[phone_number][-10:]
+        # Store conversation; the store keeps only the most recent turns
+        conversation_store.append(phone_number, [
+            {"role": "user", "content": user_message},
+            {"role": "assistant", "content": ai_response}
+        ])
         
         return ai_response
         
     except Exception as e:
-        return f"Sorry, I encountered an error: {str(e)}"
+        # The caller decides what the user sees; the error text is for the logs only
+        print(f"Fact check error for {phone_number}: {str(e)}")
+        raise
+
+def send_whatsapp_message(to_number, body):
+    """Send one message out of band through the Twilio REST API"""
+    client = whatsapp_dispatch.get_client(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN)
+    client.messages.create(from_=TWILIO_WHATSAPP_NUMBER, to=to_number, body=body)
+
+# Sent instead of a verdict when a check fails; never cached or shared
+ERROR_REPLY = "Sorry, I couldn't check that message right now. Please try again in a few minutes."
+
+# Fact checks run on a worker pool; the webhook only acknowledges
+dispatcher = whatsapp_dispatch.Dispatcher(
+    handle=lambda body, from_number: fact_check_message(body, from_number),
+    send=send_whatsapp_message,
+    remember=lambda body, from_number, reply: conversation_store.append(from_number, [
+        {"role": "user", "content": body},
+        {"role": "assistant", "content": reply}
+    ]),
+    error_reply=ERROR_REPLY
+)
+
+# Immediate TwiML reply for each enqueue() outcome; duplicates get none
+ACK_MESSAGES = {
+    'queued': "🔍 Checking that now, I'll reply with the verdict shortly.",
+    'coalesced': "🔍 Checking that now, I'll reply with the verdict shortly.",
+    'throttled': "⏳ You're sending messages faster than I can check them. Please wait a minute and send your claim again.",
+    'busy': "⏳ I'm handling a lot of requests right now. Please try again in a few minutes.",
+    'duplicate': None,
+}
 
 def create_whatsapp_app():
     """Create Flask app for WhatsApp webhook"""
     app = Flask(__name__)
+    dispatcher.recover()
     
     @app.route('/whatsapp', methods=['POST'])
     def whatsapp_webhook():
@@ -250,6 +169,7 @@ def create_whatsapp_app():
         try:
             incoming_msg = request.values.get('Body', '').strip()
             from_number = request.values.get('From', '')
+            message_sid = request.values.get('MessageSid', '')
             
             print(f"Received message from {from_number}: {incoming_msg}")
             
@@ -267,16 +187,20 @@ Example:
 "https://example.com/article"
 """
             elif incoming_msg.lower() == 'clear':
-                if from_number in conversation_store:
-                    conversation_store[from_number] = []
+                conversation_store.clear(from_number)
                 response_text = "✅ Conversation cleared! Send me a new claim to fact-check."
+            elif message_sid:
+                # Acknowledge now and send the verdict when the check is done;
+                # a retried delivery of the same MessageSid gets an empty reply
+                response_text = ACK_MESSAGES[dispatcher.enqueue(message_sid, from_number, incoming_msg)]
             else:
                 # Fact-check the message
                 response_text = fact_check_message(incoming_msg, from_number)
             
             # Create Twilio response
             resp = MessagingResponse()
-            resp.message(response_text)
+            if response_text:
+                resp.message(response_text)
             
             return str(resp)
             
@@ -291,6 +215,15 @@ Example:
         """Handle message status callbacks"""
         return '', 200
     
+    @app.route('/whatsapp/stats', methods=['GET'])
+    def whatsapp_stats():
+        """Conversation store, reply queue and shared engine counters"""
+        return jsonify({
+            'conversations': conversation_store.stats(),
+            'dispatch': {**whatsapp_dispatch.stats(), **dispatcher.snapshot()},
+            'fact_engine': fact_engine.stats()
+        }), 200
+    
     @app.route('/')
     def home():
         return """
@@ -0,0 +1,460 @@
+"""
+Asynchronous processing of incoming WhatsApp messages
+File: whatsapp_dispatch.py
+
+The webhook calls enqueue() and acknowledges at once; a worker pool runs the
+fact check and sends the verdict out of band through the Twilio REST client.
+Every MessageSid is recorded in the shared cache database (INSERT OR IGNORE),
+so Twilio's retries of a webhook that was slow or failed are acknowledged
+without being processed twice, whichever worker process receives them.
+Messages still queued when a process stopped are picked up again by
+recover(). While a process holds a message (queued locally or being checked)
+a heartbeat refreshes its updated_at every WHATSAPP_HEARTBEAT_INTERVAL, so
+recover() only takes over messages whose process has stopped, not long checks.
+
+Flood control: each sender has a token bucket (WHATSAPP_SENDER_RATE messages
+per minute, bursting to WHATSAPP_SENDER_BURST); messages over it get a "slow
+down" reply instead of a fact check. Identical messages (e.g. the same
+forwarded chain from many numbers) within WHATSAPP_COALESCE_WINDOW share one
+check. Queued checks are served lowest-priority-value first, where the value
+is how much of their sender's bucket is used up, so a number that sends one
+message is not stuck behind a flood; a global bucket
+(WHATSAPP_GLOBAL_RATE per second) paces the checks that actually run.
+
+Set TWILIO_API_BASE to send through a local fake Twilio endpoint instead of
+api.twilio.com; one can be started with:
+    python whatsapp_dispatch.py fake-twilio
+"""
+
+import hashlib
+import itertools
+import os
+import queue
+import sqlite3
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+from scrape_scheduler import ResultCache, TokenBucket
+from url_utils import CACHE_DB_PATH
+
+WHATSAPP_WORKERS = int(os.getenv('WHATSAPP_WORKERS', '4'))
+WHATSAPP_SEND_RETRIES = int(os.getenv('WHATSAPP_SEND_RETRIES', '3'))
+WHATSAPP_MAX_BODY = 1600  # Twilio's limit for one WhatsApp message body
+WHATSAPP_RECOVER_AFTER = int(os.getenv('WHATSAPP_RECOVER_AFTER', '300'))
+WHATSAPP_HEARTBEAT_INTERVAL = float(os.getenv('WHATSAPP_HEARTBEAT_INTERVAL', str(max(1, WHATSAPP_RECOVER_AFTER // 5))))
+WHATSAPP_MESSAGE_TTL = int(os.getenv('WHATSAPP_MESSAGE_TTL', str(7 * 24 * 3600)))
+WHATSAPP_SENDER_RATE = float(os.getenv('WHATSAPP_SENDER_RATE', '6'))  # messages per minute per sender
+WHATSAPP_SENDER_BURST = int(os.getenv('WHATSAPP_SENDER_BURST', '4'))
+WHATSAPP_GLOBAL_RATE = float(os.getenv('WHATSAPP_GLOBAL_RATE', '2'))  # fact checks started per second
+WHATSAPP_GLOBAL_BURST = int(os.getenv('WHATSAPP_GLOBAL_BURST', '10'))
+WHATSAPP_MAX_QUEUE = int(os.getenv('WHATSAPP_MAX_QUEUE', '500'))
+WHATSAPP_COALESCE_WINDOW = int(os.getenv('WHATSAPP_COALESCE_WINDOW', '600'))
+WHATSAPP_COALESCE_MIN_CHARS = int(os.getenv('WHATSAPP_COALESCE_MIN_CHARS', '40'))
+WHATSAPP_MAX_SENDERS = int(os.getenv('WHATSAPP_MAX_SENDERS', '10000'))
+TWILIO_API_BASE = os.getenv('TWILIO_API_BASE', '')
+
+_db_lock = threading.Lock()
+_db_ready = False
+_client = None
+_client_lock = threading.Lock()
+_stats_lock = threading.Lock()
+_stats = {'received': 0, 'duplicates': 0, 'processed': 0, 'failed': 0, 'sent': 0, 'send_errors': 0,
+          'recovered': 0, 'in_flight': 0, 'latency_ms_total': 0.0, 'throttled_sender': 0,
+          'throttled_global': 0, 'rejected_queue_full': 0, 'coalesced': 0, 'replayed': 0,
+          'heartbeat_errors': 0}
+
+
+def _count(key, n=1):
+    with _stats_lock:
+        _stats[key] += n
+
+
+def _connect():
+    global _db_ready
+    conn = sqlite3.connect(CACHE_DB_PATH, timeout=10)
+    if not _db_ready:
+        with _db_lock:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS whatsapp_messages ('
+                'message_sid TEXT PRIMARY KEY, from_number TEXT NOT NULL, body TEXT NOT NULL, '
+                'status TEXT NOT NULL, received_at REAL NOT NULL, updated_at REAL NOT NULL)'
+            )
+            conn.commit()
+            _db_ready = True
+    return conn
+
+
+def _set_status(message_sid, status):
+    try:
+        conn = _connect()
+        try:
+            conn.execute(
+                'UPDATE whatsapp_messages SET status = ?, updated_at = ? WHERE message_sid = ?',
+                (status, time.time(), message_sid)
+            )
+            conn.commit()
+        finally:
+            conn.close()
+    except sqlite3.Error as e:
+        print(f"WhatsApp message log write error: {str(e)}")
+
+
+def _heartbeat(message_sids):
+    """Refresh updated_at of messages this process still holds, so recover() leaves them alone"""
+    try:
+        conn = _connect()
+        try:
+            now = time.time()
+            conn.executemany(
+                "UPDATE whatsapp_messages SET updated_at = ? WHERE message_sid = ? AND status IN ('queued', 'processing')",
+                [(now, sid) for sid in message_sids]
+            )
+            conn.commit()
+        finally:
+            conn.close()
+    except sqlite3.Error as e:
+        _count('heartbeat_errors')
+        print(f"WhatsApp heartbeat write error: {str(e)}")
+
+
+def get_client(account_sid, auth_token):
+    """Twilio REST client, pointed at TWILIO_API_BASE when set"""
+    global _client
+    with _client_lock:
+        if _client is None:
+            from twilio.rest import Client
+
+            _client = Client(account_sid, auth_token)
+            if TWILIO_API_BASE:
+                _client.api.base_url = TWILIO_API_BASE.rstrip('/')
+        return _client
+
+
+def split_body(text, limit=WHATSAPP_MAX_BODY):
+    """Split a reply into message bodies of at most `limit` characters, preferring paragraph breaks"""
+    parts = []
+    text = (text or '').strip()
+    while len(text) > limit:
+        cut = text.rfind('\n', 0, limit)
+        if cut < limit // 2:
+            cut = text.rfind(' ', 0, limit)
+        if cut < limit // 2:
+            cut = limit
+        parts.append(text[:cut].rstrip())
+        text = text[cut:].lstrip()
+    if text:
+        parts.append(text)
+    return parts
+
+
+def coalesce_key(body):
+    """Key for identical messages (case and whitespace ignored); None for short, context-dependent ones"""
+    normalized = ' '.join((body or '').lower().split())
+    if len(normalized) < WHATSAPP_COALESCE_MIN_CHARS:
+        return None
+    return hashlib.sha256(normalized.encode('utf-8')).hexdigest()
+
+
+class Dispatcher:
+    """
+    handle(body, from_number) produces the reply text; send(to, body) delivers
+    one message; remember(body, from_number, reply), if given, records a reply
+    that was shared with a sender whose message was coalesced or replayed. All
+    run on the worker threads. When handle raises, the message and everyone
+    coalesced into it are marked failed and sent error_reply (if given); the
+    failure is not cached, so the next identical message is checked afresh.
+    """
+
+    def __init__(self, handle, send, remember=None, error_reply=None):
+        self.handle = handle
+        self.send = send
+        self.remember = remember
+        self.error_reply = error_reply
+        self.queue = queue.PriorityQueue(maxsize=WHATSAPP_MAX_QUEUE)
+        self.sequence = itertools.count()
+        self.global_bucket = TokenBucket(WHATSAPP_GLOBAL_RATE, WHATSAPP_GLOBAL_BURST)
+        self.sender_buckets = OrderedDict()
+        self.pending = {}  # coalesce key -> job waiting or running
+        self.held = set()  # MessageSids queued or running in this process, kept alive by the heartbeat
+        self.recent = ResultCache(WHATSAPP_COALESCE_WINDOW, 1000)  # coalesce key -> reply
+        self.lock = threading.Lock()
+        self.workers = []
+
+    def _start_workers(self):
+        with self.lock:
+            if self.workers:
+                return
+            for i in range(WHATSAPP_WORKERS):
+                worker = threading.Thread(target=self._work, name=f'whatsapp-{i}', daemon=True)
+                worker.start()
+                self.workers.append(worker)
+            heartbeat = threading.Thread(target=self._beat, name='whatsapp-heartbeat', daemon=True)
+            heartbeat.start()
+            self.workers.append(heartbeat)
+
+    def _beat(self):
+        while True:
+            time.sleep(WHATSAPP_HEARTBEAT_INTERVAL)
+            with self.lock:
+                held = list(self.held)
+            if held:
+                _heartbeat(held)
+
+    def _release(self, message_sid, status):
+        """Record a message's final status and stop its heartbeat"""
+        _set_status(message_sid, status)
+        with self.lock:
+            self.held.discard(message_sid)
+
+    def _sender_bucket(self, from_number):
+        with self.lock:
+            bucket = self.sender_buckets.get(from_number)
+            if bucket is None:
+                bucket = TokenBucket(WHATSAPP_SENDER_RATE / 60.0, WHATSAPP_SENDER_BURST)
+                self.sender_buckets[from_number] = bucket
+                while len(self.sender_buckets) > WHATSAPP_MAX_SENDERS:
+                    self.sender_buckets.popitem(last=False)
+            self.sender_buckets.move_to_end(from_number)
+            return bucket
+
+    @staticmethod
+    def _bucket_used(bucket):
+        """How much of the bucket is used up (0 = idle sender, higher = busier)"""
+        with bucket.lock:
+            bucket._refill(time.monotonic())
+            return round(bucket.capacity - bucket.tokens, 2)
+
+    def enqueue(self, message_sid, from_number, body):
+        """
+        Record and queue a message. Returns 'queued', 'coalesced' (shares an
+        identical message's check), 'duplicate' (MessageSid already seen),
+        'throttled' (sender over its rate) or 'busy' (queue full).
+        """
+        now = time.time()
+        try:
+            conn = _connect()
+            try:
+                inserted = conn.execute(
+                    'INSERT OR IGNORE INTO whatsapp_messages '
+                    '(message_sid, from_number, body, status, received_at, updated_at) VALUES (?, ?, ?, ?, ?, ?)',
+                    (message_sid, from_number, body, 'queued', now, now)
+                ).rowcount
+                conn.commit()
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            # Without the log we cannot deduplicate, but the message should still be answered
+            print(f"WhatsApp message log write error: {str(e)}")
+            inserted = 1
+        if not inserted:
+            _count('duplicates')
+            print(f"Duplicate delivery of {message_sid}, already handled")
+            return 'duplicate'
+        _count('received')
+
+        bucket = self._sender_bucket(from_number)
+        if not bucket.try_acquire():
+            _count('throttled_sender')
+            _set_status(message_sid, 'throttled')
+            return 'throttled'
+
+        key = coalesce_key(body)
+        reply = self.recent.get(key) if key is not None else None
+        if reply is not None:
+            # Answered moments ago: send the same verdict without another check
+            _count('replayed')
+            return self._submit(message_sid, from_number, body, now, priority=-1, reply=reply)
+        return self._submit(message_sid, from_number, body, now, priority=self._bucket_used(bucket), key=key)
+
+    def _submit(self, message_sid, from_number, body, received_at, priority=0.0, key=None, reply=None):
+        """Queue a job, or join the queued/running job for the same coalesce key"""
+        self._start_workers()
+        job = {'body': body, 'recipients': [(message_sid, from_number)], 'received_at': received_at,
+               'key': key, 'reply': reply}
+        with self.lock:
+            self.held.add(message_sid)
+            if key is not None:
+                existing = self.pending.get(key)
+                if existing is not None:
+                    existing['recipients'].append((message_sid, from_number))
+                    _count('coalesced')
+                    return 'coalesced'
+                self.pending[key] = job
+        try:
+            self.queue.put_nowait((priority, next(self.sequence), job))
+        except queue.Full:
+            self._finish(job)
+            _count('rejected_queue_full')
+            self._release(message_sid, 'rejected')
+            return 'busy'
+        _count('in_flight')
+        return 'queued'
+
+    def _deliver(self, to, text):
+        for part in split_body(text):
+            for attempt in range(WHATSAPP_SEND_RETRIES):
+                try:
+                    self.send(to, part)
+                    _count('sent')
+                    break
+                except Exception as e:
+                    _count('send_errors')
+                    print(f"WhatsApp send to {to} failed (attempt {attempt + 1}): {str(e)}")
+                    if attempt == WHATSAPP_SEND_RETRIES - 1:
+                        raise
+                    time.sleep(2 ** attempt)
+
+    def _work(self):
+        while True:
+            _, _, job = self.queue.get()
+            try:
+                self._process(job)
+            finally:
+                self.queue.task_done()
+
+    def _finish(self, job):
+        """Stop coalescing into this job; returns everyone who should get its reply"""
+        with self.lock:
+            if job['key'] is not None and self.pending.get(job['key']) is job:
+                del self.pending[job['key']]
+            return list(job['recipients'])
+
+    def _process(self, job):
+        message_sid, from_number = job['recipients'][0]
+        checked = job['reply'] is None  # handle() records the turn for the sender it ran for
+        try:
+            reply = job['reply']
+            if reply is None:
+                _set_status(message_sid, 'processing')
+                if not self.global_bucket.try_acquire():
+                    _count('throttled_global')
+                    self.global_bucket.acquire()
+                reply = self.handle(job['body'], from_number)
+                if job['key'] is not None:
+                    self.recent.set(job['key'], reply)
+        except Exception as e:
+            print(f"WhatsApp message {message_sid} failed: {str(e)}")
+            for sid, number in self._finish(job):
+                self._release(sid, 'failed')
+                _count('failed')
+                if self.error_reply:
+                    try:
+                        self._deliver(number, self.error_reply)
+                    except Exception as send_error:
+                        print(f"WhatsApp error reply to {number} failed: {str(send_error)}")
+            _count('in_flight', -1)
+            return
+
+        for sid, number in self._finish(job):
+            try:
+                self._deliver(number, reply)
+                if self.remember and not (checked and sid == message_sid):
+                    self.remember(job['body'], number, reply)
+                self._release(sid, 'sent')
+                _count('processed')
+                _count('latency_ms_total', (time.time() - job['received_at']) * 1000)
+            except Exception as e:
+                self._release(sid, 'failed')
+                _count('failed')
+                print(f"WhatsApp message {sid} failed: {str(e)}")
+        _count('in_flight', -1)
+
+    def recover(self):
+        """
+        Requeue messages left queued or processing for WHATSAPP_RECOVER_AFTER
+        seconds (e.g. by a worker that stopped) and drop old message records.
+        Messages a live process holds are not stale: its heartbeat keeps
+        refreshing them.
+        """
+        now = time.time()
+        try:
+            conn = _connect()
+            try:
+                conn.execute('DELETE FROM whatsapp_messages WHERE received_at < ?', (now - WHATSAPP_MESSAGE_TTL,))
+                rows = conn.execute(
+                    "SELECT message_sid, from_number, body, received_at FROM whatsapp_messages "
+                    "WHERE status IN ('queued', 'processing') AND updated_at < ?",
+                    (now - WHATSAPP_RECOVER_AFTER,)
+                ).fetchall()
+                # Claim them so that another process running recover() skips them; a row
+                # whose heartbeat arrived since the SELECT is left to its process
+                rows = [row for row in rows if conn.execute(
+                    "UPDATE whatsapp_messages SET status = 'queued', updated_at = ? "
+                    "WHERE message_sid = ? AND updated_at < ?",
+                    (now, row[0], now - WHATSAPP_RECOVER_AFTER)
+                ).rowcount]
+                conn.commit()
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            print(f"WhatsApp message log read error: {str(e)}")
+            return 0
+        for message_sid, from_number, body, received_at in rows:
+            self._submit(message_sid, from_number, body, received_at)
+        _count('recovered', len(rows))
+        if rows:
+            print(f"Requeued {len(rows)} unanswered WhatsApp messages")
+        return len(rows)
+
+    def snapshot(self):
+        with self.lock:
+            pending = len(self.pending)
+            senders = len(self.sender_buckets)
+            held = len(self.held)
+        return {'queue_depth': self.queue.qsize(), 'coalescing': pending, 'tracked_senders': senders, 'held': held,
+                'recent_replies': self.recent.stats()}
+
+
+def stats():
+    with _stats_lock:
+        result = dict(_stats)
+    processed = result['processed'] or 1
+    result['mean_reply_latency_ms'] = round(result.pop('latency_ms_total') / processed, 1)
+    result['workers'] = WHATSAPP_WORKERS
+    result['limits'] = {
+        'sender_per_minute': WHATSAPP_SENDER_RATE,
+        'sender_burst': WHATSAPP_SENDER_BURST,
+        'global_per_second': WHATSAPP_GLOBAL_RATE,
+        'max_queue': WHATSAPP_MAX_QUEUE,
+    }
+    return result
+
+
+def run_fake_twilio(port=5099):
+    """
+    Minimal stand-in for the Twilio Messages API: accepts message creates,
+    prints them, and lists them at GET /messages.
+    """
+    from flask import Flask, jsonify, request
+
+    app = Flask(__name__)
+    sent = []
+
+    @app.route('/2010-04-01/Accounts/<account_sid>/Messages.json', methods=['POST'])
+    def create_message(account_sid):
+        message = {
+            'sid': f'SM{len(sent):032d}',
+            'account_sid': account_sid,
+            'from': request.values.get('From'),
+            'to': request.values.get('To'),
+            'body': request.values.get('Body'),
+            'status': 'queued',
+        }
+        sent.append(message)
+        print(f"[fake twilio] {message['to']}: {message['body'][:80]}")
+        return jsonify(message), 201
+
+    @app.route('/messages', methods=['GET'])
+    def list_messages():
+        return jsonify(sent), 200
+
+    app.run(host='127.0.0.1', port=port)
+
+
+if __name__ == '__main__':
+    if sys.argv[1:2] == ['fake-twilio']:
+        run_fake_twilio(int(sys.argv[2]) if len(sys.argv) > 2 else 5099)
+    else:
+        print("Usage: python whatsapp_dispatch.py fake-twilio [port]")
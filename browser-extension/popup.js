@@ -1,14 +1,20 @@
 // Backend API URL
 const API_URL = 'http://localhost:5000/conversational-fact-check';
+const VERDICT_URL = 'http://localhost:5000/api/verdict'; // Stored verdicts, answered without a new check
+const SCAN_URL = 'http://localhost:5000/api/scan'; // Batch check of the claims on a page
+const MAX_SCAN_CLAIMS = 50;
+const MIN_CLAIM_CHARS = 20; // Shorter messages are never stored as claims
 const FULL_APP_URL = 'http://localhost:5173'; // Your React app URL
 
-// Conversation history
+// Conversation history (kept locally for display; the server keeps its own session)
 let conversationHistory = [];
+let conversationId = null;
 
 // DOM Elements
 const urlInput = document.getElementById('urlInput');
 const checkUrlBtn = document.getElementById('checkUrl');
 const getCurrentUrlBtn = document.getElementById('getCurrentUrl');
+const scanPageBtn = document.getElementById('scanPage');
 const messageInput = document.getElementById('messageInput');
 const sendMessageBtn = document.getElementById('sendMessage');
 const chatContainer = document.getElementById('chatContainer');
@@ -26,6 +32,7 @@ document.addEventListener('DOMContentLoaded', () => {
 function setupEventListeners() {
   checkUrlBtn.addEventListener('click', handleCheckUrl);
   getCurrentUrlBtn.addEventListener('click', handleGetCurrentUrl);
+  scanPageBtn.addEventListener('click', handleScanPage);
   sendMessageBtn.addEventListener('click', handleSendMessage);
   clearChatBtn.addEventListener('click', handleClearChat);
   openFullAppLink.addEventListener('click', handleOpenFullApp);
@@ -60,6 +67,145 @@ async function handleGetCurrentUrl() {
   }
 }
 
+// Scan the current page: extract candidate claims, stream their verdicts and highlight them in place
+async function handleScanPage() {
+  let tab;
+  let claims;
+  try {
+    [tab] = await chrome.tabs.query({ active: true, currentWindow: true });
+    const [injection] = await chrome.scripting.executeScript({
+      target: { tabId: tab.id },
+      func: extractPageClaims,
+      args: [MAX_SCAN_CLAIMS],
+    });
+    claims = injection.result || [];
+  } catch (error) {
+    console.error('Error reading page:', error);
+    showError('Could not read the current page');
+    return;
+  }
+  if (claims.length === 0) {
+    showError('No checkable claims found on this page');
+    return;
+  }
+
+  addMessageToChat('user', `Scan this page: ${tab.url}`);
+  showLoading(true);
+  const flagged = [];
+  try {
+    const response = await fetch(SCAN_URL, {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify({ claims }),
+    });
+    if (!response.ok) {
+      throw new Error(`HTTP error! status: ${response.status}`);
+    }
+
+    // One JSON object per line, highlighted as each arrives
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffered = '';
+    let summary = null;
+    for (;;) {
+      const { done, value } = await reader.read();
+      if (done) {
+        break;
+      }
+      buffered += decoder.decode(value, { stream: true });
+      const lines = buffered.split('\n');
+      buffered = lines.pop();
+      for (const line of lines.filter(Boolean)) {
+        const result = JSON.parse(line);
+        if (result.status === 'done') {
+          summary = result.counts;
+          continue;
+        }
+        if (!result.response) {
+          continue;
+        }
+        const verdict = result.response.verdict || 'NONE';
+        chrome.scripting.executeScript({
+          target: { tabId: tab.id },
+          func: highlightPageClaim,
+          args: [result.index, verdict, result.response.agent_response || ''],
+        });
+        if (verdict === 'FALSE' || verdict === 'MISLEADING' || verdict === 'PARTIALLY TRUE') {
+          flagged.push(`${verdict} (${result.response.confidence_score || 0}%): ${result.claim}`);
+        }
+      }
+    }
+
+    const checked = summary ? (summary.cached || 0) + (summary.checked || 0) : claims.length;
+    const throttled = summary ? summary.throttled || 0 : 0;
+    const note = throttled
+      ? `\n\n${throttled} more claims were not checked because of the rate limit. Scan again in a minute.`
+      : '';
+    addMessageToChat('ai', (flagged.length
+      ? `Checked ${checked} claims on this page. Questionable ones are highlighted:\n\n${flagged.join('\n\n')}`
+      : `Checked ${checked} claims on this page. None were found false or misleading.`) + note);
+  } catch (error) {
+    console.error('Error:', error);
+    addMessageToChat('ai', `Sorry, the page scan failed: ${error.message}. Make sure the backend server is running at ${SCAN_URL}`);
+  } finally {
+    showLoading(false);
+  }
+}
+
+// Runs in the page: sentences from the readable text that look like checkable claims
+function extractPageClaims(maxClaims) {
+  const claims = [];
+  const seen = new Set();
+  // Forget the marks of an earlier scan
+  for (const el of document.querySelectorAll('[data-factsure-block]')) {
+    if (el.dataset.factsureVerdict) {
+      el.style.backgroundColor = '';
+      el.removeAttribute('title');
+    }
+    delete el.dataset.factsureBlock;
+    delete el.dataset.factsureClaims;
+    delete el.dataset.factsureVerdict;
+  }
+  const blocks = document.querySelectorAll('article p, main p, p, li, blockquote, h1, h2, h3');
+  for (const block of blocks) {
+    // Skip page chrome and blocks nested in one already taken
+    if (claims.length >= maxClaims || block.closest('nav, footer, header, aside')
+        || (block.parentElement && block.parentElement.closest('[data-factsure-block]'))) {
+      continue;
+    }
+    const sentences = (block.innerText || '').match(/[^.!?]+[.!?]+/g) || [];
+    for (const raw of sentences) {
+      const sentence = raw.trim();
+      const words = sentence.split(/\s+/).length;
+      if (words < 6 || words > 60 || sentence.endsWith('?') || seen.has(sentence.toLowerCase())) {
+        continue;
+      }
+      seen.add(sentence.toLowerCase());
+      block.dataset.factsureBlock = block.dataset.factsureBlock || String(claims.length);
+      block.dataset.factsureClaims = `${block.dataset.factsureClaims || ''} ${claims.length}`.trim();
+      claims.push(sentence.slice(0, 500));
+      if (claims.length >= maxClaims) {
+        break;
+      }
+    }
+  }
+  return claims;
+}
+
+// Runs in the page: mark the block holding claim `index`; the worst verdict in a block wins
+function highlightPageClaim(index, verdict, explanation) {
+  const colors = { FALSE: '#ffd6d6', MISLEADING: '#ffe9c7', 'PARTIALLY TRUE': '#fff5c2', TRUE: '#dcf5dc' };
+  const rank = ['TRUE', 'PARTIALLY TRUE', 'MISLEADING', 'FALSE'];
+  const block = Array.from(document.querySelectorAll('[data-factsure-claims]'))
+    .find((el) => el.dataset.factsureClaims.split(' ').includes(String(index)));
+  if (!block || !colors[verdict] || rank.indexOf(verdict) < rank.indexOf(block.dataset.factsureVerdict || 'TRUE')) {
+    return;
+  }
+  block.dataset.factsureVerdict = verdict;
+  block.style.backgroundColor = colors[verdict];
+  block.title = `FactSure: ${verdict}. ${explanation}`;
+}
+
 // Handle URL check
 async function handleCheckUrl() {
   const url = urlInput.value.trim();
@@ -70,8 +216,12 @@ async function handleCheckUrl() {
   }
 
   const message = `I want to fact-check this article: ${url}`;
-  await sendMessageToBot(message);
   urlInput.value = '';
+  // Pages checked before are answered from the stored verdict; only a miss runs a full check
+  if (await showStoredVerdict(message, `${VERDICT_URL}?url=${encodeURIComponent(url)}`)) {
+    return;
+  }
+  await sendMessageToBot(message);
 }
 
 // Handle send message
@@ -82,9 +232,62 @@ async function handleSendMessage() {
     return;
   }
 
-  await sendMessageToBot(message);
   messageInput.value = '';
   messageInput.style.height = 'auto';
+  const hash = await claimHash(message);
+  if (hash && await showStoredVerdict(message, `${VERDICT_URL}/${hash}`)) {
+    return;
+  }
+  await sendMessageToBot(message);
+}
+
+// Same key as the server: SHA-256 of the lower-cased, whitespace-collapsed claim
+async function claimHash(claim) {
+  const key = claim.toLowerCase().split(/\s+/).filter(Boolean).join(' ');
+  if (key.length < MIN_CLAIM_CHARS || !crypto.subtle) {
+    return null;
+  }
+  const digest = await crypto.subtle.digest('SHA-256', new TextEncoder().encode(key));
+  return Array.from(new Uint8Array(digest), (b) => b.toString(16).padStart(2, '0')).join('');
+}
+
+// Show a stored verdict for the message if the backend has one; false on a miss or error
+async function showStoredVerdict(message, lookupUrl) {
+  try {
+    const response = await fetch(lookupUrl);
+    if (!response.ok) {
+      return false;
+    }
+    const data = await response.json();
+    addMessageToChat('user', message);
+    addMessageToChat('ai', `${formatBotMessage(data)}\n\n(Checked earlier)`);
+    return true;
+  } catch (error) {
+    console.error('Verdict lookup failed:', error);
+    return false;
+  }
+}
+
+// Format a backend response for the chat
+function formatBotMessage(data) {
+  if (data.response && typeof data.response === 'object') {
+    // New format with structured response
+    const verdict = data.response.verdict || 'NONE';
+    const confidence = data.response.confidence_score || 0;
+    const agentResponse = data.response.agent_response || '';
+    const evidence = data.response.evidence_summary || '';
+    
+    // Format the message
+    if (verdict !== 'NONE') {
+      return `${agentResponse}\n\nVerdict: ${verdict}\nConfidence: ${confidence}%\n\nEvidence:\n${evidence}`;
+    }
+    return agentResponse;
+  }
+  if (typeof data.response === 'string') {
+    // Fallback for string response
+    return data.response;
+  }
+  return 'No response from AI.';
 }
 
 // Send message to bot
@@ -103,7 +306,9 @@ async function sendMessageToBot(message) {
       },
       body: JSON.stringify({
         message: message,
-        conversation_history: conversationHistory,
+        conversation_id: conversationId,
+        // Only needed to seed a new server session from a restored local chat
+        ...(conversationId ? {} : { conversation_history: conversationHistory.slice(0, -1) }),
       }),
     });
 
@@ -112,31 +317,13 @@ async function sendMessageToBot(message) {
     }
 
     const data = await response.json();
-    
-    // Handle the response structure from backend
-    let botMessage = '';
-    if (data.response && typeof data.response === 'object') {
-      // New format with structured response
-      const verdict = data.response.verdict || 'NONE';
-      const confidence = data.response.confidence_score || 0;
-      const agentResponse = data.response.agent_response || '';
-      const evidence = data.response.evidence_summary || '';
-      
-      // Format the message
-      if (verdict !== 'NONE') {
-        botMessage = `${agentResponse}\n\nVerdict: ${verdict}\nConfidence: ${confidence}%\n\nEvidence:\n${evidence}`;
-      } else {
-        botMessage = agentResponse;
-      }
-    } else if (typeof data.response === 'string') {
-      // Fallback for string response
-      botMessage = data.response;
-    } else {
-      botMessage = 'No response from AI.';
+    if (data.conversation_id) {
+      conversationId = data.conversation_id;
+      saveConversationHistory();
     }
     
     // Add bot response to chat
-    addMessageToChat('ai', botMessage);
+    addMessageToChat('ai', formatBotMessage(data));
     
   } catch (error) {
     console.error('Error:', error);
@@ -181,6 +368,7 @@ function showLoading(show) {
   loadingDiv.style.display = show ? 'flex' : 'none';
   sendMessageBtn.disabled = show;
   checkUrlBtn.disabled = show;
+  scanPageBtn.disabled = show;
 }
 
 // Show error
@@ -192,6 +380,7 @@ function showError(message) {
 function handleClearChat() {
   if (confirm('Are you sure you want to clear the chat history?')) {
     conversationHistory = [];
+    conversationId = null;
     chatContainer.innerHTML = `
       <div class="message ai-message">
         <div class="message-content">
@@ -212,12 +401,13 @@ function handleOpenFullApp(e) {
 
 // Save conversation history to chrome.storage
 function saveConversationHistory() {
-  chrome.storage.local.set({ conversationHistory: conversationHistory });
+  chrome.storage.local.set({ conversationHistory: conversationHistory, conversationId: conversationId });
 }
 
 // Load conversation history from chrome.storage
 function loadConversationHistory() {
-  chrome.storage.local.get(['conversationHistory'], (result) => {
+  chrome.storage.local.get(['conversationHistory', 'conversationId'], (result) => {
+    conversationId = result.conversationId || null;
     if (result.conversationHistory && result.conversationHistory.length > 0) {
       conversationHistory = result.conversationHistory;
       
@@ -5,6 +5,7 @@ import { t } from "../translations/translations";
 import { ToastContainer, toast, Bounce } from "react-toastify";
 import "react-toastify/dist/ReactToastify.css";
 import { useNavigate, replace } from "react-router-dom";
+import { uploadFile } from "../utils/resumableUpload";
 
 export default function CreatePost() {
   const [title, setTitle] = useState("");
@@ -77,6 +78,16 @@ export default function CreatePost() {
 
     const postTimestamp = Date.now();
 
+    // Send media as a resumable upload; fall back to inline base64 if that fails
+    let mediaUploadId = null;
+    if (mediaFile) {
+      try {
+        mediaUploadId = await uploadFile(mediaFile);
+      } catch (err) {
+        console.error("Resumable upload failed, sending media inline:", err);
+      }
+    }
+
     const newPost = {
       name: value.userName,
       email: value.email,
@@ -84,7 +95,8 @@ export default function CreatePost() {
       content,
       timestamp: postTimestamp,
       post_id: `uuidv4() + -${value.userName}`,
-      media: mediaPreview,
+      media: mediaUploadId ? null : mediaPreview,
+      media_upload_id: mediaUploadId,
       mediaType: mediaType,
     };
 
@@ -98,7 +110,11 @@ export default function CreatePost() {
       "http://localhost:5000/api/auth/savePost",
       {
         method: "POST",
-        headers: { "content-type": "application/json" },
+        headers: {
+          "content-type": "application/json",
+          // Attaching an upload requires being the user who uploaded it
+          "Authorization": `Bearer ${localStorage.getItem("token")}`,
+        },
         body: JSON.stringify({ ...newPost }),
       }
     );
@@ -14,6 +14,7 @@ import { LanguageContext } from '../context/context';
 import { ToastContainer, toast, Bounce } from 'react-toastify';
 import 'react-toastify/dist/ReactToastify.css';
 import ConfirmDialog from "./ConfirmDialog";
+import { translateTexts } from '../utils/translate';
 
 // Format numbers like 1K, 2M
 function formatNumber(num) {
@@ -55,6 +56,10 @@ const Post = ({
     likes = [],
     dislikes = [],
     media,
+    mediaFull,
+    mediaWebp,
+    mediaFullWebp,
+    poster,
     mediaType,
     targetLanguage = 'en',
     onDeleteSuccess,
@@ -90,6 +95,7 @@ const Post = ({
     const [comments, setComments] = useState([]);
     const [inputComment, setInputComment] = useState("");
     const [imageEnlarged, setImageEnlarged] = useState(false);
+    const [videoPlaying, setVideoPlaying] = useState(false);
 
     const [showConfirm, setShowConfirm] = useState(false);
 
@@ -113,27 +119,11 @@ const Post = ({
 
         setIsTranslating(true);
         try {
-            // Translate title
-            const titleRes = await fetch('http://localhost:5000/api/auth/translate', {
-                method: 'POST',
-                headers: { 'Content-Type': 'application/json' },
-                body: JSON.stringify({ text: title, target_lang: targetLanguage })
-            });
-            const titleData = await titleRes.json();
-
-            // Translate content
-            const contentRes = await fetch('http://localhost:5000/api/auth/translate', {
-                method: 'POST',
-                headers: { 'Content-Type': 'application/json' },
-                body: JSON.stringify({ text: content, target_lang: targetLanguage })
-            });
-            const contentData = await contentRes.json();
-
-            if (titleRes.ok && contentRes.ok) {
-                setTranslatedTitle(titleData.translated);
-                setTranslatedContent(contentData.translated);
-                setShowOriginal(false);
-            }
+            // Title and content go out in one batch, shared with the other posts on screen
+            const [titleTranslated, contentTranslated] = await translateTexts([title, content], targetLanguage);
+            setTranslatedTitle(titleTranslated);
+            setTranslatedContent(contentTranslated);
+            setShowOriginal(false);
         } catch (err) {
             // console.error('Translation error:', err);
             toast.error(`Translation error:', ${err}`, {
@@ -437,15 +427,19 @@ const Post = ({
             {media && mediaType === 'image' && (
                 <>
                     <div className="mb-4 rounded-xl overflow-hidden border border-gray-100 shadow-sm cursor-pointer" onClick={() => setImageEnlarged(true)}>
-                        <img
-                            src={media}
-                            alt="Post media"
-                            className="w-full max-h-[500px] object-cover hover:opacity-95 transition-opacity"
-                            onError={(e) => {
-                                console.error("Image failed to load for post:", post_id);
-                                e.target.style.display = 'none';
-                            }}
-                        />
+                        {/* The browser picks WebP when it can decode it, JPEG otherwise */}
+                        <picture>
+                            {mediaWebp && <source srcSet={mediaWebp} type="image/webp" />}
+                            <img
+                                src={media}
+                                alt="Post media"
+                                className="w-full max-h-[500px] object-cover hover:opacity-95 transition-opacity"
+                                onError={(e) => {
+                                    console.error("Image failed to load for post:", post_id);
+                                    e.target.style.display = 'none';
+                                }}
+                            />
+                        </picture>
                     </div>
 
                     {/* Enlarged Image Modal */}
@@ -460,26 +454,49 @@ const Post = ({
                             >
                                 ×
                             </button>
-                            <img
-                                src={media}
-                                alt="Enlarged post media"
-                                className="max-w-full max-h-full object-contain"
-                                onClick={(e) => e.stopPropagation()}
-                            />
+                            <picture>
+                                {mediaFullWebp && <source srcSet={mediaFullWebp} type="image/webp" />}
+                                <img
+                                    src={mediaFull || media}
+                                    alt="Enlarged post media"
+                                    className="max-w-full max-h-full object-contain"
+                                    onClick={(e) => e.stopPropagation()}
+                                />
+                            </picture>
                         </div>
                     )}
                 </>
             )}
             {media && mediaType === 'video' && (
                 <div className="mb-4 rounded-xl overflow-hidden border border-gray-100 shadow-sm">
-                    <video
-                        src={media}
-                        controls
-                        className="w-full max-h-[500px]"
-                        onError={(e) => {
-                            console.error("Video failed to load for post:", post_id);
-                        }}
-                    />
+                    {/* Feed shows the short preview clip; the full video loads only once played */}
+                    {videoPlaying || !mediaFull || mediaFull === media ? (
+                        <video
+                            src={mediaFull || media}
+                            poster={poster || undefined}
+                            controls
+                            autoPlay={videoPlaying}
+                            preload="metadata"
+                            className="w-full max-h-[500px]"
+                            onError={(e) => {
+                                console.error("Video failed to load for post:", post_id);
+                            }}
+                        />
+                    ) : (
+                        <video
+                            src={media}
+                            poster={poster || undefined}
+                            muted
+                            loop
+                            autoPlay
+                            playsInline
+                            className="w-full max-h-[500px] cursor-pointer"
+                            onClick={() => setVideoPlaying(true)}
+                            onError={(e) => {
+                                console.error("Video preview failed to load for post:", post_id);
+                            }}
+                        />
+                    )}
                 </div>
             )}
 
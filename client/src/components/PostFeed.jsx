@@ -129,6 +129,10 @@ return (
           likes={p.likes || []}  // default empty array
           dislikes={p.dislikes || []} // default empty array
           media={p.media}
+          mediaFull={p.mediaFull}
+          mediaWebp={p.mediaWebp}
+          mediaFullWebp={p.mediaFullWebp}
+          poster={p.poster}
           mediaType={p.mediaType}
           targetLanguage={targetLanguage}
           onDeleteSuccess={handleDeleteSuccess}
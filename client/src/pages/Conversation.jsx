@@ -10,6 +10,7 @@ export default function FactChecker() {
   const [isSpeaking, setIsSpeaking] = useState(false);
   const [loading, setLoading] = useState(false);
   const [copiedIndex, setCopiedIndex] = useState(null);
+  const [conversationId, setConversationId] = useState(null);
   const recognitionRef = useRef(null);
   const messagesEndRef = useRef(null);
 
@@ -86,16 +87,14 @@ export default function FactChecker() {
         headers: { 'Content-Type': 'application/json' },
         body: JSON.stringify({
           message: inputText,
-          conversation_history: messages.map((m) => ({
-            role: m.type === 'user' ? 'user' : 'assistant',
-            content: m.text,
-          })),
+          conversation_id: conversationId,
         }),
       });
 
       if (!response.ok) throw new Error('Failed to fetch from backend');
 
       const data = await response.json();
+      if (data.conversation_id) setConversationId(data.conversation_id);
       let parsedResponse = data.response;
 
       if (typeof parsedResponse === 'string') {
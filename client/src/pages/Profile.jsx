@@ -163,6 +163,10 @@ export default function Profile({ onLogout }) {
                   likes={post.likes || []}
                   dislikes={post.dislikes || []}
                   media={post.media}
+                  mediaFull={post.mediaFull}
+                  mediaWebp={post.mediaWebp}
+                  mediaFullWebp={post.mediaFullWebp}
+                  poster={post.poster}
                   mediaType={post.mediaType}
                   targetLanguage={language}
                   onDeleteSuccess={(deletedPostId) => {
@@ -0,0 +1,106 @@
+// Resumable chunked upload client for the backend /api/uploads protocol.
+// An interrupted upload of the same file resumes from the chunks the server
+// already has (the upload id is remembered in localStorage).
+
+const API_BASE = "http://localhost:5000";
+const MAX_RETRIES = 3;
+
+const authHeaders = () => ({
+  Authorization: `Bearer ${localStorage.getItem("token")}`,
+});
+
+const sha256Hex = async (buffer) => {
+  const digest = await crypto.subtle.digest("SHA-256", buffer);
+  return Array.from(new Uint8Array(digest))
+    .map((b) => b.toString(16).padStart(2, "0"))
+    .join("");
+};
+
+const resumeKey = (file) =>
+  `upload:${file.name}:${file.size}:${file.lastModified}`;
+
+const getSession = async (file) => {
+  const savedId = localStorage.getItem(resumeKey(file));
+  if (savedId) {
+    const res = await fetch(`${API_BASE}/api/uploads/${savedId}`, {
+      headers: authHeaders(),
+    });
+    if (res.ok) return res.json();
+    localStorage.removeItem(resumeKey(file));
+  }
+
+  const res = await fetch(`${API_BASE}/api/uploads`, {
+    method: "POST",
+    headers: { ...authHeaders(), "content-type": "application/json" },
+    body: JSON.stringify({
+      filename: file.name,
+      content_type: file.type,
+      total_size: file.size,
+    }),
+  });
+  const session = await res.json();
+  if (!res.ok) throw new Error(session.error || "Upload init failed");
+  localStorage.setItem(resumeKey(file), session.upload_id);
+  return session;
+};
+
+const putChunk = async (uploadId, index, blob) => {
+  const buffer = await blob.arrayBuffer();
+  const checksum = await sha256Hex(buffer);
+  for (let attempt = 0; ; attempt++) {
+    let res = null;
+    try {
+      res = await fetch(`${API_BASE}/api/uploads/${uploadId}/chunks/${index}`, {
+        method: "PUT",
+        headers: {
+          ...authHeaders(),
+          "content-type": "application/octet-stream",
+          "X-Chunk-SHA256": checksum,
+        },
+        body: buffer,
+      });
+    } catch (err) {
+      // Network error: retry below
+    }
+    if (res && res.ok) return;
+
+    // Retry network errors, server errors and corrupted chunks; give up on other rejections
+    const retryable = !res || res.status >= 500 || res.status === 422;
+    if (!retryable || attempt >= MAX_RETRIES) {
+      const result = res ? await res.json().catch(() => ({})) : {};
+      throw new Error(result.error || `Chunk ${index} failed`);
+    }
+    await new Promise((r) => setTimeout(r, 500 * 2 ** attempt));
+  }
+};
+
+// Upload a File; resolves to the finalized upload id
+export async function uploadFile(file, onProgress) {
+  const session = await getSession(file);
+  const uploadId = session.upload_id;
+
+  if (!session.finalized) {
+    const missing = session.missing_chunks;
+    let done = session.total_chunks - missing.length;
+    for (const index of missing) {
+      const start = index * session.chunk_size;
+      await putChunk(
+        uploadId,
+        index,
+        file.slice(start, start + session.chunk_size)
+      );
+      done += 1;
+      if (onProgress) onProgress(done / session.total_chunks);
+    }
+
+    const res = await fetch(`${API_BASE}/api/uploads/${uploadId}/finalize`, {
+      method: "POST",
+      headers: authHeaders(),
+    });
+    const result = await res.json();
+    if (!res.ok) throw new Error(result.error || "Upload finalize failed");
+  }
+
+  localStorage.removeItem(resumeKey(file));
+  return uploadId;
+}
@@ -0,0 +1,61 @@
+// Batched translation client for the backend /api/auth/translate/batch route.
+// Calls made within the same short window (e.g. every post of a feed
+// rendering at once) are sent as one request per target language, and
+// results are remembered for the session.
+
+const API_BASE = "http://localhost:5000";
+const FLUSH_DELAY_MS = 25;
+const MAX_BATCH = 200;
+
+const memo = new Map(); // `${target}\u0000${text}` -> translated text
+const queues = new Map(); // target -> { items: [{ text, resolve, reject }], timer }
+
+const flush = async (target) => {
+  const queue = queues.get(target);
+  queues.delete(target);
+  if (!queue) return;
+
+  for (let start = 0; start < queue.items.length; start += MAX_BATCH) {
+    const items = queue.items.slice(start, start + MAX_BATCH);
+    const texts = [...new Set(items.map((item) => item.text))];
+    try {
+      const res = await fetch(`${API_BASE}/api/auth/translate/batch`, {
+        method: "POST",
+        headers: { "Content-Type": "application/json" },
+        body: JSON.stringify({ texts, target_lang: target }),
+      });
+      const data = await res.json();
+      if (!res.ok) throw new Error(data.message || "Translation failed");
+
+      const byText = new Map(texts.map((text, i) => [text, data.translations[i]]));
+      // Failed texts come back unchanged; don't remember those
+      const failed = data.details?.failed > 0;
+      items.forEach(({ text, resolve }) => {
+        const translated = byText.get(text) ?? text;
+        if (!failed || translated !== text) memo.set(`${target}\u0000${text}`, translated);
+        resolve(translated);
+      });
+    } catch (err) {
+      items.forEach(({ reject }) => reject(err));
+    }
+  }
+};
+
+// Translate texts into target; resolves to an array aligned with texts.
+export const translateTexts = (texts, target) =>
+  Promise.all(
+    texts.map((text) => {
+      if (!text || !text.trim()) return Promise.resolve(text);
+      const known = memo.get(`${target}\u0000${text}`);
+      if (known !== undefined) return Promise.resolve(known);
+
+      return new Promise((resolve, reject) => {
+        let queue = queues.get(target);
+        if (!queue) {
+          queue = { items: [], timer: setTimeout(() => flush(target), FLUSH_DELAY_MS) };
+          queues.set(target, queue);
+        }
+        queue.items.push({ text, resolve, reject });
+      });
+    })
+  );